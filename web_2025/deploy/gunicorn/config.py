@@ -1,12 +1,25 @@
-import multiprocessing
+import os
+import sys
+
+# Конфигурация читается до загрузки приложения: каталог проекта нужен в sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from web_2025.pool_sizing import gunicorn_threads, gunicorn_workers  # noqa: E402
 
 # Server socket
 bind = 'unix:/var/www/fefu_lab/web_2025/gunicorn.sock'
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
+# Число воркеров и потоков (WEB_CONCURRENCY, GUNICORN_THREADS) читает и
+# settings_production, чтобы рассчитать пул соединений с БД каждого процесса
+workers = gunicorn_workers('sync')
+threads = gunicorn_threads()
 worker_class = 'sync'
+raw_env = [
+    f'WEB_CONCURRENCY={workers}',
+    f'GUNICORN_THREADS={threads}',
+]
 worker_connections = 1000
 timeout = 300
 keepalive = 2
@@ -33,7 +46,19 @@ tmp_upload_dir = None
 
 # Server hooks
 def on_starting(server):
+    from fefu_lab import metrics
+    # Каталог метрик общий для процессов: счетчики прошлого запуска не нужны
+    metrics.reset_directory()
     server.log.info("Starting FEFU Lab Gunicorn server...")
 
 def on_exit(server):
     server.log.info("Shutting down FEFU Lab Gunicorn server...")
+
+def post_fork(server, worker):
+    from fefu_lab import metrics
+    metrics.worker_started()
+
+def child_exit(server, worker):
+    from fefu_lab import metrics
+    # Счетчики завершившегося воркера переносятся в общий архив метрик
+    metrics.mark_process_dead(worker.pid)
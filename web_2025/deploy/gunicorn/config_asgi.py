@@ -0,0 +1,68 @@
+import os
+import sys
+
+# Конфигурация читается до загрузки приложения: каталог проекта нужен в sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from web_2025.pool_sizing import gunicorn_workers  # noqa: E402
+
+# ASGI-профиль: тот же gunicorn, но с uvicorn-воркерами и асинхронными публичными
+# страницами (fefu_lab/async_views.py). Запуск:
+#   gunicorn -c deploy/gunicorn/config_asgi.py web_2025.asgi:application
+
+# Server socket
+bind = 'unix:/var/www/fefu_lab/web_2025/gunicorn.sock'
+backlog = 2048
+
+# Worker processes
+# Воркер держит много соединений в одном цикле событий: процессов нужно по
+# числу ядер, а не 2 * ядра + 1, как синхронным воркерам
+workers = gunicorn_workers('asgi')
+worker_class = 'uvicorn_worker.UvicornWorker'
+timeout = 300
+keepalive = 5
+# Перезапуск воркеров ограничивает рост памяти долгоживущих процессов
+max_requests = 10000
+max_requests_jitter = 1000
+
+raw_env = [
+    'ASYNC_PUBLIC_VIEWS=1',
+    # Пул соединений в settings_production рассчитывается под ASGI-воркеры
+    'GUNICORN_PROFILE=asgi',
+    f'WEB_CONCURRENCY={workers}',
+]
+
+# Logging
+accesslog = '/var/log/gunicorn/access.log'
+errorlog = '/var/log/gunicorn/error.log'
+loglevel = 'info'
+
+# Process naming
+proc_name = 'fefu_lab_gunicorn_asgi'
+
+# Server mechanics
+daemon = False
+pidfile = '/var/run/gunicorn/fefu_lab.pid'
+umask = 0
+user = 'www-data'
+group = 'www-data'
+tmp_upload_dir = None
+
+# Server hooks
+def on_starting(server):
+    from fefu_lab import metrics
+    # Каталог метрик общий для процессов: счетчики прошлого запуска не нужны
+    metrics.reset_directory()
+    server.log.info("Starting FEFU Lab Gunicorn server (ASGI, uvicorn workers)...")
+
+def on_exit(server):
+    server.log.info("Shutting down FEFU Lab Gunicorn server...")
+
+def post_fork(server, worker):
+    from fefu_lab import metrics
+    metrics.worker_started()
+
+def child_exit(server, worker):
+    from fefu_lab import metrics
+    # Счетчики завершившегося воркера переносятся в общий архив метрик
+    metrics.mark_process_dead(worker.pid)
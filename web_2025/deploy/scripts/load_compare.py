@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Сравнение синхронного (WSGI) и асинхронного (ASGI) развертывания под нагрузкой.
+
+Для каждой цели и каждого уровня параллельности держит N одновременных
+соединений (HTTP/1.1, keep-alive, если сервер его поддерживает), которые по
+кругу запрашивают --path, и считает запросы в секунду, p50/p95 задержки и
+память: RSS процесса gunicorn и всех его воркеров (/proc, только Linux) в
+простое и пиковая под нагрузкой. Память на соединение = (пик - простой) / N.
+
+Пример:
+    python deploy/scripts/load_compare.py \\
+        --target sync http://127.0.0.1:8001 /tmp/sync.pid \\
+        --target asgi http://127.0.0.1:8002 /tmp/asgi.pid \\
+        --path / --path /courses/ --concurrency 10 --concurrency 100 --duration 15
+
+Без зависимостей, кроме стандартной библиотеки.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] if ordered else 0.0
+
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def tree_rss_kb(pid):
+    """RSS процесса и всех потомков в КБ."""
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+        stack.extend(_children(current))
+    return total
+
+
+async def _read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def _client(host, port, paths, deadline, latencies, errors):
+    reader = writer = None
+    index = 0
+    while time.perf_counter() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            started = time.perf_counter()
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n'.encode())
+            await writer.drain()
+            status, keep_alive = await _read_response(reader)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status >= 400:
+                errors.append(status)
+        except (OSError, asyncio.IncompleteReadError, ValueError) as exc:
+            errors.append(type(exc).__name__)
+            keep_alive = False
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _sample_memory(pid, stop, peak):
+    while not stop.is_set():
+        peak[0] = max(peak[0], tree_rss_kb(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), 0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_level(url, pid, paths, concurrency, duration):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+
+    idle_kb = tree_rss_kb(pid) if pid else 0
+    latencies, errors, peak = [], [], [idle_kb]
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(_sample_memory(pid, stop, peak)) if pid else None
+
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(
+        _client(host, port, paths, deadline, latencies, errors) for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    if sampler:
+        await sampler
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'idle_rss_mb': round(idle_kb / 1024, 1),
+        'peak_rss_mb': round(peak[0] / 1024, 1),
+        'kb_per_connection': round((peak[0] - idle_kb) / concurrency, 1) if pid else None,
+    }
+
+
+def read_pid(pidfile):
+    if not pidfile or pidfile == '-':
+        return None
+    with open(pidfile) as f:
+        return int(f.read().strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--target', nargs=3, action='append', required=True, metavar=('NAME', 'URL', 'PIDFILE'),
+        help='Имя, адрес и pid-файл gunicorn (- если память не замерять)',
+    )
+    parser.add_argument('--path', action='append', dest='paths', help='Пути по кругу (по умолчанию /)')
+    parser.add_argument('--concurrency', action='append', type=int, help='Одновременных соединений (по умолчанию 10, 50, 200)')
+    parser.add_argument('--duration', type=float, default=10.0, help='Секунд на уровень')
+    parser.add_argument('--warmup', type=float, default=2.0, help='Прогрев перед замером, секунд')
+    parser.add_argument('--json', help='Сохранить результаты в файл')
+    args = parser.parse_args()
+    paths = args.paths or ['/']
+    levels = args.concurrency or [10, 50, 200]
+
+    results = []
+    for name, url, pidfile in args.target:
+        pid = read_pid(pidfile)
+        asyncio.run(run_level(url, pid, paths, min(levels), args.warmup))
+        for level in levels:
+            row = asyncio.run(run_level(url, pid, paths, level, args.duration))
+            row['target'] = name
+            results.append(row)
+
+    header = f'{"цель":<8} {"соедин.":>7} {"запр/с":>8} {"p50 мс":>8} {"p95 мс":>8} {"ошибок":>7} {"RSS МБ":>8} {"КБ/соед.":>9}'
+    print(header)
+    print('-' * len(header))
+    for row in results:
+        per_connection = '-' if row['kb_per_connection'] is None else f'{row["kb_per_connection"]:.1f}'
+        print(
+            f'{row["target"]:<8} {row["concurrency"]:>7} {row["rps"]:>8.1f} {row["p50_ms"]:>8.1f} '
+            f'{row["p95_ms"]:>8.1f} {row["errors"]:>7} {row["peak_rss_mb"]:>8.1f} {per_connection:>9}'
+        )
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'paths': paths, 'duration': args.duration, 'results': results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import UserProfile, Student, Instructor, Course, Enrollment
+from django.utils import timezone
+from .models import UserProfile, Student, Instructor, Course, Enrollment, Waitlist, Feedback, Job
+from .search import filter_courses
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -37,12 +39,18 @@ class InstructorAdmin(admin.ModelAdmin):
 
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
-    list_display = ['title', 'instructor', 'level', 'duration', 'price', 'is_active', 'created_at']
+    list_display = ['title', 'instructor', 'level', 'duration', 'price', 'active_enrollments_count', 'is_active', 'created_at']
     list_filter = ['is_active', 'level', 'instructor']
     search_fields = ['title', 'description']
     list_editable = ['is_active', 'price']
     prepopulated_fields = {'slug': ['title']}
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['active_enrollments_count', 'created_at', 'updated_at']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск идет по полнотекстовому индексу вместо icontains по description
+        if not search_term.strip():
+            return queryset, False
+        return filter_courses(queryset, search_term), False
 
 @admin.register(Enrollment)
 class EnrollmentAdmin(admin.ModelAdmin):
@@ -51,3 +59,27 @@ class EnrollmentAdmin(admin.ModelAdmin):
     search_fields = ['student__user__first_name', 'student__user__last_name', 'course__title']
     list_editable = ['status', 'grade']
     readonly_fields = ['enrolled_at']
+
+@admin.register(Waitlist)
+class WaitlistAdmin(admin.ModelAdmin):
+    list_display = ['student', 'course', 'created_at']
+    list_filter = ['course']
+    search_fields = ['student__user__first_name', 'student__user__last_name', 'course__title']
+    readonly_fields = ['created_at']
+
+@admin.register(Feedback)
+class FeedbackAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'name', 'email', 'created_at']
+    search_fields = ['name', 'email', 'subject']
+    readonly_fields = ['name', 'email', 'subject', 'message', 'created_at']
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['task', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'finished_at']
+    list_filter = ['status', 'task']
+    readonly_fields = ['created_at', 'finished_at', 'locked_by', 'locked_at', 'last_error']
+    actions = ['retry']
+
+    @admin.action(description='Повторить выбранные задачи')
+    def retry(self, request, queryset):
+        queryset.exclude(status='RUNNING').update(status='QUEUED', attempts=0, run_at=timezone.now(), last_error='')
@@ -0,0 +1,256 @@
+"""
+Read-only JSON API для курсов, преподавателей, студентов и записей.
+
+Данные читаются через .values() с нужными полями, JOIN-ы строятся из путей
+запрошенных полей (?fields=), вложенные списки догружаются одним запросом на
+поле. Поэтому число запросов на ответ не зависит от размера страницы:
+1 на страницу + по 1 на каждое запрошенное списочное поле.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+from .models import Course, Enrollment, Instructor, Student
+from .pagination import InvalidCursor, KeysetPaginator
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson необязателен
+    orjson = None
+
+DEFAULT_LIMIT = 25
+MAX_LIMIT = 100
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':')).encode(data).encode()
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Related:
+    """Списочное поле: строки model, у которых fk указывает на объект ресурса."""
+
+    def __init__(self, model, fk, fields, queryset_filter=None):
+        self.model = model
+        self.fk = fk
+        self.fields = fields
+        self.queryset_filter = queryset_filter or {}
+
+    def fetch(self, ids):
+        rows = (
+            self.model.objects.filter(**{f'{self.fk}__in': ids}, **self.queryset_filter)
+            .order_by(self.fk, 'pk')
+            .values(self.fk, *self.fields.values())
+        )
+        grouped = defaultdict(list)
+        for row in rows:
+            grouped[row[self.fk]].append({name: row[path] for name, path in self.fields.items()})
+        return grouped
+
+
+class Resource:
+    model = None
+    lookup = 'pk'
+    ordering = ()
+    tiebreak = 'pk'
+    fields = {}
+    default_fields = ()
+    related = {}
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
+    def parse_fields(self, request):
+        raw = request.GET.get('fields')
+        if not raw:
+            return list(self.default_fields)
+        requested = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in requested if name not in self.fields and name not in self.related]
+        if unknown:
+            raise ApiError(f'Неизвестные поля: {", ".join(unknown)}')
+        return requested
+
+    def build(self, rows, requested):
+        scalar = [name for name in requested if name in self.fields]
+        many = [name for name in requested if name in self.related]
+        items = [{name: row[self.fields[name]] for name in scalar} for row in rows]
+        if many and rows:
+            ids = [row['pk'] for row in rows]
+            for name in many:
+                grouped = self.related[name].fetch(ids)
+                for item, row in zip(items, rows):
+                    item[name] = grouped.get(row['pk'], [])
+        return items
+
+    def values(self, queryset, requested):
+        paths = {self.fields[name] for name in requested if name in self.fields}
+        return queryset.values('pk', *paths, *self.ordering, self.tiebreak)
+
+    def list(self, request):
+        requested = self.parse_fields(request)
+        try:
+            limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+        except ValueError:
+            raise ApiError('limit должен быть числом')
+        if limit < 1:
+            raise ApiError('limit должен быть положительным')
+
+        paginator = KeysetPaginator(
+            self.values(self.get_queryset(), requested), self.ordering, limit, self.tiebreak,
+        )
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            raise ApiError('Неверный курсор')
+        return {
+            'results': self.build(page.object_list, requested),
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        }
+
+    def detail(self, request, key):
+        requested = self.parse_fields(request)
+        rows = list(self.values(self.get_queryset().filter(**{self.lookup: key}), requested)[:1])
+        if not rows:
+            raise ApiError('Объект не найден', status=404)
+        return self.build(rows, requested)[0]
+
+
+class CourseResource(Resource):
+    model = Course
+    lookup = 'slug'
+    ordering = ('title',)
+    fields = {
+        'id': 'pk',
+        'slug': 'slug',
+        'title': 'title',
+        'description': 'description',
+        'duration': 'duration',
+        'level': 'level',
+        'max_students': 'max_students',
+        'enrolled': 'active_enrollments_count',
+        'price': 'price',
+        'instructor_id': 'instructor_id',
+        'instructor_first_name': 'instructor__user__first_name',
+        'instructor_last_name': 'instructor__user__last_name',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    }
+    default_fields = ('id', 'slug', 'title', 'level', 'duration', 'price', 'max_students', 'enrolled', 'instructor_id')
+    related = {
+        'enrollments': Related(Enrollment, 'course_id', {
+            'id': 'pk', 'student_id': 'student_id', 'status': 'status',
+        }),
+    }
+
+    def get_queryset(self):
+        return Course.objects.filter(is_active=True)
+
+
+class InstructorResource(Resource):
+    model = Instructor
+    ordering = ('user__last_name', 'user__first_name')
+    tiebreak = 'user__id'
+    fields = {
+        'id': 'pk',
+        'first_name': 'user__first_name',
+        'last_name': 'user__last_name',
+        'email': 'user__email',
+        'specialization': 'specialization',
+        'degree': 'degree',
+        'bio': 'bio',
+        'office': 'office',
+    }
+    default_fields = ('id', 'first_name', 'last_name', 'specialization', 'degree')
+    related = {
+        'courses': Related(Course, 'instructor_id', {
+            'id': 'pk', 'slug': 'slug', 'title': 'title',
+        }, {'is_active': True}),
+    }
+
+    def get_queryset(self):
+        return Instructor.objects.filter(is_active=True, user__isnull=False)
+
+
+class StudentResource(Resource):
+    model = Student
+    ordering = ('user__last_name', 'user__first_name')
+    tiebreak = 'user__id'
+    fields = {
+        'id': 'pk',
+        'first_name': 'user__first_name',
+        'last_name': 'user__last_name',
+        'email': 'user__email',
+        'faculty': 'faculty',
+        'birth_date': 'birth_date',
+    }
+    default_fields = ('id', 'first_name', 'last_name', 'faculty')
+    related = {
+        'enrollments': Related(Enrollment, 'student_id', {
+            'id': 'pk', 'course': 'course__slug', 'status': 'status', 'grade': 'grade',
+        }),
+    }
+
+    def get_queryset(self):
+        return Student.objects.filter(is_active=True, user__isnull=False)
+
+
+class EnrollmentResource(Resource):
+    model = Enrollment
+    fields = {
+        'id': 'pk',
+        'student_id': 'student_id',
+        'student_first_name': 'student__user__first_name',
+        'student_last_name': 'student__user__last_name',
+        'course': 'course__slug',
+        'course_title': 'course__title',
+        'status': 'status',
+        'enrolled_at': 'enrolled_at',
+        'completed_at': 'completed_at',
+        'grade': 'grade',
+    }
+    default_fields = ('id', 'student_id', 'course', 'status', 'enrolled_at', 'grade')
+
+
+RESOURCES = {
+    'courses': CourseResource(),
+    'instructors': InstructorResource(),
+    'students': StudentResource(),
+    'enrollments': EnrollmentResource(),
+}
+
+
+@require_GET
+def resource_list(request, resource):
+    try:
+        return json_response(RESOURCES[resource].list(request))
+    except ApiError as e:
+        return json_response({'error': str(e)}, status=e.status)
+
+
+@require_GET
+def resource_detail(request, resource, key):
+    try:
+        return json_response(RESOURCES[resource].detail(request, key))
+    except ApiError as e:
+        return json_response({'error': str(e)}, status=e.status)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class FefuLabConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'fefu_lab'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import metrics, signals, tasks  # noqa: F401
+        connection_created.connect(metrics.connection_created, dispatch_uid='fefu_lab.metrics')
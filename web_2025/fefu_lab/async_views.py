@@ -0,0 +1,120 @@
+"""
+Асинхронные версии публичных страниц для запуска под ASGI (gunicorn с
+uvicorn-воркерами, deploy/gunicorn/config_asgi.py).
+
+Подключаются в urls.py вместо синхронных при ASYNC_PUBLIC_VIEWS = True:
+адреса, шаблоны, keyset-пагинация и ETag те же. Все, что нужно шаблону,
+выбирается заранее (select_related, списки через async for): ленивый запрос
+во время отрисовки в асинхронном контексте закончился бы
+SynchronousOnlyOperation.
+
+Независимые выборки запускаются вместе через asyncio.gather. Асинхронный ORM
+Django выполняет SQL в потоке запроса (sync_to_async(thread_sensitive=True)),
+так что запросы к одной БД в пределах запроса все равно идут по очереди;
+выигрыш в том, что цикл событий воркера не блокируется на ожидании и один
+процесс обслуживает много одновременных соединений.
+"""
+import asyncio
+
+from django.http import Http404
+from django.shortcuts import aget_object_or_404, render
+from django.utils.decorators import method_decorator
+from django.views import View
+
+from .conditional import conditional_page
+from .models import Course, Enrollment, SiteStats, Student
+from .pagination import InvalidCursor, KeysetPaginator
+from .views import course_detail_validator, student_detail_validator
+
+
+async def _fetch(queryset):
+    return [obj async for obj in queryset]
+
+
+async def _current_user(request):
+    # Контекстный процессор auth и base.html читают request.user; подставляем
+    # загруженного асинхронно пользователя, чтобы шаблон не шел в БД синхронно
+    request.user = await request.auser()
+    return request.user
+
+
+# ---------- Главная страница ----------
+async def home_page(request):
+    user, stats, recent_courses = await asyncio.gather(
+        _current_user(request),
+        SiteStats.aload(),
+        _fetch(Course.objects.filter(is_active=True).select_related('instructor__user').order_by('-created_at')[:3]),
+    )
+    context = {
+        'total_students': stats.active_students,
+        'total_courses': stats.active_courses,
+        'total_instructors': stats.active_instructors,
+        'recent_courses': recent_courses,
+    }
+    if user.is_authenticated:
+        # Профиль уже загружен EmailBackend.get_user вместе с пользователем
+        context['user_profile'] = getattr(user, 'profile', None)
+    return render(request, 'fefu_lab/home.html', context)
+
+
+# ---------- Детальная страница студента ----------
+@conditional_page(student_detail_validator)
+async def student_detail(request, pk):
+    student, enrollments, _ = await asyncio.gather(
+        aget_object_or_404(Student.objects.select_related('user'), pk=pk),
+        _fetch(Enrollment.objects.filter(student_id=pk).select_related('course')),
+        _current_user(request),
+    )
+    return render(request, 'fefu_lab/student_detail.html', {
+        'student': student,
+        'enrollments': enrollments,
+    })
+
+
+# ---------- Список курсов ----------
+class CourseListView(View):
+    template_name = 'fefu_lab/course_list.html'
+    paginate_by = 24
+    cursor_ordering = ('title',)
+    cursor_query_param = 'cursor'
+
+    def get_queryset(self):
+        return Course.objects.filter(is_active=True).select_related('instructor__user')
+
+    async def get(self, request):
+        paginator = KeysetPaginator(self.get_queryset(), self.cursor_ordering, self.paginate_by)
+        try:
+            page, _ = await asyncio.gather(
+                paginator.apage(request.GET.get(self.cursor_query_param)),
+                _current_user(request),
+            )
+        except InvalidCursor:
+            raise Http404('Неверный курсор страницы')
+        return render(request, self.template_name, {
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'object_list': page.object_list,
+            'courses': page.object_list,
+            'view': self,
+        })
+
+
+# ---------- Детальная страница курса ----------
+@method_decorator(conditional_page(course_detail_validator), name='get')
+class CourseDetailView(View):
+    template_name = 'fefu_lab/course_detail.html'
+
+    async def get(self, request, slug):
+        course, enrollments, _ = await asyncio.gather(
+            aget_object_or_404(Course.objects.select_related('instructor__user'), slug=slug),
+            _fetch(Enrollment.objects.filter(course__slug=slug).select_related('student__user')),
+            _current_user(request),
+        )
+        return render(request, self.template_name, {
+            'object': course,
+            'course': course,
+            'enrollments': enrollments,
+            'available_slots': course.max_students - course.enrolled_students_count,
+            'view': self,
+        })
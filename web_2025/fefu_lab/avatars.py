@@ -0,0 +1,168 @@
+"""
+Обработка аватаров: квадратные миниатюры UserProfile.AVATAR_SIZES в WebP.
+
+Оригинал декодируется один раз (JPEG — сразу в уменьшенном виде через
+draft), поворачивается по EXIF, обрезается до квадрата и уменьшается
+последовательно от большего размера к меньшему. Метаданные (EXIF с
+координатами, ICC, XMP) в миниатюры не попадают. Имена файлов содержат хэш
+содержимого, поэтому nginx может отдавать их с Cache-Control: immutable.
+
+Обработка запускается после фиксации транзакции, сохранившей новый аватар
+(сигнал в signals.py), в пуле AVATAR_WORKERS потоков; при AVATAR_WORKERS = 0
+— сразу в текущем потоке. Имена готовых миниатюр записываются в
+UserProfile.avatar_variants, и шаблоны строят URL без запросов к БД.
+Миниатюры прежних версий аватара удаляются.
+"""
+import hashlib
+import logging
+import os
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'avatars/variants'
+FORMAT, EXTENSION = 'WEBP', 'webp'
+QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variants_dir(profile_id):
+    return f'{VARIANTS_DIR}/{profile_id}'
+
+
+def _storage():
+    return UserProfile._meta.get_field('avatar').storage
+
+
+# ---------- Миниатюры ----------
+def _decode(data, size):
+    image = Image.open(BytesIO(data))
+    # JPEG декодируется сразу с уменьшением в 2–8 раз, если оригинал намного больше
+    image.draft('RGB', (size * 2, size * 2))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    return image
+
+
+def render(data, sizes=None):
+    """{размер: байты WebP} квадратных миниатюр без метаданных."""
+    sizes = sorted(sizes or UserProfile.AVATAR_SIZES, reverse=True)
+    image = _decode(data, sizes[0])
+    side = min(image.size)
+    image = ImageOps.fit(image, (side, side))
+
+    result = {}
+    for size in sizes:
+        if image.width > size:
+            image = image.resize((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        # Новое изображение без info: exif, icc_profile и xmp не сохраняются
+        clean = Image.frombytes(image.mode, image.size, image.tobytes())
+        buffer = BytesIO()
+        clean.save(buffer, FORMAT, quality=QUALITY, method=4)
+        result[size] = buffer.getvalue()
+    return result
+
+
+def generate(profile_id, name):
+    """Записывает миниатюры оригинала name; возвращает {размер: имя файла}."""
+    storage = _storage()
+    with storage.open(name, 'rb') as f:
+        data = f.read()
+    digest = hashlib.blake2b(data, digest_size=8).hexdigest()
+    variants = {}
+    for size, content in render(data).items():
+        # Хранилище само добавит суффикс, если такой файл уже есть
+        target = f'{variants_dir(profile_id)}/{digest}_{size}.{EXTENSION}'
+        variants[str(size)] = storage.save(target, ContentFile(content))
+    return variants
+
+
+def cleanup(profile_id, keep=()):
+    """Удаляет миниатюры профиля, кроме keep."""
+    storage = _storage()
+    directory = variants_dir(profile_id)
+    try:
+        _, files = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for filename in files:
+        name = posixpath.join(directory, filename)
+        if name not in keep:
+            storage.delete(name)
+
+
+def process(profile_id, name):
+    """Строит миниатюры текущего аватара и удаляет устаревшие."""
+    variants = {}
+    if name:
+        try:
+            variants = generate(profile_id, name)
+        except (OSError, Image.DecompressionBombError):
+            logger.exception('Не удалось обработать аватар %s профиля %s', name, profile_id)
+
+    current = Q(avatar=name) if name else Q(avatar='') | Q(avatar__isnull=True)
+    updated = UserProfile.objects.filter(current, pk=profile_id).update(avatar_variants=variants or None)
+    if updated:
+        cleanup(profile_id, keep=set(variants.values()))
+    else:
+        # Пока шла обработка, аватар сменили еще раз: эти миниатюры не нужны
+        storage = _storage()
+        for stale in variants.values():
+            storage.delete(stale)
+    return variants
+
+
+# ---------- Пул обработки ----------
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.AVATAR_WORKERS, thread_name_prefix='fefu_lab_avatars',
+            )
+    return _executor
+
+
+def _after_fork():
+    global _executor, _executor_lock
+    _executor, _executor_lock = None, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _run(profile_id, name):
+    close_old_connections()
+    try:
+        process(profile_id, name)
+    except Exception:
+        logger.exception('Ошибка обработки аватара профиля %s', profile_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(profile):
+    """Ставит обработку аватара профиля в очередь после фиксации транзакции."""
+    profile_id, name = profile.pk, profile.avatar.name or ''
+
+    def submit():
+        if getattr(settings, 'AVATAR_WORKERS', 0):
+            _pool().submit(_run, profile_id, name)
+        else:
+            process(profile_id, name)
+
+    transaction.on_commit(submit)
@@ -1,20 +1,65 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q, Value
+from django.db.models.functions import Upper
+
+
+def users_by_email(email):
+    """
+    Поиск пользователей по email без учета регистра через индекс по UPPER(email)
+    (см. миграцию 0009). email__iexact на SQLite превращается в LIKE и индекс не использует.
+    """
+    return User.objects.alias(email_upper=Upper('email')).filter(email_upper=Upper(Value(email)))
+
 
 class EmailBackend(ModelBackend):
+    """
+    Вход по email или имени пользователя.
+
+    На каждую попытку — один индексированный запрос и ровно один хэш пароля
+    (для несуществующих пользователей — холостой, как в ModelBackend). Неудачная
+    попытка останавливает цепочку AUTHENTICATION_BACKENDS, чтобы ModelBackend
+    не повторял поиск и хэширование.
+    """
+
     def authenticate(self, request, username=None, password=None, **kwargs):
-        try:
-            user = User.objects.get(
-                Q(email=username) | Q(username=username)
-            )
-            if user.check_password(password):
-                return user
-        except User.DoesNotExist:
+        if username is None or password is None:
             return None
 
+        user = self._find_user(username)
+        if user is None:
+            # Выравниваем время ответа для неизвестных логинов
+            User().set_password(password)
+            raise PermissionDenied
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        raise PermissionDenied
+
+    def _find_user(self, username):
+        if '@' not in username:
+            return User.objects.filter(username=username).first()
+
+        # Имя пользователя тоже может содержать '@': оба условия в одном запросе по двум индексам
+        candidates = list(
+            User.objects.alias(email_upper=Upper('email'))
+            .filter(Q(email_upper=Upper(Value(username))) | Q(username=username))[:3]
+        )
+        for user in candidates:
+            if user.username == username:
+                return user
+        # Несколько аккаунтов с одним email — вход только по имени пользователя
+        return candidates[0] if len(candidates) == 1 else None
+
+    def _users(self, user_id):
+        # Профили нужны почти каждой странице (роль, меню, личный кабинет) — грузим их тем же запросом
+        return User.objects.select_related('profile', 'student_profile', 'instructor_profile').filter(pk=user_id)
+
     def get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            return None
+        user = self._users(user_id).first()
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        # ModelBackend.aget_user не вызывает get_user: без переопределения request.auser() терял бы профили
+        user = await self._users(user_id).afirst()
+        return user if user is not None and self.user_can_authenticate(user) else None
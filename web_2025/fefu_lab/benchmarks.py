@@ -0,0 +1,214 @@
+"""
+Замеры страниц fefu_lab через тестовый клиент Django.
+
+Каждый маршрут из fefu_lab/urls.py прогоняется от имени анонима и каждой
+роли. Для пары (маршрут, роль) считаются p50/p95/p99 времени ответа, число
+SQL-запросов (максимум по итерациям) и время SQL (медиана). Результаты
+сравниваются с бюджетами из benchmarks/budgets.json.
+
+Используется командой benchmark_views и тестами в tests.py.
+"""
+import json
+import math
+import statistics
+import time
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.urls import URLPattern, URLResolver
+
+from . import urls as fefu_urls
+from .instrumentation import QueryRecorder
+from .models import Course, Enrollment, UserProfile
+from .pagination import encode_cursor
+
+ROLES = ('anonymous', 'student', 'teacher', 'admin')
+USER_BACKEND = 'fefu_lab.backends.EmailBackend'
+
+
+class BenchmarkContext:
+    """Пользователи ролей и объекты, на которые указывают маршруты с параметрами."""
+
+    def __init__(self, users, student, instructor, course, enrollment):
+        self.users = users
+        self.student = student
+        self.instructor = instructor
+        self.course = course
+        self.enrollment = enrollment
+
+
+def build_dataset(students=2000, courses=50, density=3.0, seed='bench'):
+    """Генерирует данные через seed_data в текущей транзакции и выбирает объекты для маршрутов."""
+    call_command(
+        'seed_data', students=students, courses=courses, enrollment_density=density,
+        seed=seed, processes=1, clear=True, stdout=StringIO(),
+    )
+    # Самый популярный курс (распределение Ципфа) — худший случай для детальной страницы
+    course = Course.objects.select_related('instructor__user').order_by('-active_enrollments_count', 'pk').first()
+    instructor = course.instructor
+    student_user = User.objects.select_related('student_profile').get(username='seed_student0000000')
+    student = student_user.student_profile
+    enrollment = Enrollment.objects.filter(student=student).order_by('pk').first()
+
+    admin = User.objects.create_user('bench_admin', email='bench.admin@fefu.ru', is_staff=True)
+    UserProfile.objects.create(user=admin, role='ADMIN')
+
+    users = {
+        'anonymous': None,
+        'student': student_user,
+        'teacher': instructor.user,
+        'admin': admin,
+    }
+    return BenchmarkContext(users, student, instructor, course, enrollment)
+
+
+def _name_cursor(user):
+    return encode_cursor([user.last_name, user.first_name, user.pk])
+
+
+# Имя маршрута -> путь запроса. Маршруты с POST-формами замеряются на GET (отрисовка формы).
+# *_cursor — страницы из середины списка: курсор указывает на объект контекста
+ROUTES = {
+    'home': lambda ctx: '/',
+    'about': lambda ctx: '/about/',
+    'student_list': lambda ctx: '/students/',
+    'student_list_cursor': lambda ctx: f'/students/?cursor={_name_cursor(ctx.student.user)}',
+    'student_detail': lambda ctx: f'/student/{ctx.student.pk}/',
+    'course_list': lambda ctx: '/courses/',
+    'course_list_cursor': lambda ctx: f'/courses/?cursor={encode_cursor([ctx.course.title, ctx.course.pk])}',
+    'course_search': lambda ctx: '/courses/search/?q=Python',
+    'course_detail': lambda ctx: f'/course/{ctx.course.slug}/',
+    'feedback': lambda ctx: '/feedback/',
+    'enrollment': lambda ctx: '/enrollment/',
+    'register': lambda ctx: '/register/',
+    'login': lambda ctx: '/login/',
+    'logout': lambda ctx: '/logout/',
+    'profile': lambda ctx: '/profile/',
+    'profile_edit': lambda ctx: '/profile/edit/',
+    'student_dashboard': lambda ctx: '/dashboard/student/',
+    'teacher_dashboard': lambda ctx: '/dashboard/teacher/',
+    'admin_dashboard': lambda ctx: '/dashboard/admin/',
+    'api_course_list': lambda ctx: '/api/courses/',
+    'api_course_list_cursor': lambda ctx: f'/api/courses/?cursor={encode_cursor([ctx.course.title, ctx.course.pk])}',
+    'api_course_detail': lambda ctx: f'/api/courses/{ctx.course.slug}/?fields=id,title,enrollments',
+    'api_instructor_list': lambda ctx: '/api/instructors/',
+    'api_instructor_list_cursor': lambda ctx: f'/api/instructors/?cursor={_name_cursor(ctx.instructor.user)}',
+    'api_instructor_detail': lambda ctx: f'/api/instructors/{ctx.instructor.pk}/?fields=id,last_name,courses',
+    'api_student_list': lambda ctx: '/api/students/',
+    'api_student_list_cursor': lambda ctx: f'/api/students/?cursor={_name_cursor(ctx.student.user)}',
+    'api_student_detail': lambda ctx: f'/api/students/{ctx.student.pk}/?fields=id,last_name,enrollments',
+    'api_enrollment_list': lambda ctx: '/api/enrollments/',
+    'api_enrollment_list_cursor': lambda ctx: f'/api/enrollments/?cursor={encode_cursor([ctx.enrollment.pk])}',
+    'api_enrollment_detail': lambda ctx: f'/api/enrollments/{ctx.enrollment.pk}/',
+    'export': lambda ctx: '/export/enrollments.csv',
+}
+
+
+def url_names(patterns=None):
+    names = []
+    for pattern in fefu_urls.urlpatterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            names.extend(url_names(pattern.url_patterns))
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.append(pattern.name)
+    return names
+
+
+def missing_routes():
+    """Маршруты urls.py без сценария замера: новый маршрут нужно добавить в ROUTES."""
+    return sorted(set(url_names()) - set(ROUTES))
+
+
+def percentile(samples, p):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def client_for(ctx, role):
+    client = Client(raise_request_exception=False)
+    if ctx.users[role] is not None:
+        client.force_login(ctx.users[role], backend=USER_BACKEND)
+    return client
+
+
+def fetch(client, path):
+    response = client.get(path)
+    if response.streaming:
+        # Выгрузка считается целиком: время до последнего байта
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def measure(ctx, route, role, path, iterations, warmup=1):
+    client = client_for(ctx, role)
+    for _ in range(warmup):
+        fetch(client, path)
+
+    latencies, query_counts, sql_times, statuses = [], [], [], set()
+    for _ in range(iterations):
+        if route == 'logout' and ctx.users[role] is not None:
+            # Выход завершает сессию — входим заново вне замера
+            client.force_login(ctx.users[role], backend=USER_BACKEND)
+        timer = QueryRecorder()
+        with connection.execute_wrapper(timer):
+            started = time.perf_counter()
+            response = fetch(client, path)
+            elapsed = time.perf_counter() - started
+        latencies.append(elapsed * 1000)
+        query_counts.append(timer.count)
+        sql_times.append(timer.seconds * 1000)
+        statuses.add(response.status_code)
+
+    return {
+        'route': route,
+        'role': role,
+        'path': path,
+        'status': sorted(statuses),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries': max(query_counts),
+        'sql_ms': round(statistics.median(sql_times), 2),
+    }
+
+
+def run(ctx, iterations=20, roles=ROLES, routes=None):
+    results = []
+    for route, path in ROUTES.items():
+        if routes and route not in routes:
+            continue
+        for role in roles:
+            results.append(measure(ctx, route, role, path(ctx), iterations))
+    return results
+
+
+def load_budgets(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def budget_for(budgets, route, role):
+    budget = dict(budgets.get('default', {}))
+    budget.update(budgets.get('routes', {}).get(route, {}))
+    budget.update(budgets.get('routes', {}).get(f'{route}:{role}', {}))
+    return budget
+
+
+def check_budgets(results, budgets, latency=True):
+    """Список нарушений: ошибки сервера, превышение числа запросов и (если latency) p95."""
+    violations = []
+    for row in results:
+        name = f'{row["route"]}:{row["role"]}'
+        budget = budget_for(budgets, row['route'], row['role'])
+        if any(status >= 500 for status in row['status']):
+            violations.append(f'{name}: ответ {row["status"]}')
+        if 'queries' in budget and row['queries'] > budget['queries']:
+            violations.append(f'{name}: {row["queries"]} SQL-запросов, бюджет {budget["queries"]}')
+        if latency and 'p95_ms' in budget and row['p95_ms'] > budget['p95_ms']:
+            violations.append(f'{name}: p95 {row["p95_ms"]} мс, бюджет {budget["p95_ms"]} мс')
+    return violations
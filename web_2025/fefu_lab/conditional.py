@@ -0,0 +1,90 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для детальных страниц.
+
+Валидатор страницы — одна агрегирующая выборка по индексированному ключу,
+возвращающая (последнее изменение, отпечаток). Если клиент (браузер или
+кэш nginx) прислал совпадающий If-None-Match / If-Modified-Since, ответ
+304 отдается без выполнения view и рендеринга шаблона.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def _validators(user, state):
+    last_modified, fingerprint = state
+    # Навигация в base.html зависит от пользователя, поэтому он входит в ETag
+    user_key = user.pk if user.is_authenticated else 'anon'
+    digest = hashlib.md5(f'{last_modified.isoformat()}:{fingerprint}:{user_key}'.encode()).hexdigest()
+    # HTTP-даты с точностью до секунды, как в django.views.decorators.http.condition
+    return f'W/"{digest}"', int(last_modified.timestamp())
+
+
+def _finish(response, user, etag, timestamp):
+    if response.status_code not in (200, 304):
+        return response
+
+    response.headers.setdefault('ETag', etag)
+    response.headers.setdefault('Last-Modified', http_date(timestamp))
+    if user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        # Публичная копия может храниться в кэше nginx и перепроверяться через 304
+        max_age = getattr(settings, 'CONDITIONAL_PAGE_MAX_AGE', 30)
+        patch_cache_control(response, public=True, max_age=max_age, must_revalidate=True)
+    return response
+
+
+def conditional_page(validator):
+    """
+    validator(request, *args, **kwargs) -> (last_modified: datetime, fingerprint) или None.
+    None означает, что объекта нет: запрос уходит во view (которое отдаст 404).
+
+    Подходит и для асинхронных view: синхронный валидатор тогда выполняется
+    через sync_to_async, а пользователь берется из request.auser().
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            async_validator = sync_to_async(validator)
+
+            @wraps(view)
+            async def ainner(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+
+                state = await async_validator(request, *args, **kwargs)
+                if state is None:
+                    return await view(request, *args, **kwargs)
+                user = await request.auser()
+                etag, timestamp = _validators(user, state)
+
+                response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _finish(response, user, etag, timestamp)
+            return ainner
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            state = validator(request, *args, **kwargs)
+            if state is None:
+                return view(request, *args, **kwargs)
+            etag, timestamp = _validators(request.user, state)
+
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return _finish(response, request.user, etag, timestamp)
+        return inner
+    return decorator
+
+
+def latest(*timestamps):
+    return max(ts for ts in timestamps if ts is not None)
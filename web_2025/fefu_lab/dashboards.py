@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Course
+
+TEACHER_STATS_FIELDS = (
+    'id', 'title', 'slug', 'is_active', 'max_students',
+    'active_count', 'completed_count', 'dropped_count',
+    'average_grade', 'available_slots',
+)
+
+
+def teacher_stats_cache_key(instructor_id):
+    return f'fefu_lab:teacher_stats:{instructor_id}'
+
+
+def get_teacher_course_stats(instructor_id):
+    """
+    Статистика по курсам преподавателя. Кэшируется на
+    TEACHER_DASHBOARD_CACHE_TIMEOUT секунд (0 — без кэша) и сбрасывается
+    сигналами при изменении записей на курсы этого преподавателя.
+    """
+    timeout = getattr(settings, 'TEACHER_DASHBOARD_CACHE_TIMEOUT', 300)
+    key = teacher_stats_cache_key(instructor_id)
+    if timeout:
+        stats = cache.get(key)
+        if stats is not None:
+            return stats
+
+    stats = list(
+        Course.objects.filter(instructor_id=instructor_id)
+        .with_enrollment_stats()
+        .values(*TEACHER_STATS_FIELDS)
+    )
+    if timeout:
+        cache.set(key, stats, timeout)
+    return stats
+
+
+def invalidate_teacher_stats(*instructor_ids):
+    keys = [teacher_stats_cache_key(pk) for pk in set(instructor_ids) if pk is not None]
+    if keys:
+        cache.delete_many(keys)
@@ -0,0 +1,88 @@
+"""
+Запись на курс с контролем вместимости и лист ожидания.
+
+Вместимость проверяется условным UPDATE по строке курса:
+UPDATE course SET active_enrollments_count = active_enrollments_count
+WHERE id = ... AND active_enrollments_count < max_students.
+Запрос блокирует только эту строку (PostgreSQL) до конца транзакции,
+поэтому параллельные записи на один курс выстраиваются в очередь, а на
+разные курсы — нет. Сам счетчик увеличивает сигнал post_save Enrollment.
+
+Письма студентам ставятся в очередь фоновых задач (jobs.py) в той же
+транзакции и отправляются воркером.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+
+from .jobs import enqueue
+from .models import Course, Enrollment, Waitlist
+
+
+def _take_slot(course_id):
+    updated = Course.objects.filter(
+        pk=course_id,
+        active_enrollments_count__lt=F('max_students'),
+    ).update(active_enrollments_count=F('active_enrollments_count'))
+    return updated == 1
+
+
+def _activate(student_id, course_id, existing=None):
+    if existing is None:
+        return Enrollment.objects.create(student_id=student_id, course_id=course_id)
+    existing.status = 'ACTIVE'
+    existing.completed_at = None
+    existing.save()
+    return existing
+
+
+def enroll_student(student, course):
+    """
+    Записывает студента на курс или ставит в лист ожидания.
+    Возвращает (объект, waitlisted): Enrollment либо Waitlist.
+    """
+    with transaction.atomic():
+        # Блокировка строки курса должна быть первым запросом транзакции
+        has_slot = _take_slot(course.pk)
+
+        existing = Enrollment.objects.filter(student=student, course=course).first()
+        if existing is not None and existing.status == 'ACTIVE':
+            raise ValidationError('Вы уже записаны на этот курс')
+        if existing is not None and existing.status == 'COMPLETED':
+            raise ValidationError('Вы уже прошли этот курс')
+
+        if has_slot:
+            enrollment = _activate(student.pk, course.pk, existing)
+            Waitlist.objects.filter(student=student, course=course).delete()
+            enqueue('notify_enrollment', student_id=student.pk, course_id=course.pk, kind='enrolled')
+            return enrollment, False
+
+        entry, created = Waitlist.objects.get_or_create(student=student, course=course)
+        if not created:
+            raise ValidationError('Вы уже в листе ожидания этого курса')
+        enqueue('notify_enrollment', student_id=student.pk, course_id=course.pk, kind='waitlisted')
+        return entry, True
+
+
+def promote_from_waitlist(course_id):
+    """Переводит студентов из листа ожидания (FIFO), пока на курсе есть места."""
+    promoted = []
+    with transaction.atomic():
+        while True:
+            entry = (
+                Waitlist.objects.select_for_update()
+                .filter(course_id=course_id)
+                .order_by('created_at', 'pk')
+                .first()
+            )
+            if entry is None or not _take_slot(course_id):
+                break
+
+            existing = Enrollment.objects.filter(student_id=entry.student_id, course_id=course_id).first()
+            entry.delete()
+            if existing is not None and existing.status != 'DROPPED':
+                # Студент уже записан или прошел курс — место остается свободным
+                continue
+            promoted.append(_activate(entry.student_id, course_id, existing))
+            enqueue('notify_enrollment', student_id=entry.student_id, course_id=course_id, kind='promoted')
+    return promoted
@@ -1,7 +1,11 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db import transaction
+from .backends import users_by_email
+from .jobs import enqueue
 from .models import UserProfile, Student, Instructor, Course, Enrollment
 
 class FeedbackForm(forms.Form):
@@ -74,7 +78,7 @@ class CustomUserCreationForm(UserCreationForm):
 
     def clean_email(self):
         email = self.cleaned_data.get('email')
-        if User.objects.filter(email=email).exists():
+        if users_by_email(email).exists():
             raise forms.ValidationError("Пользователь с таким email уже существует")
         return email
 
@@ -85,20 +89,25 @@ class CustomUserCreationForm(UserCreationForm):
         user.last_name = self.cleaned_data['last_name']
         
         if commit:
-            user.save()
-            # Создаем профиль пользователя
-            profile = UserProfile.objects.create(
-                user=user,
-                role=self.cleaned_data['role']
-            )
-            
-            # Если это студент, создаем запись в Student
-            if self.cleaned_data['role'] == 'STUDENT':
-                Student.objects.create(user=user)
-            # Если это преподаватель, создаем запись в Instructor
-            elif self.cleaned_data['role'] == 'TEACHER':
-                Instructor.objects.create(user=user)
-                
+            # Пользователь и профили нужны сразу для входа — создаются в одной
+            # транзакции; приветственное письмо отправит фоновый воркер
+            with transaction.atomic():
+                user.save()
+                # Создаем профиль пользователя
+                UserProfile.objects.create(
+                    user=user,
+                    role=self.cleaned_data['role']
+                )
+
+                # Если это студент, создаем запись в Student
+                if self.cleaned_data['role'] == 'STUDENT':
+                    Student.objects.create(user=user)
+                # Если это преподаватель, создаем запись в Instructor
+                elif self.cleaned_data['role'] == 'TEACHER':
+                    Instructor.objects.create(user=user)
+
+                enqueue('send_welcome_email', user_id=user.pk)
+
         return user
 
 class LoginForm(forms.Form):
@@ -130,6 +139,14 @@ class UserProfileUpdateForm(forms.ModelForm):
             'bio': forms.Textarea(attrs={'class': 'form-control', 'rows': 4}),
         }
 
+    def clean_avatar(self):
+        avatar = self.cleaned_data.get('avatar')
+        limit = settings.AVATAR_MAX_UPLOAD_SIZE
+        # Проверяется только новый файл: у сохраненного аватара size читает диск
+        if avatar and 'avatar' in self.changed_data and avatar.size > limit:
+            raise ValidationError(f"Размер файла не должен превышать {limit // (1024 * 1024)} МБ")
+        return avatar
+
 class StudentProfileUpdateForm(forms.ModelForm):
     class Meta:
         model = Student
@@ -151,3 +168,26 @@ class EnrollmentForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['course'].queryset = Course.objects.filter(is_active=True)
+
+class EnrollmentExportForm(forms.Form):
+    course = forms.ModelChoiceField(
+        queryset=Course.objects.all(),
+        to_field_name='slug',
+        required=False,
+        label='Курс'
+    )
+    status = forms.ChoiceField(
+        choices=[('', 'Все')] + Enrollment.STATUS_CHOICES,
+        required=False,
+        label='Статус'
+    )
+    date_from = forms.DateField(required=False, label='Записан с')
+    date_to = forms.DateField(required=False, label='Записан по')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise ValidationError("Дата начала периода позже даты окончания")
+        return cleaned_data
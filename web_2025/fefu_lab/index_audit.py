@@ -0,0 +1,139 @@
+"""
+Аудит индексов: EXPLAIN для SQL, который выполняют страницы fefu_lab.
+
+Каждый маршрут из benchmarks.ROUTES запрашивается от имени анонима и каждой
+роли; все SELECT-запросы перехватываются через execute_wrapper, и для каждого
+различного (после нормализации) запроса строится план. В отчет попадают
+полные просмотры таблиц, в которых не меньше min_rows строк: SQLite — SCAN
+таблицы или индекса без условия поиска, PostgreSQL — Seq Scan. Просмотр
+индекса по порядку под LIMIT на первой странице списка тоже SCAN; такие пары
+маршрут:таблица перечислены в FIRST_PAGE_SCANS, а страницы по курсору
+(маршруты *_cursor) обязаны искать в индексе.
+
+Используется командой audit_indexes и тестами в tests.py.
+"""
+import json
+import re
+
+from django.db import connection
+
+from .benchmarks import ROLES, ROUTES, client_for, fetch
+from .instrumentation import normalize_sql
+
+# Полные просмотры, которые ожидаемы: выгрузка читает таблицу целиком
+EXPECTED_SCANS = frozenset({'export:fefu_lab_enrollment'})
+# Первые страницы списков: индекс читается с начала в порядке сортировки и
+# останавливается после LIMIT строк. Для страниц по курсору не допускаются
+FIRST_PAGE_SCANS = frozenset({
+    'student_list:auth_user',
+    'course_list:fefu_lab_course',
+    'api_course_list:fefu_lab_course',
+    'api_instructor_list:auth_user',
+    'api_student_list:auth_user',
+    'api_enrollment_list:fefu_lab_enrollment',
+})
+
+# SCAN t, SCAN t USING [COVERING] INDEX i — без условия поиска (у SEARCH оно есть)
+_SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$')
+_ALIAS = re.compile(r'"(\w+)"\s+(?:AS\s+)?([A-Z]\d+)\b')
+
+
+class SelectCollector:
+    """execute_wrapper: первый пример каждого различного SELECT с параметрами."""
+
+    def __init__(self):
+        self.route = self.role = None
+        self.queries = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip()[:6].upper() in ('SELECT', 'WITH '):
+            self.queries.setdefault(normalize_sql(sql), (self.route, self.role, sql, params))
+        return execute(sql, params, many, context)
+
+
+def collect(ctx, roles=ROLES, routes=None):
+    collector = SelectCollector()
+    with connection.execute_wrapper(collector):
+        for route, path in ROUTES.items():
+            if routes and route not in routes:
+                continue
+            for role in roles:
+                collector.route, collector.role = route, role
+                fetch(client_for(ctx, role), path(ctx))
+    return list(collector.queries.values())
+
+
+def analyze():
+    """Обновляет статистику планировщика после генерации данных."""
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def _sqlite_scans(cursor, sql, params):
+    aliases = {alias: table for table, alias in _ALIAS.findall(sql)}
+    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+    scans = []
+    for row in cursor.fetchall():
+        match = _SQLITE_SCAN.match(row[-1])
+        if match:
+            name = match.group(1)
+            scans.append((aliases.get(name, name), row[-1]))
+    return scans
+
+
+def _postgresql_scans(cursor, sql, params):
+    cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans, nodes = [], [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] == 'Seq Scan':
+            detail = f'Seq Scan on {node["Relation Name"]}'
+            if node.get('Filter'):
+                detail += f' (Filter: {node["Filter"]})'
+            scans.append((node['Relation Name'], detail))
+        nodes.extend(node.get('Plans', ()))
+    return scans
+
+
+def sequential_scans(sql, params):
+    """[(таблица, строка плана)] для полных просмотров таблиц в плане запроса."""
+    explain = {'sqlite': _sqlite_scans, 'postgresql': _postgresql_scans}.get(connection.vendor)
+    if explain is None:
+        raise NotImplementedError(f'EXPLAIN для {connection.vendor} не поддерживается')
+    with connection.cursor() as cursor:
+        return explain(cursor, sql, params)
+
+
+def table_rows(table, cache):
+    if table not in cache:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+            cache[table] = cursor.fetchone()[0]
+    return cache[table]
+
+
+def audit(queries, min_rows=1000, ignore=()):
+    """
+    Полные просмотры больших таблиц: [{route, role, table, rows, plan, sql}].
+    ignore — имена таблиц или пары 'маршрут:таблица' в дополнение к EXPECTED_SCANS.
+    """
+    ignore = EXPECTED_SCANS | FIRST_PAGE_SCANS | set(ignore)
+    findings, sizes = [], {}
+    for route, role, sql, params in queries:
+        for table, detail in sequential_scans(sql, params):
+            if table in ignore or f'{route}:{table}' in ignore:
+                continue
+            rows = table_rows(table, sizes)
+            if rows >= min_rows:
+                findings.append({
+                    'route': route,
+                    'role': role,
+                    'table': table,
+                    'rows': rows,
+                    'plan': detail,
+                    'sql': normalize_sql(sql),
+                })
+    return findings
@@ -0,0 +1,146 @@
+"""
+Учет SQL-запросов и времени отрисовки шаблонов в рамках одного запроса.
+
+QueryRecorder подключается через connection.execute_wrapper и в горячем
+пути только считает время и группирует запросы по тексту SQL (поиск в
+словаре). Нормализация и отпечатки считаются один раз в конце запроса, по
+различным текстам.
+"""
+import hashlib
+import json
+import re
+import time
+from contextvars import ContextVar
+
+from django.core import signing
+from django.template import base as template_base
+
+TOKEN_SALT = 'fefu_lab.sql-instrumentation'
+TOKEN_VALUE = 'sql'
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+_SPACES = re.compile(r'\s+')
+
+_current = ContextVar('fefu_lab_sql_recorder', default=None)
+_original_render = None
+
+
+def normalize_sql(sql):
+    """Текст запроса без литералов: одинаковые по форме запросы дают одну строку."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+class QueryRecorder:
+    """execute_wrapper: число, время и группы запросов, плюс время отрисовки шаблонов."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.render_seconds = 0.0
+        self.rendering = False
+        self.by_sql = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            stat = self.by_sql.get(sql)
+            if stat is None:
+                self.by_sql[sql] = [1, elapsed]
+            else:
+                stat[0] += 1
+                stat[1] += elapsed
+
+    def patterns(self):
+        """[{fingerprint, sql, count, ms}] по нормализованному SQL, самые частые первыми."""
+        grouped = {}
+        for sql, (count, seconds) in self.by_sql.items():
+            normalized = normalize_sql(sql)
+            stat = grouped.setdefault(normalized, [0, 0.0])
+            stat[0] += count
+            stat[1] += seconds
+        return sorted(
+            (
+                {'fingerprint': fingerprint(sql), 'sql': sql, 'count': count, 'ms': round(seconds * 1000, 2)}
+                for sql, (count, seconds) in grouped.items()
+            ),
+            key=lambda p: (-p['count'], -p['ms']),
+        )
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+
+
+def _timed_render(self, context):
+    recorder = _current.get()
+    # Вложенные шаблоны (extends/include) учитываются в самом внешнем
+    if recorder is None or recorder.rendering:
+        return _original_render(self, context)
+    recorder.rendering = True
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        recorder.render_seconds += time.perf_counter() - started
+        recorder.rendering = False
+
+
+def install_render_timer():
+    """Оборачивает Template.render; без активного QueryRecorder обертка — один ContextVar.get()."""
+    global _original_render
+    if _original_render is None:
+        _original_render = template_base.Template.render
+        template_base.Template.render = _timed_render
+
+
+def make_token():
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(TOKEN_VALUE)
+
+
+def check_token(value, max_age):
+    try:
+        return signing.TimestampSigner(salt=TOKEN_SALT).unsign(value, max_age=max_age) == TOKEN_VALUE
+    except signing.BadSignature:
+        return False
+
+
+def server_timing(recorder, total_seconds):
+    return ', '.join([
+        f'db;dur={recorder.seconds * 1000:.1f};desc="{recorder.count} queries"',
+        f'render;dur={recorder.render_seconds * 1000:.1f}',
+        f'total;dur={total_seconds * 1000:.1f}',
+    ])
+
+
+def report(request, response, recorder, total_seconds, repeat_threshold, limit=10):
+    patterns = recorder.patterns()
+    return json.dumps({
+        'event': 'slow_request',
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'total_ms': round(total_seconds * 1000, 1),
+        'db_ms': round(recorder.seconds * 1000, 1),
+        'render_ms': round(recorder.render_seconds * 1000, 1),
+        'queries': recorder.count,
+        'repeated': [p for p in patterns if p['count'] >= repeat_threshold][:limit],
+        'slowest': sorted(patterns, key=lambda p: -p['ms'])[:limit],
+    }, ensure_ascii=False)
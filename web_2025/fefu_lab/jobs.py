@@ -0,0 +1,184 @@
+"""
+Очередь фоновых задач в основной БД (модель Job).
+
+enqueue() добавляет строку в текущей транзакции: задача появится у воркеров
+только вместе с данными, ради которых она создана, и пропадет при откате.
+Обработчики регистрируются декоратором @task (fefu_lab/tasks.py) и получают
+payload как именованные аргументы.
+
+Воркер (команда run_workers) забирает готовые задачи:
+- PostgreSQL: SELECT ... FOR UPDATE SKIP LOCKED — воркеры не ждут друг друга
+  и не получают одну задачу дважды;
+- SQLite: блокировок строк нет, задачу получает тот, чей условный
+  UPDATE ... WHERE status = 'QUEUED' сработал первым; пустая очередь
+  опрашивается раз в poll_interval секунд.
+
+Задача выполняется в транзакции. При исключении она возвращается в очередь с
+экспоненциальной задержкой (JOB_RETRY_BASE_DELAY * 2^(попытка-1), не больше
+JOB_RETRY_MAX_DELAY, со случайным разбросом), после max_attempts попыток
+получает статус FAILED. Задачи воркера, пропавшего дольше JOB_LEASE_TIMEOUT,
+возвращаются в очередь. Изменения БД задачи фиксируются вместе с ее статусом
+DONE, а внешний эффект (письмо) при сбое может повториться.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name=None, max_attempts=5):
+    """Регистрирует обработчик задачи: @task() или @task('имя', max_attempts=3)."""
+    def register(func):
+        func.task_name = name or func.__name__
+        func.max_attempts = max_attempts
+        TASKS[func.task_name] = func
+        return func
+    return register
+
+
+def enqueue(name, /, delay=0, **payload):
+    """Ставит задачу в очередь (в текущей транзакции) и возвращает Job."""
+    handler = TASKS[name]
+    return Job.objects.create(
+        task=name,
+        payload=payload,
+        max_attempts=handler.max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+# ---------- Получение задач ----------
+def claim(worker, limit=1):
+    """Переводит до limit готовых задач в RUNNING от имени worker и возвращает их."""
+    now = timezone.now()
+    ready = Job.objects.filter(status='QUEUED', run_at__lte=now).order_by('run_at', 'pk')
+    taken = {'status': 'RUNNING', 'locked_by': worker, 'locked_at': now, 'attempts': F('attempts') + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(ready.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=ids).update(**taken)
+    else:
+        ids = [
+            pk for pk in ready.values_list('pk', flat=True)[:limit]
+            if Job.objects.filter(pk=pk, status='QUEUED').update(**taken)
+        ]
+    return list(Job.objects.filter(pk__in=ids).order_by('run_at', 'pk'))
+
+
+def retry_delay(attempt):
+    base = getattr(settings, 'JOB_RETRY_BASE_DELAY', 10)
+    ceiling = getattr(settings, 'JOB_RETRY_MAX_DELAY', 3600)
+    delay = min(ceiling, base * 2 ** (attempt - 1))
+    # Разброс, чтобы задачи, упавшие вместе (недоступен SMTP), не вернулись разом
+    return delay * random.uniform(0.5, 1.0)
+
+
+def execute(job):
+    """Выполняет задачу, полученную claim(), и записывает результат."""
+    handler = TASKS.get(job.task)
+    try:
+        if handler is None:
+            raise LookupError(f'Неизвестная задача {job.task}')
+        with transaction.atomic():
+            handler(**job.payload)
+            # Отметка в той же транзакции: изменения БД задачи не повторятся
+            Job.objects.filter(pk=job.pk).update(status='DONE', finished_at=timezone.now(), last_error='')
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            logger.error('Задача %s #%s не выполнена после %s попыток', job.task, job.pk, job.attempts)
+            Job.objects.filter(pk=job.pk).update(status='FAILED', last_error=error, finished_at=now)
+            return False
+        logger.warning('Задача %s #%s: попытка %s не удалась', job.task, job.pk, job.attempts)
+        Job.objects.filter(pk=job.pk).update(
+            status='QUEUED', last_error=error, locked_by='', locked_at=None,
+            run_at=now + timedelta(seconds=retry_delay(job.attempts)),
+        )
+        return False
+    return True
+
+
+# ---------- Обслуживание ----------
+def requeue_stale(timeout=None):
+    """Возвращает в очередь задачи воркеров, пропавших дольше timeout секунд."""
+    timeout = timeout if timeout is not None else getattr(settings, 'JOB_LEASE_TIMEOUT', 600)
+    now = timezone.now()
+    stale = Job.objects.filter(status='RUNNING', locked_at__lt=now - timedelta(seconds=timeout))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='FAILED', last_error='Воркер не завершил задачу', finished_at=now,
+    )
+    requeued = stale.update(status='QUEUED', locked_by='', locked_at=None, run_at=now)
+    return requeued, failed
+
+
+def prune(days=None):
+    """Удаляет выполненные задачи старше days дней."""
+    days = days if days is not None else getattr(settings, 'JOB_RETENTION_DAYS', 7)
+    deleted, _ = Job.objects.filter(
+        status='DONE', finished_at__lt=timezone.now() - timedelta(days=days),
+    ).delete()
+    return deleted
+
+
+# ---------- Воркер ----------
+def worker_name(index=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'
+
+
+class Worker:
+    def __init__(self, name, poll_interval=1.0, batch=1, stop=None, manage_connections=True):
+        self.name = name
+        self.poll_interval = poll_interval
+        self.batch = batch
+        self.stop = stop or threading.Event()
+        # Отдельный поток сам закрывает устаревшие соединения, как обработчик запроса
+        self.manage_connections = manage_connections
+        self.processed = 0
+
+    def run_once(self):
+        jobs = claim(self.name, self.batch)
+        for job in jobs:
+            execute(job)
+        self.processed += len(jobs)
+        return len(jobs)
+
+    def run(self, burst=False):
+        """Выполняет задачи до stop; burst — до опустошения очереди."""
+        try:
+            while not self.stop.is_set():
+                if self.manage_connections:
+                    close_old_connections()
+                try:
+                    if self.run_once():
+                        continue
+                except Exception:
+                    # Сбой БД не должен останавливать воркер: пробуем снова после паузы
+                    logger.exception('Воркер %s: ошибка получения задач', self.name)
+                if burst:
+                    break
+                self.stop.wait(self.poll_interval)
+        finally:
+            if self.manage_connections:
+                connection.close()
+        return self.processed
+
+
+def run_pending(worker='inline'):
+    """Выполняет все готовые задачи в текущем потоке и его транзакции (тесты, отладка)."""
+    return Worker(worker, manage_connections=False).run(burst=True)
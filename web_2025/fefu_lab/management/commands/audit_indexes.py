@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from fefu_lab import benchmarks, index_audit
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит EXPLAIN для SQL-запросов каждой страницы fefu_lab на синтетических данных и '
+        'сообщает о полных просмотрах таблиц больше --min-rows строк. Данные откатываются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=5000)
+        parser.add_argument('--courses', type=int, default=100)
+        parser.add_argument('--enrollment-density', type=float, default=3.0)
+        parser.add_argument('--seed', default='audit')
+        parser.add_argument('--min-rows', type=int, default=1000, help='Порог размера таблицы')
+        parser.add_argument('--route', action='append', dest='routes', help='Только указанные маршруты')
+        parser.add_argument(
+            '--ignore', action='append', default=[],
+            help='Таблица или маршрут:таблица, где полный просмотр допустим (можно несколько)',
+        )
+        parser.add_argument('--show-sql', action='store_true', help='Печатать нормализованный SQL')
+
+    def handle(self, *args, **options):
+        unknown = set(options['routes'] or ()) - set(benchmarks.ROUTES)
+        if unknown:
+            raise CommandError(f'Неизвестные маршруты: {", ".join(sorted(unknown))}')
+
+        with override_settings(ALLOWED_HOSTS=['testserver'], SESSION_WRITE_BEHIND_INTERVAL=0):
+            try:
+                with transaction.atomic():
+                    self.stdout.write('Генерация данных...')
+                    ctx = benchmarks.build_dataset(
+                        options['students'], options['courses'], options['enrollment_density'], options['seed'],
+                    )
+                    index_audit.analyze()
+                    queries = index_audit.collect(ctx, routes=options['routes'])
+                    self.stdout.write(f'Различных SELECT-запросов: {len(queries)}')
+                    try:
+                        findings = index_audit.audit(queries, options['min_rows'], options['ignore'])
+                    except NotImplementedError as exc:
+                        raise CommandError(str(exc))
+                    raise Rollback
+            except Rollback:
+                pass
+
+        for finding in findings:
+            self.stdout.write(
+                f'{finding["route"]} ({finding["role"]}): {finding["table"]}, '
+                f'{finding["rows"]} строк — {finding["plan"]}'
+            )
+            if options['show_sql']:
+                self.stdout.write(f'    {finding["sql"]}')
+
+        if findings:
+            tables = sorted({finding['table'] for finding in findings})
+            raise CommandError(f'Полные просмотры больших таблиц: {", ".join(tables)}')
+        self.stdout.write(self.style.SUCCESS('Полных просмотров больших таблиц нет'))
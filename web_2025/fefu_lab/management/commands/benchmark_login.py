@@ -0,0 +1,92 @@
+import time
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext, override_settings
+
+
+class LegacyEmailBackend(ModelBackend):
+    """Реализация EmailBackend до оптимизации — для сравнения."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        try:
+            user = User.objects.get(Q(email=username) | Q(username=username))
+            if user.check_password(password):
+                return user
+        except User.DoesNotExist:
+            return None
+
+
+LEGACY_BACKENDS = [
+    'fefu_lab.management.commands.benchmark_login.LegacyEmailBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+CURRENT_BACKENDS = [
+    'fefu_lab.backends.EmailBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+PASSWORD = 'bench-password-123'
+SCENARIOS = [
+    ('email, верный пароль', 'bench.user@fefu.ru', PASSWORD),
+    ('username, верный пароль', 'bench_user', PASSWORD),
+    ('email, неверный пароль', 'bench.user@fefu.ru', 'wrong-password'),
+    ('неизвестный логин', 'nobody@fefu.ru', PASSWORD),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость входа (попыток/с на одно ядро) до и после оптимизации EmailBackend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=10, help='Попыток на сценарий')
+        parser.add_argument('--users', type=int, default=10000, help='Сколько пользователей создать для объема таблицы')
+
+    def handle(self, *args, **options):
+        # Все данные создаются во временной транзакции и откатываются
+        try:
+            with transaction.atomic():
+                self.populate(options['users'])
+                self.run(options['iterations'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def populate(self, count):
+        # Непригодный пароль: заполнителям не нужен настоящий хэш
+        hashed = make_password(None)
+        User.objects.bulk_create(
+            [User(username=f'filler_{i}', email=f'filler{i}@fefu.ru', password=hashed) for i in range(count)],
+            batch_size=2000,
+        )
+        User.objects.create_user('bench_user', email='bench.user@fefu.ru', password=PASSWORD)
+
+    def run(self, iterations):
+        header = f'{"сценарий":<26} {"до, попыток/с":>14} {"после, попыток/с":>17} {"запросов до/после":>18}'
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for title, username, password in SCENARIOS:
+            before = self.measure(LEGACY_BACKENDS, username, password, iterations)
+            after = self.measure(CURRENT_BACKENDS, username, password, iterations)
+            self.stdout.write(
+                f'{title:<26} {before[0]:>14.2f} {after[0]:>17.2f} {before[1]:>9} / {after[1]:<7}'
+            )
+
+    def measure(self, backends, username, password, iterations):
+        with override_settings(AUTHENTICATION_BACKENDS=backends):
+            with CaptureQueriesContext(connection) as queries:
+                authenticate(None, username=username, password=password)
+            started = time.perf_counter()
+            for _ in range(iterations):
+                authenticate(None, username=username, password=password)
+            elapsed = time.perf_counter() - started
+        return iterations / elapsed, len(queries)
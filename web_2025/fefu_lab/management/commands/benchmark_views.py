@@ -0,0 +1,130 @@
+import json
+import os
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from fefu_lab import benchmarks
+
+BENCHMARK_DIR = os.path.join(settings.BASE_DIR, 'benchmarks')
+DEFAULT_BUDGETS = os.path.join(BENCHMARK_DIR, 'budgets.json')
+DEFAULT_RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+
+
+class Rollback(Exception):
+    pass
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет все страницы fefu_lab (аноним и каждая роль) на синтетических данных: '
+        'p50/p95/p99, число SQL-запросов и время SQL. Падает при превышении бюджетов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--courses', type=int, default=50)
+        parser.add_argument('--enrollment-density', type=float, default=3.0)
+        parser.add_argument('--seed', default='bench')
+        parser.add_argument('--iterations', type=int, default=20, help='Запросов на пару маршрут/роль')
+        parser.add_argument('--route', action='append', dest='routes', help='Только указанные маршруты')
+        parser.add_argument('--role', action='append', dest='roles', choices=benchmarks.ROLES)
+        parser.add_argument('--budgets', default=DEFAULT_BUDGETS)
+        parser.add_argument('--no-latency-budgets', action='store_true', help='Проверять только число запросов')
+        parser.add_argument('--output', help='Файл результатов (по умолчанию benchmarks/results/<время>-<коммит>.json)')
+        parser.add_argument('--compare', help='Предыдущий файл результатов для сравнения')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должен быть положительным')
+        missing = benchmarks.missing_routes()
+        if missing:
+            raise CommandError(f'Нет сценариев для маршрутов: {", ".join(missing)}')
+        unknown = set(options['routes'] or ()) - set(benchmarks.ROUTES)
+        if unknown:
+            raise CommandError(f'Неизвестные маршруты: {", ".join(sorted(unknown))}')
+
+        # Данные создаются во временной транзакции и откатываются;
+        # сессии пишутся синхронно, чтобы фоновый поток не ждал блокировку SQLite
+        with override_settings(ALLOWED_HOSTS=['testserver'], SESSION_WRITE_BEHIND_INTERVAL=0):
+            try:
+                with transaction.atomic():
+                    self.stdout.write('Генерация данных...')
+                    ctx = benchmarks.build_dataset(
+                        options['students'], options['courses'], options['enrollment_density'], options['seed'],
+                    )
+                    results = benchmarks.run(
+                        ctx, options['iterations'],
+                        roles=options['roles'] or benchmarks.ROLES, routes=options['routes'],
+                    )
+                    raise Rollback
+            except Rollback:
+                pass
+
+        previous = self.load_previous(options['compare'])
+        self.print_table(results, previous)
+
+        report = {
+            'commit': current_commit(),
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'dataset': {
+                'students': options['students'],
+                'courses': options['courses'],
+                'enrollment_density': options['enrollment_density'],
+                'seed': options['seed'],
+            },
+            'iterations': options['iterations'],
+            'results': results,
+        }
+        output = options['output'] or os.path.join(
+            DEFAULT_RESULTS_DIR, f'{timezone.now():%Y%m%d-%H%M%S}-{report["commit"]}.json'
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Результаты: {output}')
+
+        violations = benchmarks.check_budgets(
+            results, benchmarks.load_budgets(options['budgets']), latency=not options['no_latency_budgets'],
+        )
+        if violations:
+            raise CommandError('Превышены бюджеты:\n  ' + '\n  '.join(violations))
+        self.stdout.write(self.style.SUCCESS('Все страницы укладываются в бюджеты'))
+
+    def load_previous(self, path):
+        if not path:
+            return {}
+        with open(path, encoding='utf-8') as f:
+            return {(row['route'], row['role']): row for row in json.load(f)['results']}
+
+    def print_table(self, results, previous):
+        header = f'{"маршрут":<24} {"роль":<10} {"код":<9} {"p50":>8} {"p95":>8} {"p99":>8} {"SQL":>5} {"SQL мс":>8}'
+        if previous:
+            header += f' {"Δp95":>8} {"ΔSQL":>5}'
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in results:
+            line = (
+                f'{row["route"]:<24} {row["role"]:<10} {",".join(map(str, row["status"])):<9} '
+                f'{row["p50_ms"]:>8.1f} {row["p95_ms"]:>8.1f} {row["p99_ms"]:>8.1f} '
+                f'{row["queries"]:>5} {row["sql_ms"]:>8.1f}'
+            )
+            before = previous.get((row['route'], row['role']))
+            if before:
+                line += f' {row["p95_ms"] - before["p95_ms"]:>+8.1f} {row["queries"] - before["queries"]:>+5}'
+            self.stdout.write(line)
+
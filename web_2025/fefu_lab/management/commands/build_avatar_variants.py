@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from fefu_lab import avatars
+from fefu_lab.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит миниатюры аватаров, загруженных до появления обработки (или всех с --all), '
+        'и удаляет устаревшие'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Перестроить миниатюры всех аватаров')
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(Q(avatar='') | Q(avatar__isnull=True))
+        if not options['all']:
+            profiles = profiles.filter(avatar_variants__isnull=True)
+
+        built = failed = 0
+        for pk, name in profiles.values_list('pk', 'avatar').iterator():
+            if avatars.process(pk, name):
+                built += 1
+            else:
+                failed += 1
+                self.stderr.write(f'Профиль {pk}: не удалось обработать {name}')
+        self.stdout.write(self.style.SUCCESS(f'Обработано аватаров: {built}, с ошибками: {failed}'))
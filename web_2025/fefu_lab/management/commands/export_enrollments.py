@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from fefu_lab.exports import DATASETS, DEFAULT_CHUNK_SIZE, FORMATS, stream_export
+from fefu_lab.forms import EnrollmentExportForm
+
+
+class Command(BaseCommand):
+    help = 'Потоково выгружает записи на курсы, списки групп или оценки в CSV/JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', choices=sorted(DATASETS), default='enrollments')
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--course', help='slug курса')
+        parser.add_argument('--status', help='ACTIVE, COMPLETED или DROPPED')
+        parser.add_argument('--from', dest='date_from', help='Дата записи с (ГГГГ-ММ-ДД)')
+        parser.add_argument('--to', dest='date_to', help='Дата записи по (ГГГГ-ММ-ДД)')
+        parser.add_argument('--output', '-o', help='Файл для записи (по умолчанию stdout)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        # Те же правила фильтрации, что и у HTTP-выгрузки
+        form = EnrollmentExportForm({
+            key: options[key] for key in ('course', 'status', 'date_from', 'date_to') if options[key]
+        })
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+
+        lines = stream_export(
+            options['dataset'], options['format'], chunk_size=options['chunk_size'], **form.cleaned_data
+        )
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+            out.writelines(lines)
@@ -0,0 +1,155 @@
+import csv
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from fefu_lab.dashboards import invalidate_teacher_stats
+from fefu_lab.models import Course, Enrollment, SiteStats, Student
+
+STATUSES = {code for code, _ in Enrollment.STATUS_CHOICES}
+
+
+class RejectedRow(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково импортирует записи на курсы из CSV регистратора. '
+        'Колонки: student_id, course (slug), необязательные status, grade, completed_at'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к CSV-файлу')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--rejects', help='Куда записать отклоненные строки (CSV с причиной)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        # Справочники строятся одним запросом каждый, дальше — только поиск в словаре
+        students = dict(Student.objects.exclude(student_id='').values_list('student_id', 'pk'))
+        courses = dict(Course.objects.values_list('slug', 'pk'))
+        self.stdout.write(f'Загружено справочников: {len(students)} студентов, {len(courses)} курсов')
+
+        rejects_file = open(options['rejects'], 'w', newline='', encoding='utf-8') if options['rejects'] else None
+        rejects = csv.writer(rejects_file) if rejects_file else None
+
+        before = Enrollment.objects.count()
+        started = time.monotonic()
+        total = rejected = 0
+        touched_courses = set()
+        batch = []
+        self.now = timezone.now()
+
+        try:
+            with open(options['path'], newline='', encoding=options['encoding']) as f:
+                reader = csv.DictReader(f, delimiter=options['delimiter'])
+                missing = {'student_id', 'course'} - set(reader.fieldnames or ())
+                if missing:
+                    raise CommandError(f'В файле нет колонок: {", ".join(sorted(missing))}')
+                if rejects:
+                    rejects.writerow(['line', 'reason', *reader.fieldnames])
+
+                for total, row in enumerate(reader, start=1):
+                    try:
+                        enrollment = self.build_enrollment(row, students, courses)
+                    except RejectedRow as e:
+                        rejected += 1
+                        if rejects:
+                            rejects.writerow([reader.line_num, str(e), *row.values()])
+                        continue
+
+                    batch.append(enrollment)
+                    touched_courses.add(enrollment.course_id)
+                    if len(batch) >= batch_size:
+                        self.flush(batch, batch_size)
+                        batch = []
+                        self.report_progress(total, started)
+
+                if batch:
+                    self.flush(batch, batch_size)
+        finally:
+            if rejects_file:
+                rejects_file.close()
+
+        self.refresh_counters(touched_courses)
+
+        elapsed = time.monotonic() - started
+        inserted = Enrollment.objects.count() - before
+        valid = total - rejected
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Обработано строк: {total} за {elapsed:.1f} с '
+                f'({total / elapsed if elapsed else 0:.0f} строк/с). '
+                f'Добавлено: {inserted}, уже существовало: {valid - inserted}, отклонено: {rejected}'
+            )
+        )
+
+    def build_enrollment(self, row, students, courses):
+        student_pk = students.get((row.get('student_id') or '').strip())
+        if student_pk is None:
+            raise RejectedRow('неизвестный student_id')
+        course_pk = courses.get((row.get('course') or '').strip())
+        if course_pk is None:
+            raise RejectedRow('неизвестный курс')
+
+        status = (row.get('status') or 'ACTIVE').strip().upper()
+        if status not in STATUSES:
+            raise RejectedRow(f'неизвестный статус {status}')
+
+        grade = (row.get('grade') or '').strip() or None
+        if grade is not None:
+            try:
+                grade = Decimal(grade.replace(',', '.'))
+            except InvalidOperation:
+                raise RejectedRow('некорректная оценка')
+            # nan и inf Decimal принимает, но nan не сравнивается с границами
+            if not grade.is_finite():
+                raise RejectedRow('некорректная оценка')
+            if not 0 <= grade <= 5:
+                raise RejectedRow('оценка вне диапазона 0-5')
+
+        completed_at = (row.get('completed_at') or '').strip() or None
+        if completed_at is not None:
+            completed_at = parse_datetime(completed_at)
+            if completed_at is None:
+                raise RejectedRow('некорректная дата завершения')
+            if timezone.is_naive(completed_at):
+                completed_at = timezone.make_aware(completed_at)
+        elif status == 'COMPLETED':
+            # bulk_create не вызывает Enrollment.save(), повторяем его правило здесь
+            completed_at = self.now
+
+        return Enrollment(
+            student_id=student_pk,
+            course_id=course_pk,
+            status=status,
+            grade=grade,
+            completed_at=completed_at,
+        )
+
+    def flush(self, batch, batch_size):
+        # Дубликаты (student, course) отбрасываются уникальным ограничением
+        Enrollment.objects.bulk_create(batch, batch_size=batch_size, ignore_conflicts=True)
+
+    def report_progress(self, total, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'  {total} строк, {total / elapsed if elapsed else 0:.0f} строк/с')
+
+    def refresh_counters(self, course_ids):
+        # bulk_create обходит сигналы: пересчитываем затронутые счетчики явно
+        if not course_ids:
+            return
+        with transaction.atomic():
+            Course.objects.filter(pk__in=course_ids).recount_enrollments()
+        SiteStats.rebuild()
+        instructor_ids = Course.objects.filter(pk__in=course_ids).values_list('instructor_id', flat=True)
+        invalidate_teacher_stats(*instructor_ids)
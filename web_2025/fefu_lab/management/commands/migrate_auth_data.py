@@ -1,81 +1,155 @@
-from django.core.management.base import BaseCommand
+import json
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from fefu_lab.models import Student, Instructor, UserProfile
-from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from fefu_lab.models import Instructor, Student, UserProfile
+
+DEFAULT_CHECKPOINT = os.path.join(settings.BASE_DIR, '.migrate_auth_data.json')
+
+# model, роль профиля, префикс имени/почты, подпись для имени, подпись в выводе
+TARGETS = [
+    (Student, 'STUDENT', 'student', 'Студент', 'студентов'),
+    (Instructor, 'TEACHER', 'instructor', 'Преподаватель', 'преподавателей'),
+]
+
 
 class Command(BaseCommand):
-    help = 'Мигрирует существующие данные для новой системы аутентификации'
-    
+    help = (
+        'Мигрирует существующие данные для новой системы аутентификации: создает '
+        'пользователей и профили для студентов и преподавателей без аккаунта. '
+        'Работает блоками, каждый блок — отдельная транзакция; прерванный запуск '
+        'продолжается с последнего сохраненного блока'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--password',
+            help='Общий временный пароль. По умолчанию пароль непригоден для входа (нужен сброс)',
+        )
+        parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help='Файл контрольной точки')
+        parser.add_argument('--restart', action='store_true', help='Игнорировать контрольную точку')
+
     def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть положительным')
+
+        self.checkpoint_path = options['checkpoint']
+        self.checkpoint = {} if options['restart'] else self.load_checkpoint()
+        if self.checkpoint:
+            self.stdout.write(f'Продолжение с контрольной точки: {self.checkpoint}')
+
+        # Один хэш на весь запуск вместо PBKDF2 на каждого пользователя
+        self.password_hash = make_password(options['password'])
+
         self.stdout.write('Миграция данных аутентификации...')
-        
-        # Мигрируем студентов
-        students_without_user = Student.objects.filter(user__isnull=True)
-        for student in students_without_user:
-            # Создаем пользователя на основе email студента
-            email = getattr(student, 'email', None)
-            if not email:
-                # Если email нет в старой модели, генерируем
-                email = f"student{student.id}@fefu.ru"
-            
-            username = f"student_{student.id}"
-            user, created = User.objects.get_or_create(
-                username=username,
-                defaults={
-                    'email': email,
-                    'first_name': 'Студент',  # Заглушка
-                    'last_name': f'#{student.id}',
-                }
+        for target in TARGETS:
+            self.migrate(*target, batch_size=batch_size)
+
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        self.stdout.write(self.style.SUCCESS('Миграция данных завершена успешно!'))
+
+    def migrate(self, model, role, prefix, first_name, label, batch_size):
+        key = model._meta.model_name
+        last_pk = self.checkpoint.get(key, 0)
+        started = time.monotonic()
+        linked = skipped = 0
+
+        while True:
+            chunk = list(
+                model.objects.filter(user__isnull=True, pk__gt=last_pk)
+                .order_by('pk')
+                .only('pk')[:batch_size]
             )
-            if created:
-                user.set_password('temp_password_123')
-                user.save()
-            
-            # Связываем студента с пользователем
-            student.user = user
-            student.save()
-            
-            # Создаем профиль пользователя
-            UserProfile.objects.get_or_create(
-                user=user,
-                defaults={'role': 'STUDENT'}
+            if not chunk:
+                break
+            with transaction.atomic():
+                done, conflicts = self.link_chunk(model, chunk, role, prefix, first_name)
+            linked += done
+            skipped += len(conflicts)
+            for username in conflicts:
+                self.stderr.write(f'  пропущен {username}: пользователь уже связан с другим профилем')
+
+            last_pk = chunk[-1].pk
+            self.save_checkpoint(key, last_pk)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'  {label}: {linked} связано, {skipped} пропущено '
+                f'({linked / elapsed if elapsed else 0:.0f} строк/с)'
             )
-            
-            self.stdout.write(f'Мигрирован студент: {user.username}')
-        
-        # Мигрируем преподавателей
-        instructors_without_user = Instructor.objects.filter(user__isnull=True)
-        for instructor in instructors_without_user:
-            # Создаем пользователя
-            email = getattr(instructor, 'email', None)
-            if not email:
-                email = f"instructor{instructor.id}@fefu.ru"
-            
-            username = f"instructor_{instructor.id}"
-            user, created = User.objects.get_or_create(
+
+        self.stdout.write(f'Мигрировано {label}: {linked}, пропущено: {skipped}')
+
+    def link_chunk(self, model, chunk, role, prefix, first_name):
+        usernames = {obj.pk: f'{prefix}_{obj.pk}' for obj in chunk}
+
+        # Пользователи, оставшиеся от прошлых запусков, переиспользуются, как get_or_create раньше
+        existing = {
+            user.username: user
+            for user in User.objects.filter(username__in=usernames.values()).only('pk', 'username')
+        }
+        taken = set(
+            model.objects.filter(user__in=existing.values()).values_list('user__username', flat=True)
+        )
+        other = Student if model is Instructor else Instructor
+        taken.update(
+            other.objects.filter(user__in=existing.values()).values_list('user__username', flat=True)
+        )
+
+        new_users = [
+            User(
                 username=username,
-                defaults={
-                    'email': email,
-                    'first_name': 'Преподаватель',  # Заглушка
-                    'last_name': f'#{instructor.id}',
-                }
-            )
-            if created:
-                user.set_password('temp_password_123')
-                user.save()
-            
-            # Связываем преподавателя с пользователем
-            instructor.user = user
-            instructor.save()
-            
-            # Создаем профиль пользователя
-            UserProfile.objects.get_or_create(
-                user=user,
-                defaults={'role': 'TEACHER'}
+                email=f'{prefix}{pk}@fefu.ru',
+                first_name=first_name,
+                last_name=f'#{pk}',
+                password=self.password_hash,
             )
-            
-            self.stdout.write(f'Мигрирован преподаватель: {user.username}')
-        
-        self.stdout.write(
-            self.style.SUCCESS('Миграция данных завершена успешно!')
+            for pk, username in usernames.items()
+            if username not in existing
+        ]
+        User.objects.bulk_create(new_users)
+        users = {**existing, **{user.username: user for user in new_users}}
+
+        now = timezone.now()
+        linked, conflicts = [], []
+        for obj in chunk:
+            username = usernames[obj.pk]
+            if username in taken:
+                conflicts.append(username)
+                continue
+            obj.user = users[username]
+            obj.updated_at = now
+            linked.append(obj)
+
+        # Профиль мог остаться от прерванного старого запуска — уникальный user_id отсеет дубликаты
+        UserProfile.objects.bulk_create(
+            [UserProfile(user=obj.user, role=role) for obj in linked],
+            ignore_conflicts=True,
         )
+        model.objects.bulk_update(linked, ['user', 'updated_at'])
+        return len(linked), conflicts
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            raise CommandError(f'Поврежден файл контрольной точки {self.checkpoint_path}, запустите с --restart')
+
+    def save_checkpoint(self, key, last_pk):
+        self.checkpoint[key] = last_pk
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.checkpoint, f)
+        # Замена файла атомарна: обрыв посреди записи не портит контрольную точку
+        os.replace(tmp_path, self.checkpoint_path)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from fefu_lab.models import SiteStats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает таблицу статистики сайта (SiteStats) с нуля'
+
+    def handle(self, *args, **options):
+        stats = SiteStats.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Статистика пересчитана: {stats.active_students} студентов, '
+                f'{stats.active_courses} курсов, {stats.active_instructors} преподавателей, '
+                f'{stats.active_enrollments} активных записей'
+            )
+        )
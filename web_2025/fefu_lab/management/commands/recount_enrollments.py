@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Q
+from fefu_lab.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованный счетчик активных записей на курсы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать курсы с расхождением, ничего не изменяя',
+        )
+
+    def handle(self, *args, **options):
+        drifted = (
+            Course.objects
+            .annotate(actual=Count('enrollments', filter=Q(enrollments__status='ACTIVE')))
+            .exclude(active_enrollments_count=F('actual'))
+            .values_list('slug', 'active_enrollments_count', 'actual')
+        )
+        drifted = list(drifted)
+
+        for slug, stored, actual in drifted:
+            self.stdout.write(f'{slug}: {stored} -> {actual}')
+
+        if options['dry_run']:
+            self.stdout.write(f'Курсов с расхождением: {len(drifted)}')
+            return
+
+        with transaction.atomic():
+            updated = Course.objects.recount_enrollments()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Пересчитано курсов: {updated}, исправлено расхождений: {len(drifted)}'
+            )
+        )
@@ -0,0 +1,103 @@
+import logging
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from fefu_lab import jobs
+
+logger = logging.getLogger('fefu_lab.jobs')
+
+# Как часто главный поток возвращает в очередь задачи пропавших воркеров
+MAINTENANCE_INTERVAL = 60
+
+
+def _serve(threads, poll_interval, batch, burst, stop):
+    workers = [
+        jobs.Worker(jobs.worker_name(index), poll_interval, batch, stop)
+        for index in range(threads)
+    ]
+    pool = [threading.Thread(target=worker.run, args=(burst,), name=worker.name) for worker in workers]
+    for thread in pool:
+        thread.start()
+    if not burst:
+        while not stop.wait(MAINTENANCE_INTERVAL):
+            try:
+                jobs.requeue_stale()
+                jobs.prune()
+            except Exception:
+                logger.exception('Ошибка обслуживания очереди задач')
+        connections.close_all()
+    for thread in pool:
+        thread.join()
+    return sum(worker.processed for worker in workers)
+
+
+def _size_pools(threads):
+    # Пул соединений (settings_production) рассчитан на воркер gunicorn, а здесь
+    # соединение нужно каждому потоку задач и главному потоку обслуживания
+    for alias in connections:
+        options = connections[alias].settings_dict['OPTIONS']
+        if isinstance(options.get('pool'), dict):
+            options['pool'] = {**options['pool'], 'min_size': 1, 'max_size': threads + 1}
+
+
+def _child(threads, poll_interval, batch, burst):
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _serve(threads, poll_interval, batch, burst, stop)
+
+
+class Command(BaseCommand):
+    help = (
+        'Запускает воркеры очереди фоновых задач (fefu_lab/jobs.py): --processes процессов '
+        'по --threads потоков. Останавливается по SIGTERM/SIGINT, дождавшись текущих задач'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help='Потоков в процессе')
+        parser.add_argument('--processes', type=int, default=1, help='Процессов')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Пауза при пустой очереди, секунд')
+        parser.add_argument('--batch', type=int, default=1, help='Задач, забираемых за раз')
+        parser.add_argument('--burst', action='store_true', help='Выполнить готовые задачи и выйти')
+
+    def handle(self, *args, **options):
+        threads, processes = options['threads'], options['processes']
+        if threads < 1 or processes < 1:
+            raise CommandError('--threads и --processes должны быть не меньше 1')
+        worker_options = (threads, options['poll_interval'], options['batch'], options['burst'])
+        _size_pools(threads)
+
+        requeued, failed = jobs.requeue_stale()
+        if requeued or failed:
+            self.stdout.write(f'Задач пропавших воркеров: возвращено {requeued}, завершено с ошибкой {failed}')
+
+        stop = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: stop.set())
+
+        self.stdout.write(f'Воркеры: {processes} x {threads} потоков')
+        if processes == 1:
+            processed = _serve(*worker_options, stop)
+            self.stdout.write(self.style.SUCCESS(f'Выполнено задач: {processed}'))
+            return
+
+        # Дочерние процессы не должны наследовать открытые соединения и пулы
+        connections.close_all()
+        for connection in connections.all():
+            if getattr(connection, 'pool', None) is not None:
+                connection.close_pool()
+        context = multiprocessing.get_context('fork')
+        children = [context.Process(target=_child, args=worker_options) for _ in range(processes)]
+        for child in children:
+            child.start()
+        while any(child.is_alive() for child in children) and not stop.wait(1):
+            pass
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+        for child in children:
+            child.join()
+        self.stdout.write(self.style.SUCCESS('Воркеры остановлены'))
@@ -1,154 +1,322 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-from fefu_lab.models import Student, Instructor, Course, Enrollment
+import bisect
+import multiprocessing
+import os
+import random
+import time
+from contextlib import nullcontext
 from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from fefu_lab.dashboards import invalidate_teacher_stats
+from fefu_lab.models import Course, Enrollment, Instructor, SiteStats, Student, UserProfile, Waitlist
+
+FIRST_NAMES = [
+    'Александр', 'Анна', 'Дмитрий', 'Екатерина', 'Иван', 'Мария', 'Михаил', 'Ольга',
+    'Сергей', 'Татьяна', 'Андрей', 'Елена', 'Алексей', 'Наталья', 'Максим', 'Юлия',
+    'Никита', 'Полина', 'Артем', 'Дарья', 'Егор', 'Виктория', 'Кирилл', 'Ксения',
+]
+LAST_NAMES = [
+    'Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов',
+    'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов',
+    'Егоров', 'Павлов', 'Козлов', 'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров',
+]
+TOPICS = [
+    'Python', 'Веб-безопасность', 'JavaScript', 'Защита сетей', 'Базы данных', 'Криптография',
+    'Машинное обучение', 'Алгоритмы', 'Linux', 'DevOps', 'Анализ данных', 'Django',
+    'Компьютерные сети', 'Операционные системы', 'Тестирование', 'Архитектура ПО',
+]
+SPECIALIZATIONS = ['Кибербезопасность', 'Веб-разработка', 'Сетевые технологии', 'Наука о данных', 'Программная инженерия']
+DEGREES = ['', 'Кандидат технических наук', 'Доктор технических наук']
+FACULTIES = [code for code, _ in Student.FACULTY_CHOICES]
+LEVELS = [code for code, _ in Course.LEVEL_CHOICES]
+STATUSES = ['ACTIVE', 'COMPLETED', 'DROPPED']
+STATUS_WEIGHTS = [60, 30, 10]
+
+# Префикс имен пользователей, по нему --clear находит сгенерированные аккаунты
+USERNAME_PREFIX = 'seed_'
+
+
+def _female(last_name, first_name):
+    if first_name[-1] in 'ая':
+        return last_name + 'а'
+    return last_name
+
+
+def _person(rng):
+    first_name = rng.choice(FIRST_NAMES)
+    return first_name, _female(rng.choice(LAST_NAMES), first_name)
+
+
+def _chunk_rng(seed, kind, index):
+    # Отдельный генератор на каждый блок: результат не зависит от числа процессов
+    return random.Random(f'{seed}:{kind}:{index}')
+
+
+def _bulk(model, objs, batch_size):
+    return model.objects.bulk_create(objs, batch_size=batch_size)
+
+
+_write_lock = None
+
+
+def generate_students(task):
+    """Рабочий процесс: пользователи, профили, студенты и их записи для блока номеров."""
+    seed, index, start, stop, password_hash, course_ids, cum_weights, density, batch_size = task
+    rng = _chunk_rng(seed, 'students', index)
+    now = timezone.now()
+
+    # Все случайные значения готовятся до транзакции, в ней остаются только INSERT-ы
+    users, students, choices = [], [], []
+    whole, fraction = int(density), density - int(density)
+    total_weight = cum_weights[-1]
+    for n in range(start, stop):
+        first_name, last_name = _person(rng)
+        users.append(User(
+            username=f'{USERNAME_PREFIX}student{n:07d}',
+            email=f'student{n:07d}@students.fefu.ru',
+            first_name=first_name,
+            last_name=last_name,
+            password=password_hash,
+            date_joined=now,
+        ))
+        students.append(Student(
+            faculty=rng.choice(FACULTIES),
+            birth_date=date(1995, 1, 1) + timedelta(days=rng.randrange(3650)),
+            student_id=f'S{n:08d}',
+        ))
+
+        wanted = min(whole + (rng.random() < fraction), len(course_ids))
+        picked = set()
+        # Популярность курсов по закону Ципфа: несколько «горячих» курсов, длинный хвост
+        while len(picked) < wanted:
+            picked.add(course_ids[bisect.bisect(cum_weights, rng.random() * total_weight)])
+        for course_id in sorted(picked):
+            status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+            completed = status == 'COMPLETED'
+            choices.append((
+                len(students) - 1,
+                Enrollment(
+                    course_id=course_id,
+                    status=status,
+                    grade=Decimal(rng.randint(20, 50)) / 10 if completed else None,
+                    completed_at=now - timedelta(days=rng.randrange(1, 365)) if completed else None,
+                ),
+            ))
+
+    with _write_lock or nullcontext(), transaction.atomic():
+        _bulk(User, users, batch_size)
+        _bulk(UserProfile, [UserProfile(user_id=u.pk, role='STUDENT') for u in users], batch_size)
+        for user, student in zip(users, students):
+            student.user_id = user.pk
+        _bulk(Student, students, batch_size)
+        for position, enrollment in choices:
+            enrollment.student_id = students[position].pk
+        _bulk(Enrollment, [enrollment for _, enrollment in choices], batch_size)
+
+    return len(users), len(choices)
+
+
+def _init_worker(lock):
+    global _write_lock
+    _write_lock = lock
+    # Соединение родителя после fork использовать нельзя
+    connections.close_all()
+
 
 class Command(BaseCommand):
-    help = 'Заполняет базу данных тестовыми данными'
-    
+    help = (
+        'Генерирует синтетические данные: пользователи, профили, студенты, преподаватели, '
+        'курсы и записи. Детерминировано при одинаковых --seed и --batch-size'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--courses', type=int, default=50)
+        parser.add_argument('--instructors', type=int, help='По умолчанию — один на 4 курса')
+        parser.add_argument(
+            '--enrollment-density', type=float, default=3.0,
+            help='Среднее число записей на студента',
+        )
+        parser.add_argument('--seed', default='fefu')
+        parser.add_argument('--password', default='password123', help='Пароль всех сгенерированных пользователей')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Студентов в одном блоке/транзакции')
+        parser.add_argument('--processes', type=int, default=min(os.cpu_count() or 1, 8))
+        parser.add_argument('--clear', action='store_true', help='Удалить данные fefu_lab и прошлые сгенерированные аккаунты')
+
     def handle(self, *args, **options):
-        self.stdout.write('Создание тестовых данных...')
-        
-        # Очищаем существующие данные
-        Enrollment.objects.all().delete()
-        Course.objects.all().delete()
-        Student.objects.all().delete()
-        Instructor.objects.all().delete()
-        
-        # Создаем преподавателей
-        instructors = [
-            Instructor(
-                first_name='Иван',
-                last_name='Петров',
-                email='i.petrov@fefu.ru',
-                specialization='Кибербезопасность',
-                degree='Кандидат технических наук'
-            ),
-            Instructor(
-                first_name='Мария',
-                last_name='Сидорова',
-                email='m.sidorova@fefu.ru',
-                specialization='Веб-разработка',
-                degree='Доктор технических наук'
-            ),
-            Instructor(
-                first_name='Алексей',
-                last_name='Козлов',
-                email='a.kozlov@fefu.ru',
-                specialization='Сетевые технологии'
-            ),
-        ]
-        
-        for instructor in instructors:
-            instructor.save()
-        
-        # Создаем студентов
-        students = [
-            Student(
-                first_name='Анна',
-                last_name='Иванова',
-                email='anna.ivanova@fefu.ru',
-                birth_date=date(2000, 5, 15),
-                faculty='CS'
-            ),
-            Student(
-                first_name='Дмитрий',
-                last_name='Смирнов',
-                email='dmitry.smirnov@fefu.ru',
-                birth_date=date(1999, 8, 22),
-                faculty='SE'
-            ),
-            Student(
-                first_name='Екатерина',
-                last_name='Попова',
-                email='ekaterina.popova@fefu.ru',
-                birth_date=date(2001, 3, 10),
-                faculty='IT'
-            ),
-            Student(
-                first_name='Михаил',
-                last_name='Васильев',
-                email='mikhail.vasilyev@fefu.ru',
-                birth_date=date(2000, 11, 5),
-                faculty='DS'
-            ),
-            Student(
-                first_name='Ольга',
-                last_name='Новикова',
-                email='olga.novikova@fefu.ru',
-                birth_date=date(1999, 12, 30),
-                faculty='WEB'
-            ),
-        ]
-        
-        for student in students:
-            student.save()
-        
-        # Создаем курсы
-        courses = [
-            Course(
-                title='Основы Python',
-                slug='python-basics',
-                description='Базовый курс по программированию на языке Python. Изучение синтаксиса, структур данных и основ ООП.',
-                duration=36,
-                instructor=instructors[0],
-                level='BEGINNER',
-                max_students=25,
-                price=0
-            ),
-            Course(
-                title='Веб-безопасность',
-                slug='web-security',
-                description='Продвинутый курс по защите веб-приложений. SQL-инъекции, XSS, CSRF и другие уязвимости.',
-                duration=48,
-                instructor=instructors[0],
-                level='ADVANCED',
-                max_students=20,
-                price=15000
-            ),
-            Course(
-                title='Современный JavaScript',
-                slug='modern-javascript',
-                description='Изучение современных возможностей JavaScript: ES6+, асинхронное программирование, фреймворки.',
-                duration=42,
-                instructor=instructors[1],
-                level='INTERMEDIATE',
-                max_students=30,
-                price=12000
-            ),
-            Course(
-                title='Защита сетей',
-                slug='network-defense',
-                description='Курс по защите компьютерных сетей. Firewalls, IDS/IPS, VPN и методы атак на сети.',
-                duration=40,
-                instructor=instructors[2],
-                level='ADVANCED',
-                max_students=15,
-                price=18000
-            ),
-        ]
-        
-        for course in courses:
-            course.save()
-        
-        # Создаем записи на курсы
-        enrollments = [
-            Enrollment(student=students[0], course=courses[0], status='ACTIVE'),
-            Enrollment(student=students[0], course=courses[1], status='ACTIVE'),
-            Enrollment(student=students[1], course=courses[0], status='ACTIVE'),
-            Enrollment(student=students[1], course=courses[2], status='ACTIVE'),
-            Enrollment(student=students[2], course=courses[0], status='ACTIVE'),
-            Enrollment(student=students[3], course=courses[3], status='ACTIVE'),
-            Enrollment(student=students[4], course=courses[2], status='ACTIVE'),
+        students, courses = options['students'], options['courses']
+        instructors = options['instructors'] or max(1, courses // 4)
+        density, batch_size = options['enrollment_density'], options['batch_size']
+        if min(students, courses, instructors, batch_size, options['processes']) < 1:
+            raise CommandError('Количества, --batch-size и --processes должны быть положительными')
+        if density < 0:
+            raise CommandError('--enrollment-density не может быть отрицательной')
+
+        if options['clear']:
+            self.clear()
+        elif User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError('Сгенерированные данные уже есть, используйте --clear')
+
+        started = time.monotonic()
+        # Один хэш на всех: PBKDF2 на каждого пользователя занял бы часы
+        password_hash = make_password(options['password'])
+        seed = options['seed']
+
+        phase = time.monotonic()
+        course_ids = self.create_courses(seed, instructors, courses, password_hash)
+        self.report('Преподаватели и курсы', instructors * 3 + courses, phase)
+
+        # Вес курса i — 1/(i+1); накопленные суммы для выбора через bisect
+        cum_weights, total = [], 0.0
+        for i in range(len(course_ids)):
+            total += 1 / (i + 1)
+            cum_weights.append(total)
+
+        tasks = [
+            (seed, index, start, min(start + batch_size, students), password_hash,
+             course_ids, cum_weights, density, batch_size)
+            for index, start in enumerate(range(0, students, batch_size))
         ]
-        
-        for enrollment in enrollments:
-            enrollment.save()
-        
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'Успешно создано: {len(instructors)} преподавателей, '
-                f'{len(students)} студентов, {len(courses)} курсов, '
-                f'{len(enrollments)} записей на курсы'
+        phase = time.monotonic()
+        done_students = done_enrollments = 0
+        for created, enrolled in self.run_tasks(tasks, options['processes']):
+            done_students += created
+            done_enrollments += enrolled
+            elapsed = time.monotonic() - phase
+            self.stdout.write(
+                f'  студентов: {done_students}/{students}, записей: {done_enrollments} '
+                f'({(done_students * 3 + done_enrollments) / elapsed if elapsed else 0:.0f} строк/с)'
             )
+        self.report('Студенты и записи', done_students * 3 + done_enrollments, phase)
+
+        phase = time.monotonic()
+        waitlisted = self.cap_enrollments()
+        self.stdout.write(f'В лист ожидания сверх мест курсов: {waitlisted}')
+        self.refresh_counters()
+        self.stdout.write(f'Пересчет счетчиков: {time.monotonic() - phase:.1f} с')
+
+        total_rows = instructors * 3 + courses + done_students * 3 + done_enrollments
+        self.report('Итого', total_rows, started, success=True)
+
+    def run_tasks(self, tasks, processes):
+        if processes == 1:
+            # В текущем процессе и текущей транзакции (так seed_data вызывает benchmark_views)
+            yield from map(generate_students, tasks)
+            return
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        # SQLite допускает одного писателя: генерация идет параллельно, запись — по очереди
+        lock = context.Lock() if connection.vendor == 'sqlite' else None
+        with context.Pool(processes, initializer=_init_worker, initargs=(lock,)) as pool:
+            yield from pool.imap_unordered(generate_students, tasks)
+
+    def create_courses(self, seed, instructors, courses, password_hash):
+        rng = _chunk_rng(seed, 'courses', 0)
+        now = timezone.now()
+        users = []
+        for n in range(instructors):
+            first_name, last_name = _person(rng)
+            users.append(User(
+                username=f'{USERNAME_PREFIX}teacher{n:05d}',
+                email=f'teacher{n:05d}@fefu.ru',
+                first_name=first_name,
+                last_name=last_name,
+                password=password_hash,
+                date_joined=now,
+            ))
+
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            UserProfile.objects.bulk_create([UserProfile(user_id=u.pk, role='TEACHER') for u in users])
+            teachers = Instructor.objects.bulk_create([
+                Instructor(
+                    user_id=u.pk,
+                    specialization=rng.choice(SPECIALIZATIONS),
+                    degree=rng.choice(DEGREES),
+                    office=f'D{rng.randint(100, 999)}',
+                )
+                for u in users
+            ])
+            created = Course.objects.bulk_create([
+                Course(
+                    title=f'{rng.choice(TOPICS)}: поток {n + 1}',
+                    slug=f'course-{n:05d}',
+                    description=f'Синтетический курс {n + 1}. ' + ' '.join(rng.sample(TOPICS, 4)),
+                    duration=rng.randint(8, 120),
+                    instructor_id=rng.choice(teachers).pk,
+                    level=rng.choice(LEVELS),
+                    max_students=rng.randint(10, 100),
+                    price=Decimal(rng.randrange(0, 30000, 500)),
+                )
+                for n in range(courses)
+            ], batch_size=1000)
+        return [course.pk for course in created]
+
+    def clear(self):
+        self.stdout.write('Удаление данных...')
+        # Прямые DELETE: ORM-удаление миллионов строк с сигналами заняло бы часы.
+        # Триггеры FTS (SQLite) сами чистят поисковый индекс курсов
+        seeded_sql, params = (
+            User.objects.filter(username__startswith=USERNAME_PREFIX).values('pk').query.sql_with_params()
         )
+        quote = connection.ops.quote_name
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in (Enrollment, Waitlist, Course, Student, Instructor):
+                cursor.execute(f'DELETE FROM {quote(model._meta.db_table)}')
+            cursor.execute(
+                f'DELETE FROM {quote(UserProfile._meta.db_table)} WHERE user_id IN ({seeded_sql})', params
+            )
+            cursor.execute(f'DELETE FROM {quote(User._meta.db_table)} WHERE id IN ({seeded_sql})', params)
+        SiteStats.rebuild()
+
+    def cap_enrollments(self):
+        """
+        Записи выбираются блоками независимо, поэтому популярные курсы получают
+        больше ACTIVE-записей, чем max_students. Лишние переводятся в лист
+        ожидания курса, как при записи через enroll_student.
+        """
+        active = Count('enrollments', filter=Q(enrollments__status='ACTIVE'))
+        full = list(
+            Course.objects.annotate(active=active)
+            .filter(active__gt=F('max_students'))
+            .values_list('pk', 'max_students')
+        )
+        table = connection.ops.quote_name(Enrollment._meta.db_table)
+        moved = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            for course_id, capacity in full:
+                # Порядок по студенческому билету не зависит от порядка вставки процессами
+                overflow = list(
+                    Enrollment.objects.filter(course_id=course_id, status='ACTIVE')
+                    .order_by('student__student_id')
+                    .values_list('pk', 'student_id')[capacity:]
+                )
+                Waitlist.objects.bulk_create(
+                    [Waitlist(course_id=course_id, student_id=student_id) for _, student_id in overflow],
+                    batch_size=1000,
+                )
+                # Прямой DELETE: сигналы удаления записи переводили бы студентов обратно из листа
+                ids = [pk for pk, _ in overflow]
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    cursor.execute(f'DELETE FROM {table} WHERE id IN ({", ".join(["%s"] * len(chunk))})', chunk)
+                moved += len(ids)
+        return moved
+
+    def refresh_counters(self):
+        # bulk_create обходит сигналы: счетчики курсов, SiteStats и кэш панели преподавателя
+        with transaction.atomic():
+            Course.objects.recount_enrollments()
+        SiteStats.rebuild()
+        invalidate_teacher_stats(*Instructor.objects.values_list('pk', flat=True))
+
+    def report(self, label, rows, started, success=False):
+        elapsed = time.monotonic() - started
+        line = f'{label}: {rows} строк за {elapsed:.1f} с ({rows / elapsed if elapsed else 0:.0f} строк/с)'
+        self.stdout.write(self.style.SUCCESS(line) if success else line)
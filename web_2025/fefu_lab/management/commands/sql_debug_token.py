@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from fefu_lab.instrumentation import make_token
+
+
+class Command(BaseCommand):
+    help = 'Выдает подписанный заголовок, включающий учет SQL и Server-Timing для отдельных запросов'
+
+    def handle(self, *args, **options):
+        header = getattr(settings, 'SQL_INSTRUMENTATION_HEADER', None)
+        if not header:
+            raise CommandError('SQL_INSTRUMENTATION_HEADER не задан')
+        max_age = getattr(settings, 'SQL_INSTRUMENTATION_TOKEN_MAX_AGE', 3600)
+        self.stdout.write(f'{header}: {make_token()}')
+        self.stdout.write(f'Действует {max_age} с', self.style.NOTICE)
@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from fefu_lab.routers import PRIMARY
+
+
+def copy_database(alias):
+    """Копирует основную БД SQLite в реплику alias (sqlite3 backup API, целиком со схемой)."""
+    source, target = connections[PRIMARY], connections[alias]
+    if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+        raise CommandError('Копирование поддерживается только для SQLite: реплики PostgreSQL обновляет репликация')
+    source.ensure_connection()
+    target.ensure_connection()
+    source.connection.backup(target.connection)
+
+
+class Command(BaseCommand):
+    help = (
+        'Обновляет локальные реплики SQLite копией основной БД. С --interval повторяет '
+        'копирование, изображая отстающую реплику'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'aliases', nargs='*',
+            help="Алиасы реплик (по умолчанию DATABASE_REPLICAS или 'replica')",
+        )
+        parser.add_argument('--interval', type=float, default=0, help='Повторять каждые N секунд')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or getattr(settings, 'DATABASE_REPLICAS', None) or ['replica']
+        for alias in aliases:
+            if alias == PRIMARY or alias not in settings.DATABASES:
+                raise CommandError(f'{alias} — не реплика из DATABASES')
+
+        while True:
+            for alias in aliases:
+                copy_database(alias)
+            self.stdout.write(self.style.SUCCESS(f'Реплики обновлены: {", ".join(aliases)}'))
+            if not options['interval']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
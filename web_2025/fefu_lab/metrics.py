@@ -0,0 +1,586 @@
+"""
+Метрики в формате Prometheus для /metrics.
+
+Каждый процесс пишет показатели в свои файлы в METRICS_DIR, отображенные в
+память (mmap), — по файлу на поток, который записывает метрики. У файла один
+писатель, поэтому запись на пути запроса идет без блокировок: поиск смещения
+в словаре и struct.pack_into. /metrics читает файлы всех процессов и
+суммирует их, так что ответ не зависит от того, какой воркер gunicorn принял
+запрос Prometheus.
+
+Файл: 8 байт занятого размера, затем записи
+[длина ключа: uint32][ключ JSON, выровненный до 8 байт][значение: float64].
+Занятый размер обновляется после записи ключа и значения, поэтому читатель
+всегда видит только целые записи.
+
+Мастер gunicorn в хуке child_exit переносит счетчики завершившегося воркера в
+archive.db (mark_process_dead); датчики (gauge) умерших процессов
+отбрасываются. Без METRICS_DIR (разработка, один процесс) файлы пишутся во
+временный каталог процесса.
+"""
+import bisect
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+
+ARCHIVE = 'archive.db'
+MERGED = '__merged__'
+INITIAL_SIZE = 1 << 16
+
+_HEADER = struct.Struct('Q')
+_LENGTH = struct.Struct('I')
+_VALUE = struct.Struct('d')
+_SHARD_FILE = re.compile(r'^(\d+)_(\d+)\.db$')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+REGISTRY = {}
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _encode_key(key):
+    name, labels = key
+    return json.dumps([name, [list(pair) for pair in labels]], ensure_ascii=False, separators=(',', ':'))
+
+
+def _decode_key(text):
+    name, labels = json.loads(text)
+    return name, tuple(tuple(pair) for pair in labels)
+
+
+def _entries(data):
+    used = _HEADER.unpack_from(data, 0)[0] if len(data) >= _HEADER.size else 0
+    position = _HEADER.size
+    while position < used:
+        length = _LENGTH.unpack_from(data, position)[0]
+        start = position + _LENGTH.size
+        key = bytes(data[start:start + length]).decode()
+        value_position = _align(start + length)
+        yield key, _VALUE.unpack_from(data, value_position)[0], value_position
+        position = value_position + _VALUE.size
+
+
+def _encode_entries(items):
+    chunks, used = [], _HEADER.size
+    for key, value in items:
+        encoded = key.encode()
+        entry = _LENGTH.pack(len(encoded)) + encoded
+        entry += b'\0' * (_align(used + len(entry)) - used - len(entry)) + _VALUE.pack(value)
+        chunks.append(entry)
+        used += len(entry)
+    return _HEADER.pack(used) + b''.join(chunks)
+
+
+class Shard:
+    """Файл метрик с единственным писателем (один поток одного процесса)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._file = os.fdopen(fd, 'r+b')
+        size = os.fstat(fd).st_size
+        if size < INITIAL_SIZE:
+            self._file.truncate(INITIAL_SIZE)
+            size = INITIAL_SIZE
+        self._map = mmap.mmap(fd, size)
+        self._used = _HEADER.unpack_from(self._map, 0)[0] or _HEADER.size
+        self._positions, self._values = {}, {}
+        for text, value, position in _entries(self._map):
+            key = _decode_key(text)
+            self._positions[key] = position
+            self._values[key] = value
+
+    def _allocate(self, key):
+        encoded = _encode_key(key).encode()
+        start = self._used + _LENGTH.size
+        value_position = _align(start + len(encoded))
+        end = value_position + _VALUE.size
+        if end > len(self._map):
+            size = len(self._map)
+            while size < end:
+                size *= 2
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+        _LENGTH.pack_into(self._map, self._used, len(encoded))
+        self._map[start:start + len(encoded)] = encoded
+        _VALUE.pack_into(self._map, value_position, 0.0)
+        # Размер публикуется последним: читатель не увидит недописанную запись
+        _HEADER.pack_into(self._map, 0, end)
+        self._used = end
+        self._positions[key] = value_position
+        self._values[key] = 0.0
+
+    def inc(self, key, amount=1.0):
+        if key not in self._positions:
+            self._allocate(key)
+        value = self._values[key] + amount
+        self._values[key] = value
+        _VALUE.pack_into(self._map, self._positions[key], value)
+
+    def set(self, key, value):
+        if key not in self._positions:
+            self._allocate(key)
+        self._values[key] = value
+        _VALUE.pack_into(self._map, self._positions[key], value)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+# ---------- Файлы текущего процесса ----------
+_directory = None
+_local = threading.local()
+_free = []
+_numbers = iter(range(1 << 62))
+_open_lock = threading.Lock()
+# Общий файл процесса для датчиков 'last' — пишется под блокировкой
+_process_shard = None
+_process_lock = threading.Lock()
+
+
+class _Lease:
+    """Файл, закрепленный за потоком; после завершения потока возвращается в пул."""
+
+    def __init__(self, shard):
+        self.shard = shard
+
+    def __del__(self):
+        if self.shard.pid == os.getpid():
+            _free.append(self.shard)
+
+
+def directory():
+    global _directory
+    if _directory is None:
+        from django.conf import settings
+        configured = getattr(settings, 'METRICS_DIR', None)
+        if configured:
+            os.makedirs(configured, exist_ok=True)
+            _directory = configured
+        else:
+            _directory = tempfile.mkdtemp(prefix='fefu_lab_metrics_')
+    return _directory
+
+
+def _shard():
+    lease = getattr(_local, 'lease', None)
+    if lease is None:
+        try:
+            shard = _free.pop()
+        except IndexError:
+            # Медленный путь: один раз на поток, когда свободных файлов нет
+            with _open_lock:
+                shard = Shard(os.path.join(directory(), f'{os.getpid()}_{next(_numbers)}.db'))
+        lease = _local.lease = _Lease(shard)
+    return lease.shard
+
+
+def _shared_shard():
+    global _process_shard
+    if _process_shard is None:
+        with _open_lock:
+            _process_shard = Shard(os.path.join(directory(), f'{os.getpid()}_{next(_numbers)}.db'))
+    return _process_shard
+
+
+def _after_fork():
+    global _local, _free, _numbers, _open_lock, _process_shard, _process_lock
+    _local, _free, _numbers, _open_lock = threading.local(), [], iter(range(1 << 62)), threading.Lock()
+    _process_shard, _process_lock = None, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+# ---------- Описание метрик ----------
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+
+    def key(self, labels, suffix=''):
+        return self.name + suffix, tuple(zip(self.labelnames, map(str, labels)))
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1.0):
+        _shard().inc(self.key(labels), amount)
+
+
+class Gauge(Metric):
+    """Значение процесса: метка pid добавляется сама, умершие процессы не показываются."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess='sum'):
+        super().__init__(name, documentation, (*labelnames, 'pid'))
+        # sum — inc/dec из разных потоков процесса, max — наибольшее из значений
+        # потоков, last — последнее значение процесса (общий файл под блокировкой)
+        self.multiprocess = multiprocess
+
+    def inc(self, *labels, amount=1.0):
+        _shard().inc(self.key((*labels, os.getpid())), amount)
+
+    def set(self, value, *labels):
+        key = self.key((*labels, os.getpid()))
+        if self.multiprocess == 'last':
+            with _process_lock:
+                _shared_shard().set(key, value)
+        else:
+            _shard().set(key, value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(float(b) for b in buckets)
+        self._keys = {}
+
+    def _keys_for(self, labels):
+        keys = self._keys.get(labels)
+        if keys is None:
+            base = self.key(labels)[1]
+            keys = self._keys[labels] = (
+                (self.name + '_sum', base),
+                (self.name + '_count', base),
+                [(self.name + '_bucket', base + (('le', _format(b)),)) for b in self.buckets],
+            )
+        return keys
+
+    def observe(self, value, *labels):
+        sum_key, count_key, bucket_keys = self._keys_for(labels)
+        shard = _shard()
+        shard.inc(sum_key, value)
+        shard.inc(count_key)
+        # Корзины хранятся без накопления; +Inf — это _count
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(bucket_keys):
+            shard.inc(bucket_keys[index])
+
+
+REQUESTS = Counter(
+    'fefu_http_requests_total', 'HTTP-запросы по view, методу и коду ответа', ('view', 'method', 'status'),
+)
+REQUEST_DURATION = Histogram(
+    'fefu_http_request_duration_seconds', 'Время обработки запроса', ('view',),
+)
+DB_QUERIES = Histogram(
+    'fefu_db_queries_per_request', 'Число SQL-запросов за HTTP-запрос', ('view',), QUERY_BUCKETS,
+)
+DB_DURATION = Histogram(
+    'fefu_db_query_duration_seconds', 'Суммарное время SQL за HTTP-запрос', ('view',),
+)
+DB_CONNECTION_AGE = Gauge(
+    'fefu_db_connection_age_seconds', 'Возраст соединения с БД, использованного последним запросом', ('alias',),
+    multiprocess='max',
+)
+WORKER_REQUESTS = Gauge('fefu_worker_requests', 'Запросов обработано живым воркером')
+WORKER_IN_FLIGHT = Gauge('fefu_worker_in_flight_requests', 'Запросов в обработке у воркера')
+WORKER_STARTED = Gauge('fefu_worker_start_time_seconds', 'Время запуска воркера (unix)', multiprocess='max')
+WORKER_STARTS = Counter('fefu_worker_starts_total', 'Запущено воркеров gunicorn')
+DB_POOL_SIZE = Gauge('fefu_db_pool_connections', 'Открытых соединений в пуле', ('alias',), multiprocess='last')
+DB_POOL_AVAILABLE = Gauge(
+    'fefu_db_pool_available_connections', 'Свободных соединений в пуле', ('alias',), multiprocess='last',
+)
+DB_POOL_MAX = Gauge('fefu_db_pool_max_connections', 'Предел соединений пула', ('alias',), multiprocess='last')
+DB_POOL_WAITING = Gauge(
+    'fefu_db_pool_waiting_requests', 'Потоков, ждущих свободное соединение', ('alias',), multiprocess='last',
+)
+DB_POOL_QUEUED = Gauge(
+    'fefu_db_pool_queued_requests', 'Получений соединения с ожиданием с запуска процесса', ('alias',),
+    multiprocess='last',
+)
+DB_POOL_WAIT = Gauge(
+    'fefu_db_pool_wait_seconds', 'Суммарное ожидание соединения с запуска процесса', ('alias',),
+    multiprocess='last',
+)
+DB_POOL_ERRORS = Gauge(
+    'fefu_db_pool_errors', 'Неудачных получений соединения (таймаут) с запуска процесса', ('alias',),
+    multiprocess='last',
+)
+WORKER_EXITS = Counter('fefu_worker_exits_total', 'Завершилось воркеров gunicorn')
+
+
+# ---------- Учет запроса ----------
+class RequestStats:
+    __slots__ = ('queries', 'db_seconds', 'connections')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.connections = {}
+
+
+_current = ContextVar('fefu_lab_metrics_request', default=None)
+
+
+def db_timer(execute, sql, params, many, context):
+    """Постоянный execute_wrapper соединения: считает SQL текущего HTTP-запроса."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+        connection = context['connection']
+        stats.connections[connection.alias] = getattr(connection, '_fefu_connected_at', None)
+
+
+def connection_created(sender, connection, **kwargs):
+    # Из пула (OPTIONS['pool']) сигнал приходит на каждую выдачу соединения:
+    # возраст считается от открытия самого соединения драйвера
+    raw = connection.connection
+    connected_at = getattr(raw, '_fefu_connected_at', None)
+    if connected_at is None:
+        connected_at = time.monotonic()
+        try:
+            raw._fefu_connected_at = connected_at
+        except AttributeError:
+            pass
+    connection._fefu_connected_at = connected_at
+    if db_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, db_timer)
+
+
+def start_request():
+    stats = RequestStats()
+    WORKER_IN_FLIGHT.inc()
+    return stats, _current.set(stats)
+
+
+def finish_request(stats, token, view, method, status, seconds):
+    _current.reset(token)
+    WORKER_IN_FLIGHT.inc(amount=-1)
+    WORKER_REQUESTS.inc()
+    REQUESTS.inc(view, method, status)
+    REQUEST_DURATION.observe(seconds, view)
+    DB_QUERIES.observe(stats.queries, view)
+    DB_DURATION.observe(stats.db_seconds, view)
+    now = time.monotonic()
+    for alias, connected_at in stats.connections.items():
+        if connected_at is not None:
+            DB_CONNECTION_AGE.set(now - connected_at, alias)
+    record_pool_stats()
+
+
+# ---------- Пул соединений ----------
+POOL_STATS_INTERVAL = 1.0
+_pool_stats_at = 0.0
+
+
+def record_pool_stats(force=False):
+    """Датчики пулов psycopg процесса; не чаще раза в POOL_STATS_INTERVAL секунд."""
+    global _pool_stats_at
+    now = time.monotonic()
+    if not force and now - _pool_stats_at < POOL_STATS_INTERVAL:
+        return
+    _pool_stats_at = now
+    from django.db import connections
+    for alias in connections:
+        # Пул (Django 5.1+, OPTIONS['pool']) общий для всех потоков процесса
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is None:
+            continue
+        stats = pool.get_stats()
+        DB_POOL_SIZE.set(stats.get('pool_size', 0), alias)
+        DB_POOL_AVAILABLE.set(stats.get('pool_available', 0), alias)
+        DB_POOL_MAX.set(stats.get('pool_max', 0), alias)
+        DB_POOL_WAITING.set(stats.get('requests_waiting', 0), alias)
+        DB_POOL_QUEUED.set(stats.get('requests_queued', 0), alias)
+        DB_POOL_WAIT.set(stats.get('requests_wait_ms', 0) / 1000, alias)
+        DB_POOL_ERRORS.set(stats.get('requests_errors', 0), alias)
+
+
+def worker_started():
+    """Хук post_fork gunicorn (вызывается в воркере)."""
+    WORKER_STARTS.inc()
+    WORKER_STARTED.set(time.time())
+
+
+# ---------- Чтение и объединение ----------
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return [(text, value) for text, value, _ in _entries(f.read())]
+
+
+def _kind(name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in REGISTRY:
+            return REGISTRY[name[:-len(suffix)]]
+    return REGISTRY.get(name)
+
+
+def _snapshot(path):
+    archive, merged = {}, set()
+    archive_path = os.path.join(path, ARCHIVE)
+    if os.path.exists(archive_path):
+        for text, value in _read(archive_path):
+            name, labels = _decode_key(text)
+            if name == MERGED:
+                merged.add(dict(labels)['file'])
+            else:
+                archive[(name, labels)] = value
+    return archive, merged
+
+
+def _collect(path):
+    # Список файлов берется до чтения архива: файл, перенесенный в архив
+    # после этого момента, будет отмечен в нем как объединенный
+    names = sorted(name for name in os.listdir(path) if _SHARD_FILE.match(name))
+    values, merged = _snapshot(path)
+    gauges, alive = {}, {}
+    for name in names:
+        if name in merged:
+            continue
+        pid = int(_SHARD_FILE.match(name).group(1))
+        if pid not in alive:
+            alive[pid] = _alive(pid)
+        for text, value in _read(os.path.join(path, name)):
+            key = _decode_key(text)
+            metric = _kind(key[0])
+            if metric is not None and metric.kind == 'gauge':
+                if not alive[pid]:
+                    continue
+                if metric.multiprocess in ('max', 'last'):
+                    gauges[key] = max(gauges.get(key, value), value)
+                else:
+                    gauges[key] = gauges.get(key, 0.0) + value
+            else:
+                values[key] = values.get(key, 0.0) + value
+    values.update(gauges)
+    return values, sum(alive.values())
+
+
+def collect(path=None, attempts=5):
+    """{(имя, метки): значение} по всем процессам и число живых процессов с метриками."""
+    path = path or directory()
+    for _ in range(attempts - 1):
+        try:
+            return _collect(path)
+        except FileNotFoundError:
+            # Файл перенесли в архив между чтением каталога и файла — читаем заново
+            continue
+    return _collect(path)
+
+
+def mark_process_dead(pid, path=None):
+    """Хук child_exit мастера gunicorn: счетчики воркера переносятся в archive.db."""
+    path = path or directory()
+    files = [name for name in os.listdir(path) if name.startswith(f'{pid}_') and _SHARD_FILE.match(name)]
+    archive, merged = _snapshot(path)
+    for name in files:
+        for text, value in _read(os.path.join(path, name)):
+            key = _decode_key(text)
+            metric = _kind(key[0])
+            if metric is None or metric.kind != 'gauge':
+                archive[key] = archive.get(key, 0.0) + value
+    exits = WORKER_EXITS.key(())
+    archive[exits] = archive.get(exits, 0.0) + 1
+    # Отметки нужны только для файлов, которые еще не удалены
+    merged = {name for name in merged if os.path.exists(os.path.join(path, name))} | set(files)
+
+    items = [(_encode_key(key), value) for key, value in archive.items()]
+    items += [(_encode_key((MERGED, (('file', name),))), 0.0) for name in sorted(merged)]
+    tmp_path = os.path.join(path, f'{ARCHIVE}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(_encode_entries(items))
+    os.replace(tmp_path, os.path.join(path, ARCHIVE))
+    for name in files:
+        os.remove(os.path.join(path, name))
+
+
+def reset_directory(path=None):
+    """Хук on_starting мастера: счетчики прошлого запуска не переносятся."""
+    path = path or directory()
+    for name in os.listdir(path):
+        if name.startswith(ARCHIVE) or _SHARD_FILE.match(name):
+            os.remove(os.path.join(path, name))
+
+
+# ---------- Формат Prometheus ----------
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value == int(value):
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def exposition(values, workers):
+    by_name = {}
+    for (name, labels), value in values.items():
+        by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        if metric.kind != 'histogram':
+            for labels, value in sorted(by_name.get(metric.name, ())):
+                lines.append(f'{metric.name}{_labels(labels)} {_format(value)}')
+            continue
+
+        counts = dict(by_name.get(metric.name + '_count', ()))
+        sums = dict(by_name.get(metric.name + '_sum', ()))
+        buckets = {}
+        for labels, value in by_name.get(metric.name + '_bucket', ()):
+            *base, (_, le) = labels
+            buckets.setdefault(tuple(base), {})[le] = value
+        for base in sorted(counts):
+            cumulative = 0.0
+            for bound in metric.buckets:
+                le = _format(bound)
+                cumulative += buckets.get(base, {}).get(le, 0.0)
+                lines.append(f'{metric.name}_bucket{_labels(base + (("le", le),))} {_format(cumulative)}')
+            lines.append(f'{metric.name}_bucket{_labels(base + (("le", "+Inf"),))} {_format(counts[base])}')
+            lines.append(f'{metric.name}_sum{_labels(base)} {_format(sums.get(base, 0.0))}')
+            lines.append(f'{metric.name}_count{_labels(base)} {_format(counts[base])}')
+
+    lines.append('# HELP fefu_workers Живых процессов, пишущих метрики')
+    lines.append('# TYPE fefu_workers gauge')
+    lines.append(f'fefu_workers {workers}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,271 @@
+"""
+Middleware fefu_lab.
+
+UserContextMiddleware — контекст пользователя на время запроса.
+request.user загружается одним запросом вместе с profile, student_profile и
+instructor_profile (EmailBackend.get_user), а роль кэшируется в сессии.
+Кэш сверяется с profile.updated_at из того же JOIN-а: при смене роли профиль
+сохраняется, метка меняется, и роль перечитывается на следующем запросе.
+
+SQLInstrumentationMiddleware — учет SQL и Server-Timing (см. instrumentation.py).
+
+MetricsMiddleware — метрики Prometheus для /metrics (см. metrics.py).
+
+ReplicaRoutingMiddleware — чтение с реплик БД для читающих запросов (см. routers.py).
+"""
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics, routers
+from .instrumentation import QueryRecorder, check_token, install_render_timer, report, server_timing
+
+sql_logger = logging.getLogger('fefu_lab.sql')
+
+ROLE_SESSION_KEY = '_fefu_role'
+USER_BACKEND = 'fefu_lab.backends.EmailBackend'
+LEGACY_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+
+
+def _role_stamp(profile):
+    return profile.updated_at.isoformat() if profile.updated_at else ''
+
+
+def get_user_role(request):
+    """Роль текущего пользователя (STUDENT/TEACHER/ADMIN) или None."""
+    if not hasattr(request, '_user_role'):
+        request._user_role = _load_role(request)
+    return request._user_role
+
+
+def _load_role(request):
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    profile = getattr(user, 'profile', None)
+    if profile is None:
+        request.session.pop(ROLE_SESSION_KEY, None)
+        return None
+
+    stamp = _role_stamp(profile)
+    cached = request.session.get(ROLE_SESSION_KEY)
+    if cached and cached[0] == user.pk and cached[2] == stamp:
+        return cached[1]
+    request.session[ROLE_SESSION_KEY] = [user.pk, profile.role, stamp]
+    return profile.role
+
+
+def _uses_legacy_backend(backend):
+    return backend == LEGACY_BACKEND and USER_BACKEND in settings.AUTHENTICATION_BACKENDS
+
+
+class UserContextMiddleware:
+    """Ставится сразу после AuthenticationMiddleware. Работает и под WSGI, и под ASGI."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        # Сессии, созданные через ModelBackend, переводим на EmailBackend:
+        # пользователь тот же (поиск по pk), но с профилями в одном запросе
+        session = request.session
+        if _uses_legacy_backend(session.get(BACKEND_SESSION_KEY)):
+            session[BACKEND_SESSION_KEY] = USER_BACKEND
+            if hasattr(request, '_cached_user'):
+                del request._cached_user
+
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        session = request.session
+        if _uses_legacy_backend(await session.aget(BACKEND_SESSION_KEY)):
+            await session.aset(BACKEND_SESSION_KEY, USER_BACKEND)
+            for attr in ('_cached_user', '_acached_user'):
+                if hasattr(request, attr):
+                    delattr(request, attr)
+
+        return await self.get_response(request)
+
+
+def _wrap_connections(stack, recorder):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(recorder))
+
+
+class SQLInstrumentationMiddleware:
+    """
+    Считает и замеряет SQL-запросы запроса, добавляет заголовок Server-Timing
+    (db, render, total) и пишет в лог fefu_lab.sql JSON-отчет о медленных
+    запросах с повторяющимися (N+1) и самыми долгими шаблонами SQL.
+
+    Включается для всех запросов настройкой SQL_INSTRUMENTATION или для
+    отдельных — заголовком SQL_INSTRUMENTATION_HEADER с подписанным токеном
+    (manage.py sql_debug_token). Если не настроено ни то, ни другое,
+    middleware исключается из цепочки при старте.
+
+    Запросы, выполняемые при отдаче StreamingHttpResponse, не учитываются:
+    они идут уже после выхода из middleware.
+
+    Под ASGI обертки ставятся на соединения потока, в котором асинхронный
+    ORM выполняет SQL этого запроса (sync_to_async с thread_sensitive).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.enabled = getattr(settings, 'SQL_INSTRUMENTATION', False)
+        header = getattr(settings, 'SQL_INSTRUMENTATION_HEADER', None)
+        if not self.enabled and not header:
+            raise MiddlewareNotUsed
+        self.meta_key = 'HTTP_' + header.upper().replace('-', '_') if header else None
+        self.token_max_age = getattr(settings, 'SQL_INSTRUMENTATION_TOKEN_MAX_AGE', 3600)
+        self.slow_ms = getattr(settings, 'SQL_INSTRUMENTATION_SLOW_MS', 500)
+        self.repeat_threshold = getattr(settings, 'SQL_INSTRUMENTATION_REPEAT_THRESHOLD', 5)
+        install_render_timer()
+
+    def wanted(self, request):
+        if self.enabled:
+            return True
+        token = request.META.get(self.meta_key)
+        return token is not None and check_token(token, self.token_max_age)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.wanted(request):
+            return self.get_response(request)
+        return self.instrument(request)
+
+    async def __acall__(self, request):
+        if not self.wanted(request):
+            return await self.get_response(request)
+
+        started = time.perf_counter()
+        recorder, stack = QueryRecorder(), ExitStack()
+        await sync_to_async(_wrap_connections)(stack, recorder)
+        try:
+            with recorder:
+                response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, recorder, time.perf_counter() - started)
+
+    def instrument(self, request):
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            recorder = stack.enter_context(QueryRecorder())
+            _wrap_connections(stack, recorder)
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, time.perf_counter() - started)
+
+    def finish(self, request, response, recorder, total):
+        response['Server-Timing'] = server_timing(recorder, total)
+        if total * 1000 >= self.slow_ms:
+            sql_logger.warning(report(request, response, recorder, total, self.repeat_threshold))
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Время ответа, код ответа, число и время SQL по имени view. Ставится как
+    можно раньше, чтобы время включало остальные middleware. Запросы, не
+    дошедшие до URL-резолвера (404 по адресу, статика), учитываются как
+    view="unresolved", чтобы число рядов не зависело от присланных адресов.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        stats, token = metrics.start_request()
+        response = self.get_response(request)
+        self.finish(request, response, stats, token, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        stats, token = metrics.start_request()
+        response = await self.get_response(request)
+        self.finish(request, response, stats, token, started)
+        return response
+
+    def finish(self, request, response, stats, token, started):
+        match = request.resolver_match
+        metrics.finish_request(
+            stats, token,
+            view=match.view_name if match else 'unresolved',
+            method=request.method,
+            status=response.status_code,
+            seconds=time.perf_counter() - started,
+        )
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Ставится перед SessionMiddleware: запросы к БД всех следующих middleware
+    и view маршрутизируются по состоянию запроса. Без DATABASE_REPLICAS
+    отключается.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not getattr(settings, 'DATABASE_REPLICAS', ()):
+            raise MiddlewareNotUsed
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state, token = routers.start_request(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.finish_request(token)
+        return routers.pin_after_write(state, response)
+
+    async def __acall__(self, request):
+        state, token = routers.start_request(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.finish_request(token)
+        return routers.pin_after_write(state, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'use_primary', False):
+            routers.pin_current_request()
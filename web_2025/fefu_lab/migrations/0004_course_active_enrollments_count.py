@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:36
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_active_enrollments_count(apps, schema_editor):
+    Course = apps.get_model('fefu_lab', 'Course')
+    Enrollment = apps.get_model('fefu_lab', 'Enrollment')
+    active = (
+        Enrollment.objects.filter(course=OuterRef('pk'), status='ACTIVE')
+        .order_by()
+        .values('course')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    Course.objects.update(active_enrollments_count=Coalesce(Subquery(active), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fefu_lab', '0003_alter_instructor_options_alter_student_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='active_enrollments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Активных записей'),
+        ),
+        migrations.RunPython(fill_active_enrollments_count, migrations.RunPython.noop),
+    ]
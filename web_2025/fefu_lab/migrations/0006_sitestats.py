@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:39
+
+from django.db import migrations, models
+
+
+def create_site_stats(apps, schema_editor):
+    SiteStats = apps.get_model('fefu_lab', 'SiteStats')
+    Student = apps.get_model('fefu_lab', 'Student')
+    Course = apps.get_model('fefu_lab', 'Course')
+    Instructor = apps.get_model('fefu_lab', 'Instructor')
+    Enrollment = apps.get_model('fefu_lab', 'Enrollment')
+    SiteStats.objects.create(
+        pk=1,
+        active_students=Student.objects.filter(is_active=True).count(),
+        active_courses=Course.objects.filter(is_active=True).count(),
+        active_instructors=Instructor.objects.filter(is_active=True).count(),
+        active_enrollments=Enrollment.objects.filter(status='ACTIVE').count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fefu_lab', '0005_course_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('active_students', models.PositiveIntegerField(default=0, verbose_name='Активных студентов')),
+                ('active_courses', models.PositiveIntegerField(default=0, verbose_name='Активных курсов')),
+                ('active_instructors', models.PositiveIntegerField(default=0, verbose_name='Активных преподавателей')),
+                ('active_enrollments', models.PositiveIntegerField(default=0, verbose_name='Активных записей')),
+            ],
+            options={
+                'verbose_name': 'Статистика сайта',
+                'verbose_name_plural': 'Статистика сайта',
+            },
+        ),
+        migrations.RunPython(create_site_stats, migrations.RunPython.noop),
+    ]
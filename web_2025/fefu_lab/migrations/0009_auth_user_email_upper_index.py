@@ -0,0 +1,25 @@
+from django.db import migrations
+
+INDEX_NAME = 'fefu_lab_auth_user_email_upper'
+
+
+def create_index(apps, schema_editor):
+    # Индекс по выражению для регистронезависимого входа по email (fefu_lab.backends)
+    table = schema_editor.quote_name(apps.get_model('auth', 'User')._meta.db_table)
+    schema_editor.execute(f'CREATE INDEX {INDEX_NAME} ON {table} (UPPER(email))')
+
+
+def drop_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('fefu_lab', '0008_enrollment_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+NAME_INDEX = 'fefu_lab_auth_user_name'
+
+
+def create_name_index(apps, schema_editor):
+    # Списки студентов и преподавателей сортируются по фамилии и имени из auth_user
+    table = schema_editor.quote_name(apps.get_model('auth', 'User')._meta.db_table)
+    schema_editor.execute(f'CREATE INDEX {NAME_INDEX} ON {table} (last_name, first_name, id)')
+
+
+def drop_name_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX IF EXISTS {NAME_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fefu_lab', '0009_auth_user_email_upper_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_name_index, drop_name_index),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at'], name='course_active_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['title', 'id'], name='course_active_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['course', 'status'], name='enrollment_course_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['student', '-enrolled_at'], name='enrollment_student_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='instructor',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user'], name='instructor_active_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user'], name='student_active_user_idx'),
+        ),
+    ]
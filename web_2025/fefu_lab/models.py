@@ -1,15 +1,84 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import Avg, Count, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.urls import reverse
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 
-class UserProfile(models.Model):
+class LoadedStateMixin:
+    """
+    Запоминает значения tracked_fields и выполняет save()/delete() в
+    транзакции, чтобы сигналы могли атомарно пересчитать счетчики по
+    разнице старого и нового состояния.
+
+    Старое состояние перечитывается из строки под блокировкой в начале
+    транзакции, а не берется из копии, загруженной в память: два запроса,
+    загрузившие одну запись и оба снявшие ее с курса, иначе оба вычли бы
+    единицу из счетчика.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_state()
+        return instance
+
+    def _remember_state(self):
+        self._loaded_state = {field: self.__dict__.get(field) for field in self.tracked_fields}
+
+    def loaded_value(self, field, default=None):
+        return getattr(self, '_loaded_state', {}).get(field, default)
+
+    def _lock_loaded_state(self, using, update_fields=None):
+        """Блокирует строку и читает из нее tracked_fields. False — строки уже нет."""
+        attnames = {name: self._meta.get_field(name).attname for name in self.tracked_fields}
+        rows = type(self)._base_manager.using(using).filter(pk=self.pk)
+        if not connections[using].features.has_select_for_update:
+            # SQLite: блокировку на запись берет первый UPDATE транзакции (как _take_slot в enrollments.py)
+            pk_name = self._meta.pk.attname
+            rows.update(**{pk_name: F(pk_name)})
+        row = rows.select_for_update().values(*attnames.values()).first()
+        if row is None:
+            return False
+        self._loaded_state = {name: row[attname] for name, attname in attnames.items()}
+        if update_fields is not None:
+            # Незаписываемые поля остаются как в строке, иначе разница была бы ложной
+            for name, attname in attnames.items():
+                if name not in update_fields and attname not in update_fields:
+                    setattr(self, attname, row[attname])
+        return True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        # post_save отправляется внутри этой транзакции
+        with transaction.atomic(using=using):
+            if self.tracked_fields and not self._state.adding and self.pk is not None:
+                self._lock_loaded_state(using, kwargs.get('update_fields'))
+            super().save(*args, **kwargs)
+        self._remember_state()
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            if self.tracked_fields and not self._lock_loaded_state(using):
+                # Строку уже удалил параллельный запрос: post_delete второй раз не отправляем
+                return 0, {}
+            return super().delete(using=using, keep_parents=keep_parents)
+
+
+class UserProfile(LoadedStateMixin, models.Model):
     ROLE_CHOICES = [
         ('STUDENT', 'Студент'),
         ('TEACHER', 'Преподаватель'),
         ('ADMIN', 'Администратор'),
     ]
-    
+    # Стороны квадратных миниатюр аватара (avatars.py): 1x и 2x для .avatar 100px
+    AVATAR_SIZES = (100, 200)
+    tracked_fields = ('avatar',)
+
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -33,6 +102,12 @@ class UserProfile(models.Model):
         null=True,
         verbose_name='Аватар'
     )
+    avatar_variants = models.JSONField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Миниатюры аватара'
+    )
     bio = models.TextField(
         blank=True,
         verbose_name='О себе'
@@ -47,8 +122,27 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.get_full_name()} ({self.get_role_display()})"
 
+    def _remember_state(self):
+        super()._remember_state()
+        # FieldFile меняется на месте при avatar.save(): запоминаем имя файла
+        avatar = self._loaded_state['avatar']
+        self._loaded_state['avatar'] = getattr(avatar, 'name', avatar) or ''
+
+    def avatar_variant_url(self, size):
+        # Пока миниатюры не готовы, шаблон показывает заглушку, а не оригинал
+        name = (self.avatar_variants or {}).get(str(size))
+        return self._meta.get_field('avatar').storage.url(name) if name else ''
+
+    @property
+    def avatar_url(self):
+        return self.avatar_variant_url(self.AVATAR_SIZES[0])
+
+    @property
+    def avatar_url_2x(self):
+        return self.avatar_variant_url(self.AVATAR_SIZES[1])
+
 # Обновляем модель Student для связи с User
-class Student(models.Model):
+class Student(LoadedStateMixin, models.Model):
     FACULTY_CHOICES = [
         ('CS', 'Кибербезопасность'),
         ('SE', 'Программная инженерия'),
@@ -70,6 +164,8 @@ class Student(models.Model):
         default='CS',
         verbose_name='Факультет'
     )
+    tracked_fields = ('is_active',)
+
     birth_date = models.DateField(null=True, blank=True, verbose_name='Дата рождения')
     student_id = models.CharField(max_length=20, blank=True, verbose_name='Студенческий билет')
     is_active = models.BooleanField(default=True, verbose_name='Активен')
@@ -80,6 +176,10 @@ class Student(models.Model):
         verbose_name = 'Студент'
         verbose_name_plural = 'Студенты'
         ordering = ['user__last_name', 'user__first_name']
+        indexes = [
+            # Только активные: соединение списка с auth_user и счетчик SiteStats
+            models.Index(fields=['user'], condition=Q(is_active=True), name='student_active_user_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.get_full_name()}"
@@ -93,7 +193,7 @@ class Student(models.Model):
         return self.user.email
 
 # Обновляем модель Instructor для связи с User
-class Instructor(models.Model):
+class Instructor(LoadedStateMixin, models.Model):
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -102,6 +202,8 @@ class Instructor(models.Model):
         null=True,  # Добавляем
         blank=True  # Добавляем
     )
+    tracked_fields = ('is_active',)
+
     specialization = models.CharField(max_length=200, verbose_name='Специализация')
     degree = models.CharField(max_length=100, blank=True, verbose_name='Ученая степень')
     bio = models.TextField(blank=True, verbose_name='Биография')
@@ -114,6 +216,9 @@ class Instructor(models.Model):
         verbose_name = 'Преподаватель'
         verbose_name_plural = 'Преподаватели'
         ordering = ['user__last_name', 'user__first_name']
+        indexes = [
+            models.Index(fields=['user'], condition=Q(is_active=True), name='instructor_active_user_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.get_full_name()}"
@@ -126,8 +231,47 @@ class Instructor(models.Model):
     def email(self):
         return self.user.email
 
+class CourseQuerySet(models.QuerySet):
+    def recount_enrollments(self):
+        """Пересчитывает счетчик активных записей одним UPDATE."""
+        active = (
+            Enrollment.objects.filter(course=OuterRef('pk'), status='ACTIVE')
+            .order_by()
+            .values('course')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return self.update(
+            active_enrollments_count=Coalesce(Subquery(active), 0)
+        )
+
+    def with_enrollment_stats(self):
+        """Аннотирует курсы статистикой записей одним GROUP BY запросом."""
+        return self.annotate(
+            active_count=Count('enrollments', filter=Q(enrollments__status='ACTIVE')),
+            completed_count=Count('enrollments', filter=Q(enrollments__status='COMPLETED')),
+            dropped_count=Count('enrollments', filter=Q(enrollments__status='DROPPED')),
+            average_grade=Avg('enrollments__grade'),
+        ).annotate(
+            available_slots=ExpressionWrapper(
+                F('max_students') - F('active_count'),
+                output_field=IntegerField(),
+            ),
+        )
+
+    def adjust_enrollments(self, course_id, delta):
+        """Атомарно сдвигает счетчик активных записей курса на delta."""
+        if course_id is None or not delta:
+            return 0
+        return self.filter(pk=course_id).update(
+            active_enrollments_count=F('active_enrollments_count') + delta
+        )
+
+
 # Восстанавливаем модель Course
-class Course(models.Model):
+class Course(LoadedStateMixin, models.Model):
+    tracked_fields = ('is_active', 'instructor_id')
+
     LEVEL_CHOICES = [
         ('BEGINNER', 'Начальный'),
         ('INTERMEDIATE', 'Средний'),
@@ -167,13 +311,27 @@ class Course(models.Model):
         verbose_name='Стоимость'
     )
     is_active = models.BooleanField(default=True, verbose_name='Активен')
+    # Денормализованный счетчик, поддерживается сигналами Enrollment
+    active_enrollments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Активных записей'
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
 
+    objects = CourseQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Курс'
         verbose_name_plural = 'Курсы'
         ordering = ['title']
+        indexes = [
+            # Главная: последние активные курсы
+            models.Index(fields=['-created_at'], condition=Q(is_active=True), name='course_active_recent_idx'),
+            # Список курсов: keyset-пагинация по (title, id) среди активных
+            models.Index(fields=['title', 'id'], condition=Q(is_active=True), name='course_active_title_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -183,13 +341,15 @@ class Course(models.Model):
 
     @property
     def enrolled_students_count(self):
-        return self.enrollments.filter(status='ACTIVE').count()
+        return self.active_enrollments_count
 
     def is_available(self):
         return self.enrolled_students_count < self.max_students
 
 # Восстанавливаем модель Enrollment
-class Enrollment(models.Model):
+class Enrollment(LoadedStateMixin, models.Model):
+    tracked_fields = ('status', 'course_id')
+
     STATUS_CHOICES = [
         ('ACTIVE', 'Активен'),
         ('COMPLETED', 'Завершен'),
@@ -224,12 +384,21 @@ class Enrollment(models.Model):
         validators=[MinValueValidator(0), MaxValueValidator(5)],
         verbose_name='Оценка'
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
 
     class Meta:
         verbose_name = 'Запись на курс'
         verbose_name_plural = 'Записи на курсы'
         unique_together = ['student', 'course']
         ordering = ['-enrolled_at']
+        indexes = [
+            # Счетчики мест и статистика: записи курса с данным статусом
+            models.Index(fields=['course', 'status'], name='enrollment_course_status_idx'),
+            # Записи студента, новые первыми (кабинет и карточка студента)
+            models.Index(fields=['student', '-enrolled_at'], name='enrollment_student_recent_idx'),
+            # Выгрузки за период (exports.py): диапазон по enrolled_at
+            models.Index(fields=['enrolled_at'], name='enrollment_enrolled_at_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student} - {self.course}"
@@ -239,3 +408,129 @@ class Enrollment(models.Model):
             from django.utils import timezone
             self.completed_at = timezone.now()
         super().save(*args, **kwargs)
+
+
+
+class Waitlist(models.Model):
+    student = models.ForeignKey(
+        Student,
+        on_delete=models.CASCADE,
+        related_name='waitlist_entries',
+        verbose_name='Студент'
+    )
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name='waitlist_entries',
+        verbose_name='Курс'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата постановки в очередь')
+
+    class Meta:
+        verbose_name = 'Лист ожидания'
+        verbose_name_plural = 'Листы ожидания'
+        unique_together = ['student', 'course']
+        ordering = ['created_at', 'id']
+
+    def __str__(self):
+        return f"{self.student} - {self.course} (ожидание)"
+
+class Feedback(models.Model):
+    name = models.CharField(max_length=100, verbose_name='Имя')
+    email = models.EmailField(verbose_name='Email')
+    subject = models.CharField(max_length=200, verbose_name='Тема')
+    message = models.TextField(verbose_name='Сообщение')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата отправки')
+
+    class Meta:
+        verbose_name = 'Сообщение обратной связи'
+        verbose_name_plural = 'Обратная связь'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.name}: {self.subject}"
+
+class Job(models.Model):
+    """Фоновая задача (fefu_lab/jobs.py); выполняется командой run_workers."""
+    STATUS_CHOICES = [
+        ('QUEUED', 'В очереди'),
+        ('RUNNING', 'Выполняется'),
+        ('DONE', 'Выполнена'),
+        ('FAILED', 'Ошибка'),
+    ]
+
+    task = models.CharField(max_length=100, verbose_name='Задача')
+    payload = models.JSONField(default=dict, blank=True, verbose_name='Параметры')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED', verbose_name='Статус')
+    run_at = models.DateTimeField(default=timezone.now, verbose_name='Выполнить не раньше')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток')
+    max_attempts = models.PositiveIntegerField(default=5, verbose_name='Максимум попыток')
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name='Воркер')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Взята в работу')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            # Выборка готовых задач воркером: только строки в очереди
+            models.Index(fields=['run_at', 'id'], condition=Q(status='QUEUED'), name='job_queued_idx'),
+            # Поиск задач зависших воркеров
+            models.Index(fields=['locked_at'], condition=Q(status='RUNNING'), name='job_running_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.get_status_display()})"
+
+class SiteStats(models.Model):
+    """Единственная строка со счетчиками для главной и дашборда администратора."""
+    SINGLETON_PK = 1
+
+    active_students = models.PositiveIntegerField(default=0, verbose_name='Активных студентов')
+    active_courses = models.PositiveIntegerField(default=0, verbose_name='Активных курсов')
+    active_instructors = models.PositiveIntegerField(default=0, verbose_name='Активных преподавателей')
+    active_enrollments = models.PositiveIntegerField(default=0, verbose_name='Активных записей')
+
+    class Meta:
+        verbose_name = 'Статистика сайта'
+        verbose_name_plural = 'Статистика сайта'
+
+    def __str__(self):
+        return 'Статистика сайта'
+
+    @classmethod
+    def compute(cls):
+        return {
+            'active_students': Student.objects.filter(is_active=True).count(),
+            'active_courses': Course.objects.filter(is_active=True).count(),
+            'active_instructors': Instructor.objects.filter(is_active=True).count(),
+            'active_enrollments': Enrollment.objects.filter(status='ACTIVE').count(),
+        }
+
+    @classmethod
+    def rebuild(cls):
+        with transaction.atomic():
+            stats, _ = cls.objects.update_or_create(pk=cls.SINGLETON_PK, defaults=cls.compute())
+        return stats
+
+    @classmethod
+    def load(cls):
+        stats = cls.objects.filter(pk=cls.SINGLETON_PK).first()
+        return stats if stats is not None else cls.rebuild()
+
+    @classmethod
+    async def aload(cls):
+        stats = await cls.objects.filter(pk=cls.SINGLETON_PK).afirst()
+        return stats if stats is not None else await sync_to_async(cls.rebuild)()
+
+    @classmethod
+    def bump(cls, **deltas):
+        """Атомарно сдвигает счетчики: bump(active_students=1, active_enrollments=-1)."""
+        deltas = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        if not cls.objects.filter(pk=cls.SINGLETON_PK).update(**deltas):
+            # Строки еще нет: считаем с нуля, текущее изменение уже видно в транзакции
+            cls.rebuild()
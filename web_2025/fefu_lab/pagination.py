@@ -0,0 +1,165 @@
+import base64
+import binascii
+import json
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps({'v': values, 'r': reverse}, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, reverse = payload['v'], payload['r']
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+    # Курсор приходит от клиента: значения — только скаляры JSON без null
+    if not isinstance(values, list) or not isinstance(reverse, bool):
+        raise InvalidCursor(cursor)
+    if not all(isinstance(value, (str, int, float)) for value in values):
+        raise InvalidCursor(cursor)
+    return values, reverse
+
+
+class KeysetPage:
+    """Страница keyset-пагинации: вместо номера страницы — курсоры соседних страниц."""
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Пагинация по ключу (seek method): каждая страница — это
+    WHERE (поля сортировки) > (значения последней строки) ORDER BY ... LIMIT n,
+    поэтому стоимость не растет с глубиной, в отличие от OFFSET.
+
+    ordering — поля сортировки без знака '-'; tiebreak (уникальное поле, по
+    умолчанию pk) добавляется последним для однозначности. Чтобы страницу
+    обслуживал один индекс, tiebreak берется из той же таблицы, что и поля
+    сортировки (для сортировки по user__last_name — user__id). Поля не должны
+    содержать NULL.
+    """
+
+    def __init__(self, queryset, ordering, per_page, tiebreak='pk'):
+        self.queryset = queryset
+        self.ordering = [*ordering, tiebreak]
+        self.per_page = int(per_page)
+
+    def _row_values(self, row):
+        if isinstance(row, dict):
+            return [row[field] for field in self.ordering]
+        values = []
+        for field in self.ordering:
+            value = row
+            for attr in field.split('__'):
+                value = getattr(value, attr)
+            values.append(value)
+        return values
+
+    def _seek_filter(self, values, reverse):
+        # (a, b, pk) > (x, y, z)  =>  a > x OR (a = x AND b > y) OR (a = x AND b = y AND pk > z)
+        lookup = 'lt' if reverse else 'gt'
+        clauses = []
+        for i, field in enumerate(self.ordering):
+            equal = {f: v for f, v in zip(self.ordering[:i], values[:i])}
+            clauses.append(Q(**equal, **{f'{field}__{lookup}': values[i]}))
+        # Ведущая граница a >= x: по ней СУБД начинает чтение индекса с нужного
+        # места; одно выражение с OR индекс не ограничивает, и страница
+        # просматривала бы его с начала
+        bound = Q(**{f'{self.ordering[0]}__{lookup}e': values[0]})
+        return bound & reduce(lambda a, b: a | b, clauses)
+
+    def _page_queryset(self, cursor):
+        reverse = False
+        queryset = self.queryset
+        if cursor:
+            values, reverse = decode_cursor(cursor)
+            if len(values) != len(self.ordering):
+                raise InvalidCursor(cursor)
+            try:
+                queryset = queryset.filter(self._seek_filter(values, reverse))
+            except (ValueError, TypeError, ValidationError):
+                # Значение не приводится к типу поля (строка вместо pk, неверная дата)
+                raise InvalidCursor(cursor)
+
+        prefix = '-' if reverse else ''
+        queryset = queryset.order_by(*[prefix + field for field in self.ordering])
+        return queryset[:self.per_page + 1], reverse
+
+    def _make_page(self, rows, cursor, reverse):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(cursor)
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor(self._row_values(rows[-1]))
+        if rows and has_previous:
+            previous_cursor = encode_cursor(self._row_values(rows[0]), reverse=True)
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+    def page(self, cursor=None):
+        queryset, reverse = self._page_queryset(cursor)
+        return self._make_page(list(queryset), cursor, reverse)
+
+    async def apage(self, cursor=None):
+        """page() для асинхронных view: строки читаются через async for."""
+        queryset, reverse = self._page_queryset(cursor)
+        return self._make_page([row async for row in queryset], cursor, reverse)
+
+
+class KeysetPaginationMixin:
+    """Подключает KeysetPaginator к ListView вместо стандартной OFFSET-пагинации."""
+
+    paginate_by = 25
+    cursor_ordering = ()
+    cursor_tiebreak = 'pk'
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, self.cursor_ordering, page_size, self.cursor_tiebreak)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise Http404('Неверный курсор страницы')
+        return (paginator, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,131 @@
+"""
+Чтение с реплик PostgreSQL, запись — в основную БД ('default').
+
+Реплики перечислены в settings.DATABASE_REPLICAS (алиасы из DATABASES). На
+реплику идут только чтения внутри запроса, который ReplicaRoutingMiddleware
+отметил как читающий:
+- метод GET/HEAD/OPTIONS;
+- view не помечено @use_primary (запись на курс, регистрация, редактирование
+  профиля читают то, что сами сейчас запишут);
+- клиент не записывал данные последние REPLICA_PIN_SECONDS секунд (cookie
+  REPLICA_PIN_COOKIE): реплика отстает, а пользователь должен видеть свои
+  изменения сразу.
+Команды, воркеры задач и фоновые потоки работают только с основной БД: они
+обычно читают строки, записанные мгновением раньше. Сессии (и кэш сессий
+при промахе) и чтения внутри transaction.atomic() всегда идут в основную БД.
+
+Одна реплика выбирается на весь запрос, чтобы страница не собиралась из
+снимков разной давности. Миграции применяются только к основной БД, реплики
+получают схему репликацией (локально — командой sync_replica).
+"""
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Модели этих приложений всегда читаются из основной БД
+PRIMARY_APPS = {'sessions'}
+
+
+class RoutingState:
+    """Состояние маршрутизации на время запроса (изменяемое: его видят и потоки sync_to_async)."""
+
+    def __init__(self, replica=None):
+        self.replica = replica
+        self.wrote = False
+
+
+_state = ContextVar('fefu_db_routing', default=None)
+
+
+def _choose_replica():
+    replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+    return random.choice(replicas) if replicas else None
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def pin_cookie():
+    return getattr(settings, 'REPLICA_PIN_COOKIE', 'fefu_primary')
+
+
+def is_pinned(request):
+    """Клиент недавно писал в БД и пока читает из основной."""
+    try:
+        return float(request.COOKIES.get(pin_cookie(), 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def start_request(request):
+    """Начинает маршрутизацию запроса; возвращает состояние и токен для finish_request."""
+    replica = None
+    if request.method in SAFE_METHODS and not is_pinned(request):
+        replica = _choose_replica()
+    state = RoutingState(replica)
+    return state, _state.set(state)
+
+
+def finish_request(token):
+    _state.reset(token)
+
+
+def pin_after_write(state, response):
+    """Если запрос писал в БД, клиент читает из основной следующие REPLICA_PIN_SECONDS секунд."""
+    if state.wrote:
+        seconds = pin_seconds()
+        response.set_cookie(
+            pin_cookie(), str(int(time.time()) + seconds), max_age=seconds,
+            httponly=True, samesite='Lax',
+        )
+    return response
+
+
+def use_primary(view_func):
+    """View, которое читает только из основной БД (проверяется в ReplicaRoutingMiddleware.process_view)."""
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        return view_func(*args, **kwargs)
+    wrapper.use_primary = True
+    return wrapper
+
+
+def pin_current_request():
+    """Дальнейшие чтения текущего запроса — из основной БД."""
+    state = _state.get()
+    if state is not None:
+        state.replica = None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or model._meta.app_label in PRIMARY_APPS:
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            # Внутри транзакции основной БД читаем ее же снимок
+            return PRIMARY
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label not in PRIMARY_APPS:
+            # Запись посреди запроса: остаток запроса и следующие запросы клиента
+            # читают из основной БД
+            state.replica = None
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
@@ -0,0 +1,90 @@
+"""
+Полнотекстовый поиск по курсам.
+
+Индекс создается миграцией 0005 и зависит от СУБД:
+- PostgreSQL: генерируемая колонка search_vector (tsvector) с GIN-индексом;
+- SQLite: внешняя FTS5-таблица fefu_lab_course_fts, синхронизируемая триггерами.
+Если индекса нет (например, SQLite собран без FTS5), поиск откатывается на icontains.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Course
+
+COURSE_TABLE = Course._meta.db_table
+FTS_TABLE = f'{COURSE_TABLE}_fts'
+SEARCH_CONFIG = 'russian'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_index_available = {}
+
+
+def has_search_index(using='default'):
+    if using not in _index_available:
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                columns = connection.introspection.get_table_description(cursor, COURSE_TABLE)
+            _index_available[using] = any(col.name == 'search_vector' for col in columns)
+        elif connection.vendor == 'sqlite':
+            _index_available[using] = FTS_TABLE in connection.introspection.table_names()
+        else:
+            _index_available[using] = False
+    return _index_available[using]
+
+
+def _fts5_query(query):
+    # Каждое слово — префиксный терм в кавычках, так пользовательский ввод
+    # не интерпретируется как синтаксис FTS5 (NEAR, OR, двоеточия и т.п.)
+    return ' '.join(f'"{word}"*' for word in _WORD_RE.findall(query))
+
+
+def _postgres_expressions(query):
+    """Возвращает (условие совпадения, выражение релевантности; больше — лучше)."""
+    tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+    match = RawSQL(f'{COURSE_TABLE}.search_vector @@ {tsquery}', (query,), output_field=BooleanField())
+    rank = RawSQL(f'ts_rank_cd({COURSE_TABLE}.search_vector, {tsquery})', (query,), output_field=FloatField())
+    return match, rank
+
+
+def _search(queryset, query, ranked=False):
+    query = query.strip()
+    vendor = connections[queryset.db].vendor
+    if not query or (vendor == 'sqlite' and not _fts5_query(query)):
+        return queryset.none().annotate(rank=Value(0.0)) if ranked else queryset.none()
+    if not has_search_index(queryset.db):
+        queryset = queryset.filter(Q(title__icontains=query) | Q(description__icontains=query))
+        return queryset.annotate(rank=Value(0.0)) if ranked else queryset
+
+    if vendor == 'postgresql':
+        match, rank = _postgres_expressions(query)
+        queryset = queryset.filter(match)
+        return queryset.annotate(rank=rank) if ranked else queryset
+
+    fts_query = _fts5_query(query)
+    if not ranked:
+        return queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (fts_query,))
+        )
+    # Одно соединение с FTS5-таблицей: MATCH выполняется один раз, bm25 считается
+    # для каждой найденной строки в том же проходе (коррелированный подзапрос
+    # повторял бы MATCH для каждого курса). bm25 отрицателен — меньше лучше
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {COURSE_TABLE}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[fts_query],
+        select={'rank': f'-bm25({FTS_TABLE}, 10.0, 1.0)'},
+    )
+
+
+def filter_courses(queryset, query):
+    """Фильтрует queryset курсов по поисковому запросу без ранжирования."""
+    return _search(queryset, query)
+
+
+def search_courses(queryset, query, limit=50):
+    """Возвращает до limit курсов, отсортированных по релевантности (атрибут rank)."""
+    return _search(queryset, query, ranked=True).order_by('-rank', 'title')[:limit]
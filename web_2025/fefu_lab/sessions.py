@@ -0,0 +1,215 @@
+"""
+Сессии в общем кэше с отложенной записью в БД.
+
+Запрос читает и пишет сессию только в кэш (SESSION_CACHE_ALIAS). Изменения
+копятся в очереди процесса, и фоновый поток раз в
+SESSION_WRITE_BEHIND_INTERVAL секунд сбрасывает их в django_session одним
+upsert-ом на пачку. Несколько сохранений одной сессии между сбросами
+схлопываются в одну запись. Сессия без изменений (по сериализованному
+содержимому) не пишется ни в кэш, ни в БД.
+
+Таблица django_session остается источником истины после рестарта: при
+промахе кэша сессия читается из БД, как в cached_db. Удаление (выход,
+смена ключа при входе) выполняется в БД сразу и оставляет в кэше метку:
+сессию с меткой не запишет очередь другого процесса и не прочитает промах
+кэша, поэтому после выхода она не «воскреснет» из таблицы.
+
+SESSION_WRITE_BEHIND_INTERVAL = 0 отключает фоновый поток: запись идет
+синхронно в том же запросе.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.cache import caches
+from django.db import DatabaseError, close_old_connections, connections, transaction
+
+logger = logging.getLogger('fefu_lab.sessions')
+
+KEY_PREFIX = 'fefu_lab.sessions.'
+TOMBSTONE_PREFIX = 'fefu_lab.sessions.deleted.'
+DEFAULT_INTERVAL = 2.0
+DEFAULT_BATCH_SIZE = 500
+
+
+class WriteBehindQueue:
+    """Очередь сессий на запись: session_key -> объект Session с закодированными данными."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._pid = None
+
+    @property
+    def interval(self):
+        return getattr(settings, 'SESSION_WRITE_BEHIND_INTERVAL', DEFAULT_INTERVAL)
+
+    @property
+    def tombstone_timeout(self):
+        return max(60, int(self.interval * 10))
+
+    def put(self, instance):
+        if self.interval <= 0:
+            self.write([instance])
+            return
+        with self._lock:
+            self._pending[instance.session_key] = instance
+            self._ensure_thread()
+
+    def discard(self, session_key):
+        with self._lock:
+            self._pending.pop(session_key, None)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _ensure_thread(self):
+        # После fork (gunicorn --preload) поток родителя в дочернем процессе не живет
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='session-write-behind', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                time.sleep(self.interval)
+                self.flush()
+                # Возвращаем соединение в пул до следующего сброса, как потоки миниатюр
+                close_old_connections()
+        finally:
+            connections.close_all()
+
+    def flush(self):
+        """Сбрасывает накопленные сессии в БД. Возвращает число записанных строк."""
+        with self._lock:
+            batch, self._pending = list(self._pending.values()), {}
+        if not batch:
+            return 0
+
+        batch_size = getattr(settings, 'SESSION_WRITE_BEHIND_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        try:
+            for start in range(0, len(batch), batch_size):
+                self.write(batch[start:start + batch_size])
+        except DatabaseError:
+            logger.exception('Не удалось сохранить %s сессий, повтор при следующем сбросе', len(batch))
+            with self._lock:
+                # Более свежие версии, пришедшие за время записи, не перетираем
+                for instance in batch:
+                    self._pending.setdefault(instance.session_key, instance)
+            return 0
+        return len(batch)
+
+    def write(self, instances):
+        cache = caches[settings.SESSION_CACHE_ALIAS]
+        deleted = cache.get_many([TOMBSTONE_PREFIX + i.session_key for i in instances])
+        instances = [i for i in instances if TOMBSTONE_PREFIX + i.session_key not in deleted]
+        if not instances:
+            return
+        model = type(instances[0])
+        with transaction.atomic(using=model.objects.db):
+            model.objects.bulk_create(
+                instances,
+                update_conflicts=True,
+                unique_fields=['session_key'],
+                update_fields=['session_data', 'expire_date'],
+            )
+
+
+write_behind = WriteBehindQueue()
+# При штатной остановке процесса дописываем очередь
+atexit.register(write_behind.flush)
+
+
+class SessionStore(DBStore):
+    cache_key_prefix = KEY_PREFIX
+
+    def __init__(self, session_key=None):
+        self._cache = caches[settings.SESSION_CACHE_ALIAS]
+        self._snapshot = None
+        super().__init__(session_key)
+
+    @property
+    def cache_key(self):
+        return self.cache_key_prefix + self._get_or_create_session_key()
+
+    def _serialize(self, data):
+        return self.serializer().dumps(data)
+
+    def load(self):
+        try:
+            data = self._cache.get(self.cache_key)
+        except Exception:
+            # Некорректный ключ для бэкенда кэша — как в cached_db, начинаем новую сессию
+            data = None
+
+        if data is None:
+            s = None
+            if self._cache.get(TOMBSTONE_PREFIX + self.session_key) is None:
+                s = self._get_session_from_db()
+            if s:
+                data = self.decode(s.session_data)
+                self._cache.set(self.cache_key, data, self.get_expiry_age(expiry=s.expire_date))
+            else:
+                data = {}
+        self._snapshot = self._serialize(data) if data else None
+        return data
+
+    def exists(self, session_key):
+        # Ключи случайные (32 символа), новые сессии проверяются только по кэшу;
+        # атомарность создания обеспечивает cache.add() в save()
+        return bool(session_key) and (self.cache_key_prefix + session_key) in self._cache
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+
+        data = self._get_session(no_load=must_create)
+        snapshot = self._serialize(data)
+        if not must_create and snapshot == self._snapshot:
+            return
+
+        timeout = self.get_expiry_age()
+        if must_create:
+            if not self._cache.add(self.cache_key, data, timeout):
+                raise CreateError
+        else:
+            self._cache.set(self.cache_key, data, timeout)
+        self._snapshot = snapshot
+        write_behind.put(self.create_model_instance(data))
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        write_behind.discard(session_key)
+        self._cache.set(TOMBSTONE_PREFIX + session_key, 1, write_behind.tombstone_timeout)
+        self._cache.delete(self.cache_key_prefix + session_key)
+        super().delete(session_key)
+
+    async def aload(self):
+        return await sync_to_async(self.load)()
+
+    async def aexists(self, session_key):
+        return await sync_to_async(self.exists)(session_key)
+
+    async def asave(self, must_create=False):
+        return await sync_to_async(self.save)(must_create)
+
+    async def adelete(self, session_key=None):
+        return await sync_to_async(self.delete)(session_key)
+
+    @classmethod
+    def clear_expired(cls):
+        write_behind.flush()
+        super().clear_expired()
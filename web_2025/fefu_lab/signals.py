@@ -0,0 +1,144 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import avatars
+from .dashboards import invalidate_teacher_stats
+from .enrollments import promote_from_waitlist
+from .models import Course, Enrollment, Instructor, SiteStats, Student, UserProfile
+
+# Счетчики SiteStats для моделей с флагом is_active
+ACTIVE_COUNTERS = {
+    Student: 'active_students',
+    Course: 'active_courses',
+    Instructor: 'active_instructors',
+}
+
+
+def _was_active(instance, created):
+    return not created and instance.loaded_value('is_active') is True
+
+
+# ---------- Счетчики активных объектов (SiteStats) ----------
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Instructor)
+def active_object_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    delta = int(bool(instance.is_active)) - int(_was_active(instance, created))
+    SiteStats.bump(**{ACTIVE_COUNTERS[sender]: delta})
+
+
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Instructor)
+def active_object_deleted(sender, instance, **kwargs):
+    if instance.loaded_value('is_active', instance.is_active):
+        SiteStats.bump(**{ACTIVE_COUNTERS[sender]: -1})
+
+
+# ---------- Счетчики активных записей на курс ----------
+@receiver(post_save, sender=Enrollment)
+def enrollment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    was_active = not created and instance.loaded_value('status') == 'ACTIVE'
+    old_course_id = None if created else instance.loaded_value('course_id')
+    is_active = instance.status == 'ACTIVE'
+
+    if old_course_id is not None and old_course_id != instance.course_id:
+        # Запись перенесли на другой курс
+        Course.objects.adjust_enrollments(old_course_id, -int(was_active))
+        Course.objects.adjust_enrollments(instance.course_id, int(is_active))
+        if was_active:
+            promote_from_waitlist(old_course_id)
+    else:
+        Course.objects.adjust_enrollments(instance.course_id, int(is_active) - int(was_active))
+        if was_active and not is_active:
+            promote_from_waitlist(instance.course_id)
+    SiteStats.bump(active_enrollments=int(is_active) - int(was_active))
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, origin=None, **kwargs):
+    # Collector.delete отправляет post_delete внутри своей транзакции
+    if instance.loaded_value('status', instance.status) == 'ACTIVE':
+        Course.objects.adjust_enrollments(instance.course_id, -1)
+        SiteStats.bump(active_enrollments=-1)
+        # При удалении самого курса переводить из листа ожидания некуда
+        if not _deleting_course(origin):
+            promote_from_waitlist(instance.course_id)
+
+
+def _deleting_course(origin):
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is Course
+
+
+# ---------- Кэш дашборда преподавателя ----------
+def _invalidate_for_courses(*course_ids):
+    def invalidate():
+        instructor_ids = (
+            Course.objects.filter(pk__in=[pk for pk in course_ids if pk])
+            .values_list('instructor_id', flat=True)
+        )
+        invalidate_teacher_stats(*instructor_ids)
+    # Сбрасываем после коммита, чтобы параллельный запрос не закэшировал старые данные
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def enrollment_changed(sender, instance, **kwargs):
+    _invalidate_for_courses(instance.course_id, instance.loaded_value('course_id'))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, instance, **kwargs):
+    instructor_ids = (instance.instructor_id, instance.loaded_value('instructor_id'))
+    transaction.on_commit(lambda: invalidate_teacher_stats(*instructor_ids))
+
+
+# ---------- Валидаторы условных GET ----------
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted_touch_parents(sender, instance, **kwargs):
+    # Удаление записи не оставляет своей метки времени: сдвигаем updated_at
+    # курса и студента, чтобы Last-Modified их страниц изменился
+    now = timezone.now()
+    Course.objects.filter(pk=instance.course_id).update(updated_at=now)
+    Student.objects.filter(pk=instance.student_id).update(updated_at=now)
+
+
+# Поля User, которые выводят страницы студента и курса
+DISPLAYED_USER_FIELDS = {'first_name', 'last_name', 'email'}
+
+
+@receiver(post_save, sender=User)
+def user_saved_touch_profiles(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # У auth_user нет метки изменения: правка имени или email сдвигает updated_at
+    # студента и преподавателя, а с ними Last-Modified/ETag страниц курсов
+    if raw or created or (update_fields is not None and not DISPLAYED_USER_FIELDS & set(update_fields)):
+        return
+    now = timezone.now()
+    Student.objects.filter(user_id=instance.pk).update(updated_at=now)
+    Instructor.objects.filter(user_id=instance.pk).update(updated_at=now)
+
+
+# ---------- Миниатюры аватара ----------
+@receiver(post_save, sender=UserProfile)
+def profile_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if (instance.avatar.name or '') != instance.loaded_value('avatar', ''):
+        avatars.schedule(instance)
+
+
+@receiver(post_delete, sender=UserProfile)
+def profile_deleted(sender, instance, **kwargs):
+    profile_id = instance.pk
+    transaction.on_commit(lambda: avatars.cleanup(profile_id))
@@ -0,0 +1,61 @@
+"""Обработчики фоновых задач (jobs.py): письма и сохранение обратной связи."""
+from django.contrib.auth.models import User
+from django.core.mail import mail_admins, send_mail
+
+from .jobs import enqueue, task
+from .models import Course, Feedback, Student
+
+ENROLLMENT_MESSAGES = {
+    'enrolled': ('Запись на курс «{course}»', 'Вы записаны на курс «{course}».'),
+    'waitlisted': (
+        'Лист ожидания курса «{course}»',
+        'Мест на курсе «{course}» сейчас нет. Вы в листе ожидания: как только место '
+        'освободится, мы запишем вас автоматически.',
+    ),
+    'promoted': (
+        'Место на курсе «{course}»',
+        'На курсе «{course}» освободилось место, и вы записаны из листа ожидания.',
+    ),
+}
+
+
+@task()
+def save_feedback(name, email, subject, message):
+    feedback = Feedback.objects.create(name=name, email=email, subject=subject, message=message)
+    # Письмо — отдельной задачей: сбой SMTP повторяет только его, сообщение уже сохранено
+    enqueue('mail_feedback', feedback_id=feedback.pk)
+    return feedback
+
+
+@task()
+def mail_feedback(feedback_id):
+    feedback = Feedback.objects.filter(pk=feedback_id).first()
+    if feedback is None:
+        return
+    mail_admins(
+        f'Обратная связь: {feedback.subject}',
+        f'{feedback.name} <{feedback.email}>\n\n{feedback.message}',
+    )
+
+
+@task()
+def send_welcome_email(user_id):
+    user = User.objects.filter(pk=user_id).first()
+    if user is None or not user.email:
+        return
+    send_mail(
+        'Добро пожаловать в FEFU Lab',
+        f'{user.first_name}, аккаунт {user.username} создан. Войти можно по email или имени пользователя.',
+        None,
+        [user.email],
+    )
+
+
+@task()
+def notify_enrollment(student_id, course_id, kind):
+    student = Student.objects.select_related('user').filter(pk=student_id).first()
+    course = Course.objects.filter(pk=course_id).only('title').first()
+    if student is None or course is None or student.user is None or not student.user.email:
+        return
+    subject, body = ENROLLMENT_MESSAGES[kind]
+    send_mail(subject.format(course=course.title), body.format(course=course.title), None, [student.user.email])
@@ -1,3 +1,1330 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import os
+import shutil
+import smtplib
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth import authenticate
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+from asgiref.sync import async_to_sync
+from PIL import Image
+from web_2025 import pool_sizing
+
+from . import urls as fefu_lab_urls
+from . import async_views, avatars, dashboards, benchmarks, exports, index_audit, jobs, metrics, routers, sessions, views
+from .backends import EmailBackend
+from .enrollments import enroll_student
+from .management.commands.migrate_auth_data import Command as MigrateAuthData
+from .pagination import KeysetPaginator, encode_cursor
+from .search import filter_courses, has_search_index, search_courses
+from .instrumentation import make_token
+from .middleware import ROLE_SESSION_KEY, ReplicaRoutingMiddleware, SQLInstrumentationMiddleware
+from .models import Course, Enrollment, Feedback, Instructor, Job, SiteStats, Student, UserProfile, Waitlist
+
+
+def make_course(slug='python-basics', max_students=30):
+    return Course.objects.create(
+        title=slug, slug=slug, description='Описание', duration=36, max_students=max_students
+    )
+
+
+def make_students(count, prefix='student'):
+    return [
+        Student.objects.create(user=User.objects.create(username=f'{prefix}{i}'))
+        for i in range(count)
+    ]
+
+
+class EmailBackendTests(TestCase):
+    """Вход по email или имени пользователя: один запрос и один хэш на попытку."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivan', 'Ivan.Petrov@fefu.ru', 'password-123')
+        cls.backend = EmailBackend()
+
+    def test_login_by_email_in_any_case_and_by_username(self):
+        for login in ('ivan.petrov@FEFU.RU', 'Ivan.Petrov@fefu.ru', 'ivan'):
+            with self.subTest(login=login), self.assertNumQueries(1):
+                self.assertEqual(self.backend.authenticate(None, username=login, password='password-123'), self.user)
+
+    def test_shared_email_does_not_resolve(self):
+        User.objects.create_user('ivan2', 'ivan.petrov@fefu.ru', 'password-123')
+
+        self.assertIsNone(authenticate(username='ivan.petrov@fefu.ru', password='password-123'))
+        self.assertEqual(authenticate(username='ivan2', password='password-123').username, 'ivan2')
+
+    def test_unknown_user_hashes_once_and_stops_backend_chain(self):
+        with mock.patch.object(User, 'set_password') as dummy_hash, \
+                mock.patch.object(ModelBackend, 'authenticate') as model_backend, \
+                self.assertNumQueries(1):
+            self.assertIsNone(authenticate(username='nobody@fefu.ru', password='password-123'))
+        dummy_hash.assert_called_once_with('password-123')
+        model_backend.assert_not_called()
+
+    def test_wrong_password_returns_none(self):
+        self.assertIsNone(authenticate(username='ivan.petrov@fefu.ru', password='wrong-password'))
+        self.assertIsNone(authenticate(username='ivan', password='wrong-password'))
+
+    def test_get_user_loads_profiles_in_one_query(self):
+        UserProfile.objects.create(user=self.user)
+        Student.objects.create(user=self.user)
+
+        with self.assertNumQueries(1):
+            user = self.backend.get_user(self.user.pk)
+            self.assertIsNotNone(user.profile)
+            self.assertIsNotNone(user.student_profile)
+            self.assertFalse(hasattr(user, 'instructor_profile'))
+
+
+class RoleSessionCacheTests(TestCase):
+    """Роль пользователя кэшируется в сессии и перечитывается при изменении профиля."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('role_user', 'role@fefu.ru', 'password-123')
+        self.profile = UserProfile.objects.create(user=self.user, role='STUDENT')
+        Student.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def get(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name))
+        return response, [query['sql'] for query in queries]
+
+    def test_cached_role_needs_no_profile_query(self):
+        first, first_queries = self.get('student_dashboard')
+        second, second_queries = self.get('student_dashboard')
+
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual(self.client.session[ROLE_SESSION_KEY][:2], [self.user.pk, 'STUDENT'])
+        # Профиль приходит JOIN-ом вместе с пользователем, роль — из сессии
+        self.assertFalse([sql for sql in second_queries if 'FROM "fefu_lab_userprofile"' in sql])
+        # Вторая страница не переписывает сессию
+        self.assertLess(len(second_queries), len(first_queries))
+
+    def test_role_change_invalidates_cached_role(self):
+        self.get('student_dashboard')
+        self.profile.role = 'TEACHER'
+        self.profile.save()
+        Instructor.objects.create(user=self.user, specialization='Python')
+
+        response, _ = self.get('student_dashboard')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith('/login/'))
+        self.assertEqual(self.get('teacher_dashboard')[0].status_code, 200)
+        self.assertEqual(self.client.session[ROLE_SESSION_KEY][1], 'TEACHER')
+
+    def test_anonymous_user_is_sent_to_login(self):
+        self.client.logout()
+        for name in ('student_dashboard', 'teacher_dashboard', 'admin_dashboard'):
+            with self.subTest(page=name):
+                url = reverse(name)
+                self.assertRedirects(self.client.get(url), f'/login/?next={url}', fetch_redirect_response=False)
+
+
+class EnrollmentCapacityTests(TestCase):
+    def setUp(self):
+        self.course = make_course(max_students=2)
+        self.students = make_students(4)
+
+    def test_full_course_goes_to_waitlist(self):
+        for student in self.students[:2]:
+            _, waitlisted = enroll_student(student, self.course)
+            self.assertFalse(waitlisted)
+
+        entry, waitlisted = enroll_student(self.students[2], self.course)
+
+        self.assertTrue(waitlisted)
+        self.assertIsInstance(entry, Waitlist)
+        self.assertEqual(self.course.enrollments.filter(status='ACTIVE').count(), 2)
+
+    def test_repeated_enrollment_is_rejected(self):
+        enroll_student(self.students[0], self.course)
+
+        with self.assertRaises(ValidationError):
+            enroll_student(self.students[0], self.course)
+
+    def test_drop_promotes_first_in_waitlist(self):
+        first, _ = enroll_student(self.students[0], self.course)
+        enroll_student(self.students[1], self.course)
+        enroll_student(self.students[2], self.course)
+        enroll_student(self.students[3], self.course)
+
+        first.status = 'DROPPED'
+        first.save()
+
+        active = set(self.course.enrollments.filter(status='ACTIVE').values_list('student', flat=True))
+        self.assertEqual(active, {self.students[1].pk, self.students[2].pk})
+        self.assertEqual(list(Waitlist.objects.values_list('student', flat=True)), [self.students[3].pk])
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.active_enrollments_count, 2)
+
+    def test_deleting_course_skips_promotion(self):
+        for student in self.students:
+            enroll_student(student, self.course)
+
+        self.course.delete()
+
+        self.assertFalse(Enrollment.objects.exists())
+        self.assertFalse(Waitlist.objects.exists())
+
+
+class EnrollmentCounterTests(TestCase):
+    """Счетчик активных записей считается по строке в БД, а не по устаревшей копии в памяти."""
+
+    def setUp(self):
+        self.course = make_course()
+        self.student = make_students(1)[0]
+        enrollment, _ = enroll_student(self.student, self.course)
+        self.pk = enrollment.pk
+
+    def assertCount(self, expected):
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.active_enrollments_count, expected)
+        self.assertEqual(self.course.enrollments.filter(status='ACTIVE').count(), expected)
+
+    def test_stale_copies_drop_enrollment_once(self):
+        first, second = Enrollment.objects.get(pk=self.pk), Enrollment.objects.get(pk=self.pk)
+        for enrollment in (first, second):
+            enrollment.status = 'DROPPED'
+            enrollment.save()
+        self.assertCount(0)
+
+    def test_update_fields_keep_status_from_row(self):
+        stale = Enrollment.objects.get(pk=self.pk)
+        Enrollment.objects.get(pk=self.pk).delete()
+        Enrollment.objects.create(pk=self.pk, student=self.student, course=self.course, status='DROPPED')
+
+        stale.grade = 5
+        stale.save(update_fields=['grade'])
+        self.assertEqual(stale.status, 'DROPPED')
+        self.assertCount(0)
+
+    def test_stale_copies_delete_enrollment_once(self):
+        first, second = Enrollment.objects.get(pk=self.pk), Enrollment.objects.get(pk=self.pk)
+        first.delete()
+        self.assertEqual(second.delete(), (0, {}))
+        self.assertCount(0)
+
+
+
+class SiteStatsCounterTests(TestCase):
+    """Счетчики SiteStats совпадают с пересчетом и при изменениях через устаревшие копии."""
+
+    def assertStats(self):
+        stats = SiteStats.load()
+        self.assertEqual({field: getattr(stats, field) for field in SiteStats.compute()}, SiteStats.compute())
+
+    def test_stale_copies_change_counters_once(self):
+        students = make_students(3)
+        course = make_course()
+        SiteStats.rebuild()
+
+        first, second = Student.objects.get(pk=students[0].pk), Student.objects.get(pk=students[0].pk)
+        for student in (first, second):
+            student.is_active = False
+            student.save()
+        self.assertEqual(SiteStats.load().active_students, 2)
+
+        stale = Course.objects.get(pk=course.pk)
+        Course.objects.get(pk=course.pk).delete()
+        stale.delete()
+        self.assertStats()
+
+        second.is_active = True
+        second.save()
+        self.assertStats()
+
+
+
+class TeacherStatsCacheTests(TestCase):
+    """Кэш статистики кабинета сбрасывается после коммита изменений записей и курсов."""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.instructor = Instructor.objects.create(
+            user=User.objects.create(username='teacher'), specialization='Программирование',
+        )
+        self.course = make_course()
+        self.course.instructor = self.instructor
+        self.course.save()
+
+    def active_count(self):
+        return dashboards.get_teacher_course_stats(self.instructor.pk)[0]['active_count']
+
+    def test_stats_follow_enrollment_changes(self):
+        self.assertEqual(self.active_count(), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            enroll_student(make_students(1)[0], self.course)
+        self.assertEqual(self.active_count(), 1)
+
+    def test_stats_follow_course_reassignment(self):
+        self.assertEqual(len(dashboards.get_teacher_course_stats(self.instructor.pk)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.instructor = None
+            self.course.save()
+        self.assertEqual(dashboards.get_teacher_course_stats(self.instructor.pk), [])
+
+
+
+class KeysetPaginationTests(TestCase):
+    """Страницы по курсору: без пропусков и повторов при одинаковых значениях сортировки."""
+
+    def walk(self, paginator):
+        pages, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            pages.append([row.pk for row in page])
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        # Обратно по previous_cursor — те же страницы
+        back = [[row.pk for row in page]]
+        while page.has_previous():
+            page = paginator.page(page.previous_cursor)
+            back.append([row.pk for row in page])
+        self.assertEqual(back[::-1], pages)
+        return pages
+
+    def test_pages_cover_ties_in_order(self):
+        for i, title in enumerate(['B', 'A', 'C', 'A', 'B', 'A', 'D']):
+            Course.objects.create(title=title, slug=f'course-{i}', description='', duration=36, max_students=30)
+        queryset = Course.objects.all()
+
+        pages = self.walk(KeysetPaginator(queryset, ('title',), 2))
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        expected = list(queryset.order_by('title', 'pk').values_list('pk', flat=True))
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_student_ties_are_broken_by_user_id(self):
+        # Student.pk и User.pk идут в разном порядке: сортировка по user__id
+        users = [User.objects.create(username=f'u{i}', last_name='Иванов', first_name='Иван') for i in range(5)]
+        users.append(User.objects.create(username='a', last_name='Алексеев', first_name='Петр'))
+        for user in reversed(users):
+            Student.objects.create(user=user)
+        queryset = views.StudentListView().get_queryset()
+
+        pages = self.walk(KeysetPaginator(queryset, views.StudentListView.cursor_ordering, 2, 'user__id'))
+        names = [Student.objects.get(pk=pk).user.username for pk in sum(pages, [])]
+        self.assertEqual(names, ['a', 'u0', 'u1', 'u2', 'u3', 'u4'])
+
+    def test_tampered_cursor_is_not_found(self):
+        make_course()
+        for cursor in [
+            encode_cursor(['python-basics', 'abc']),
+            encode_cursor(['python-basics', None]),
+            encode_cursor([['python-basics'], 1]),
+            encode_cursor(['python-basics']),
+            'не-base64',
+        ]:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('course_list'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+class ApiPaginationTests(TestCase):
+    """Курсоры API: следующая страница и 400 на подделанный курсор."""
+
+    def test_students_are_paged_by_cursor(self):
+        make_students(3)
+        url = reverse('api_student_list')
+        first = self.client.get(url, {'limit': 2}).json()
+        second = self.client.get(url, {'limit': 2, 'cursor': first['next']}).json()
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(sorted(ids), sorted(Student.objects.values_list('pk', flat=True)))
+        self.assertIsNone(second['next'])
+
+    def test_tampered_cursor_is_bad_request(self):
+        make_course()
+        make_students(1)
+        cursors = {
+            'api_course_list': encode_cursor(['python-basics', 'abc']),
+            'api_student_list': encode_cursor(['Иванов', None, 1]),
+            'api_instructor_list': encode_cursor([{}, '', 1]),
+        }
+        for name, cursor in cursors.items():
+            with self.subTest(name):
+                response = self.client.get(reverse(name), {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Неверный курсор'})
+
+
+class CourseSearchTests(TestCase):
+    """Индекс поиска следует за курсами (триггеры FTS5 / генерируемая колонка), ранжирование по релевантности."""
+
+    def setUp(self):
+        if not has_search_index():
+            self.skipTest('СУБД без полнотекстового индекса')
+
+    def search(self, query):
+        return [course.slug for course in search_courses(Course.objects.all(), query)]
+
+    def test_index_follows_insert_update_delete(self):
+        course = make_course('compilers')
+        course.title = 'Компиляторы'
+        course.save()
+        self.assertEqual(self.search('Компиляторы'), ['compilers'])
+        self.assertEqual(list(filter_courses(Course.objects.all(), 'компил')), [course])
+
+        course.title = 'Интерпретаторы'
+        course.save()
+        self.assertEqual(self.search('Компиляторы'), [])
+        self.assertEqual(self.search('Интерпретаторы'), ['compilers'])
+
+        course.delete()
+        self.assertEqual(self.search('Интерпретаторы'), [])
+
+    def test_title_matches_rank_above_description_matches(self):
+        Course.objects.create(
+            title='Базы данных', slug='databases', duration=36, max_students=30,
+            description='Курс использует Python для примеров',
+        )
+        Course.objects.create(
+            title='Python для анализа данных', slug='python-data', duration=36, max_students=30,
+            description='Анализ данных',
+        )
+        results = list(search_courses(Course.objects.all(), 'python'))
+        self.assertEqual([course.slug for course in results], ['python-data', 'databases'])
+        self.assertGreater(results[0].rank, results[1].rank)
+        self.assertEqual(self.search('!!!'), [])
+
+
+class EnrollmentConcurrencyTests(TransactionTestCase):
+    threads = 16
+
+    def test_parallel_enrollments_never_overbook(self):
+        course = make_course(max_students=5)
+        students = make_students(self.threads)
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def worker(student):
+            try:
+                barrier.wait()
+                enroll_student(student, course)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(student,)) for student in students]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Enrollment.objects.filter(course=course, status='ACTIVE').count(), 5)
+        self.assertEqual(Waitlist.objects.filter(course=course).count(), self.threads - 5)
+        course.refresh_from_db()
+        self.assertEqual(course.active_enrollments_count, 5)
+
+    def test_parallel_drops_of_one_enrollment_count_once(self):
+        course = make_course(max_students=5)
+        students = make_students(2)
+        for student in students:
+            enroll_student(student, course)
+        pk = Enrollment.objects.get(student=students[0]).pk
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def worker():
+            try:
+                # Каждый поток загружает запись до того, как другие ее изменят
+                enrollment = Enrollment.objects.get(pk=pk)
+                barrier.wait()
+                enrollment.status = 'DROPPED'
+                enrollment.save()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        course.refresh_from_db()
+        self.assertEqual(course.active_enrollments_count, 1)
+
+
+@override_settings(SESSION_WRITE_BEHIND_INTERVAL=0)
+class ViewBenchmarkTests(TestCase):
+    """Быстрый прогон benchmark_views: все маршруты, все роли, бюджеты числа запросов."""
+
+    budgets_path = os.path.join(settings.BASE_DIR, 'benchmarks', 'budgets.json')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ctx = benchmarks.build_dataset(students=150, courses=12, density=2.0, seed='tests')
+
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual(benchmarks.missing_routes(), [])
+
+    def test_views_fit_query_budgets(self):
+        results = benchmarks.run(self.ctx, iterations=2)
+
+        self.assertEqual(len(results), len(benchmarks.ROUTES) * len(benchmarks.ROLES))
+        # Время ответа в тестах нестабильно, проверяется командой benchmark_views
+        violations = benchmarks.check_budgets(
+            results, benchmarks.load_budgets(self.budgets_path), latency=False
+        )
+        self.assertEqual(violations, [])
+
+    def test_percentile_uses_nearest_rank(self):
+        samples = list(range(1, 101))
+        self.assertEqual(benchmarks.percentile(samples, 50), 50)
+        self.assertEqual(benchmarks.percentile(samples, 99), 99)
+        self.assertEqual(benchmarks.percentile([7], 95), 7)
+
+
+class CourseDetailQueryTests(TestCase):
+    """Страница курса: число запросов не зависит от числа записанных студентов."""
+
+    students = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = make_course(max_students=cls.students)
+        users = User.objects.bulk_create(
+            User(username=f'roster{i}', first_name='Студент', last_name=f'№{i}') for i in range(cls.students)
+        )
+        students = Student.objects.bulk_create(Student(user=user) for user in users)
+        Enrollment.objects.bulk_create(Enrollment(student=student, course=cls.course) for student in students)
+
+    def test_roster_is_rendered_with_constant_queries(self):
+        # Валидатор conditional_page, курс с преподавателем, записи вместе со студентами и User
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('course_detail', args=[self.course.slug]))
+        self.assertEqual(len(response.context['enrollments']), self.students)
+        self.assertContains(response, f'Студент №{self.students - 1}')
+
+
+class ConditionalPageTests(TestCase):
+    """Детальные страницы отвечают 304, пока не изменились показанные на них данные."""
+
+    def setUp(self):
+        self.course = make_course()
+        (self.student,) = make_students(1)
+        self.user = self.student.user
+        enroll_student(self.student, self.course)
+
+    def assert_changes_after_rename(self, url):
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Вход обновляет только last_login: страница остается прежней
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.user.first_name, self.user.last_name = 'Мария', 'Новикова'
+        self.user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Мария Новикова')
+
+    def test_student_page_changes_after_user_rename(self):
+        self.assert_changes_after_rename(reverse('student_detail', args=[self.student.pk]))
+
+    def test_course_page_changes_after_student_rename(self):
+        self.assert_changes_after_rename(reverse('course_detail', args=[self.course.slug]))
+
+
+class AsyncPublicViewsTests(TestCase):
+    """ASYNC_PUBLIC_VIEWS: асинхронные страницы отдают то же, что синхронные."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = make_course()
+        for i in range(30):
+            make_course(f'course-{i:02}')
+        cls.student, other = make_students(2)
+        enroll_student(cls.student, cls.course)
+        enroll_student(other, cls.course)
+
+    def setUp(self):
+        self.pages = {
+            'home': (reverse('home'), ('total_students', 'total_courses', 'total_instructors', 'recent_courses')),
+            'student_detail': (reverse('student_detail', args=[self.student.pk]), ('student', 'enrollments')),
+            'course_list': (reverse('course_list'), ('courses', 'is_paginated')),
+            'course_detail': (reverse('course_detail', args=[self.course.slug]), ('course', 'enrollments', 'available_slots')),
+        }
+
+    def use_async_views(self):
+        # urls.py выбирает модуль view при импорте: перечитываем его с настройкой и обратно
+        async_settings = override_settings(ASYNC_PUBLIC_VIEWS=True)
+        async_settings.enable()
+        self.reload_urls()
+        self.addCleanup(self.reload_urls)
+        self.addCleanup(async_settings.disable)
+
+    def reload_urls(self):
+        importlib.reload(fefu_lab_urls)
+        # include() в корневом urls.py держит разобранные маршруты приложения
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+        clear_url_caches()
+
+    def get(self, url, **headers):
+        return async_to_sync(self.async_client.get)(url, headers=headers)
+
+    def snapshot(self, response, keys):
+        return {
+            key: list(value) if hasattr(value, '__iter__') and not isinstance(value, str) else value
+            for key, value in ((key, response.context[key]) for key in keys)
+        }
+
+    def test_async_views_render_same_context_as_sync(self):
+        expected = {}
+        for name, (url, keys) in self.pages.items():
+            response = self.client.get(url)
+            expected[name] = (response.status_code, response.templates[0].name, self.snapshot(response, keys))
+
+        self.use_async_views()
+        for name, (url, keys) in self.pages.items():
+            with self.subTest(page=name):
+                self.assertEqual(resolve(url).func.__module__, async_views.__name__)
+                response = self.get(url)
+                self.assertEqual(
+                    (response.status_code, response.templates[0].name, self.snapshot(response, keys)),
+                    expected[name],
+                )
+
+    def test_async_course_list_follows_cursors(self):
+        self.use_async_views()
+        first = self.get(reverse('course_list')).context['page_obj']
+        self.assertEqual(len(first), 24)
+        self.assertTrue(first.has_next())
+
+        second = self.get(f"{reverse('course_list')}?cursor={first.next_cursor}").context['page_obj']
+        titles = [course.title for course in list(first) + list(second)]
+        self.assertEqual(titles, list(Course.objects.order_by('title', 'pk').values_list('title', flat=True)))
+        self.assertFalse(second.has_next())
+
+        back = self.get(f"{reverse('course_list')}?cursor={second.previous_cursor}").context['page_obj']
+        self.assertEqual([course.pk for course in back], [course.pk for course in first])
+        self.assertEqual(self.get(f"{reverse('course_list')}?cursor=broken").status_code, 404)
+
+    def test_async_detail_pages_answer_conditional_get(self):
+        self.use_async_views()
+        for name in ('student_detail', 'course_detail'):
+            url = self.pages[name][0]
+            with self.subTest(page=name):
+                etag = self.get(url)['ETag']
+                self.assertEqual(self.get(url, if_none_match=etag).status_code, 304)
+
+
+class SQLInstrumentationTests(TestCase):
+    """Server-Timing и отчет о медленных запросах — только с подписанным токеном."""
+
+    def get(self, token=None):
+        headers = {'X-SQL-Debug': token} if token is not None else {}
+        return self.client.get(reverse('course_list'), headers=headers)
+
+    def test_header_requires_valid_token(self):
+        self.assertNotIn('Server-Timing', self.get())
+        self.assertNotIn('Server-Timing', self.get('sql'))
+        self.assertNotIn('Server-Timing', self.get(make_token() + 'x'))
+        expired = make_token()
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 7200):
+            self.assertNotIn('Server-Timing', self.get(expired))
+
+        timing = self.get(make_token())['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", render;dur=[\d.]+, total;dur=[\d.]+$')
+
+    @override_settings(SQL_INSTRUMENTATION=True, SQL_INSTRUMENTATION_SLOW_MS=0, SQL_INSTRUMENTATION_REPEAT_THRESHOLD=3)
+    def test_repeated_queries_are_reported(self):
+        courses = [make_course(f'course-{i}') for i in range(4)]
+
+        def view(request):
+            # N+1: отдельный запрос на каждый курс
+            for course in courses:
+                Course.objects.filter(pk=course.pk).exists()
+            SiteStats.load()
+            return HttpResponse()
+
+        middleware = SQLInstrumentationMiddleware(view)
+        with self.assertLogs('fefu_lab.sql', 'WARNING') as logs:
+            response = middleware(RequestFactory().get('/courses/'))
+
+        self.assertIn('queries"', response['Server-Timing'])
+        report = json.loads(logs.records[0].getMessage())
+        self.assertEqual(report['path'], '/courses/')
+        self.assertEqual([pattern['count'] for pattern in report['repeated']], [4])
+        self.assertIn('"fefu_lab_course"."id" = ?', report['repeated'][0]['sql'])
+
+
+class IndexAuditTests(TestCase):
+    """audit_indexes на небольших данных: страницы не просматривают большие таблицы целиком."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ctx = benchmarks.build_dataset(students=1000, courses=20, density=2.0, seed='tests')
+
+    def test_pages_do_not_scan_large_tables(self):
+        index_audit.analyze()
+        queries = index_audit.collect(self.ctx)
+        findings = index_audit.audit(queries, min_rows=500)
+        self.assertEqual([(f['route'], f['table'], f['plan']) for f in findings], [])
+
+
+class MetricsTests(TestCase):
+    """/metrics: формат Prometheus и объединение файлов метрик нескольких процессов."""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        # pid завершившегося процесса — «умерший воркер»
+        process = subprocess.Popen(['true'])
+        process.wait()
+        self.dead_pid = process.pid
+
+    def write(self, pid, entries):
+        shard = metrics.Shard(os.path.join(self.path, f'{pid}_0.db'))
+        for metric, labels, value in entries:
+            shard.inc(metric.key(labels), value)
+        shard.close()
+
+    def test_endpoint_reports_view_histograms(self):
+        self.client.get('/')
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('fefu_http_requests_total{view="home",method="GET",status="200"}', body)
+        self.assertIn('fefu_http_request_duration_seconds_bucket{view="home",le="+Inf"}', body)
+        self.assertIn('fefu_db_queries_per_request_count{view="home"}', body)
+
+    def test_processes_are_summed_and_survive_worker_exit(self):
+        live_pid = os.getpid()
+        self.write(live_pid, [
+            (metrics.REQUESTS, ('home', 'GET', '200'), 3),
+            (metrics.WORKER_IN_FLIGHT, (live_pid,), 1),
+        ])
+        self.write(self.dead_pid, [
+            (metrics.REQUESTS, ('home', 'GET', '200'), 2),
+            (metrics.WORKER_IN_FLIGHT, (self.dead_pid,), 4),
+        ])
+        requests = metrics.REQUESTS.key(('home', 'GET', '200'))
+
+        values, workers = metrics.collect(self.path)
+        self.assertEqual(values[requests], 5)
+        self.assertEqual(workers, 1)
+        # Датчики умершего процесса не показываются
+        self.assertNotIn(metrics.WORKER_IN_FLIGHT.key((self.dead_pid,)), values)
+
+        metrics.mark_process_dead(self.dead_pid, self.path)
+        self.assertFalse(os.path.exists(os.path.join(self.path, f'{self.dead_pid}_0.db')))
+        values, _ = metrics.collect(self.path)
+        self.assertEqual(values[requests], 5)
+        self.assertEqual(values[metrics.WORKER_EXITS.key(())], 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        sum_key, count_key, bucket_keys = metrics.DB_QUERIES._keys_for(('home',))
+        buckets = dict(zip(metrics.DB_QUERIES.buckets, bucket_keys))
+        # Наблюдения 0, 2, 2 и 5000: в файлах корзины хранятся без накопления
+        values = {sum_key: 5004, count_key: 4, buckets[0]: 1, buckets[2]: 2}
+
+        body = metrics.exposition(values, workers=1)
+        self.assertIn('fefu_db_queries_per_request_bucket{view="home",le="0"} 1\n', body)
+        self.assertIn('fefu_db_queries_per_request_bucket{view="home",le="2"} 3\n', body)
+        self.assertIn('fefu_db_queries_per_request_bucket{view="home",le="1000"} 3\n', body)
+        self.assertIn('fefu_db_queries_per_request_bucket{view="home",le="+Inf"} 4\n', body)
+        self.assertIn('fefu_db_queries_per_request_sum{view="home"} 5004\n', body)
+
+
+def make_photo(size=(1200, 800), color='red'):
+    """JPEG с EXIF: поворот на 90° и координаты, как у фото с телефона."""
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: повернуть на 90° по часовой
+    exif[0x8825] = {2: (43.0, 1.0, 0.0)}  # GPSInfo: широта
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG', exif=exif)
+    return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+class AvatarTests(TestCase):
+    """Миниатюры аватара: строятся после сохранения формы, без метаданных, старые удаляются."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_settings = override_settings(MEDIA_ROOT=media, AVATAR_WORKERS=0)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.storage = UserProfile._meta.get_field('avatar').storage
+
+        self.user = User.objects.create_user('avatar_user', 'avatar@fefu.ru', 'password-123')
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def upload(self, avatar):
+        data = {'first_name': 'Анна', 'last_name': 'Иванова', 'email': 'avatar@fefu.ru'}
+        data.update(avatar)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('profile_edit'), data)
+        self.assertEqual(response.status_code, 302)
+        self.profile.refresh_from_db()
+        return self.profile.avatar_variants
+
+    def test_upload_builds_square_variants_without_metadata(self):
+        variants = self.upload({'avatar': make_photo()})
+
+        self.assertEqual(set(variants), {str(size) for size in UserProfile.AVATAR_SIZES})
+        for size, name in variants.items():
+            with self.storage.open(name) as f, Image.open(f) as image:
+                self.assertEqual(image.format, 'WEBP')
+                self.assertEqual(image.size, (int(size), int(size)))
+                self.assertEqual(dict(image.getexif()), {})
+                self.assertNotIn('icc_profile', image.info)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.profile.avatar_url, self.storage.url(variants['100']))
+        response = self.client.get(reverse('profile'))
+        self.assertContains(response, self.profile.avatar_url_2x)
+        self.assertNotContains(response, self.profile.avatar.url)
+
+    def test_changing_avatar_removes_stale_variants(self):
+        old = self.upload({'avatar': make_photo(color='red')})
+        new = self.upload({'avatar': make_photo(color='blue')})
+
+        self.assertNotEqual(set(old.values()), set(new.values()))
+        _, files = self.storage.listdir(avatars.variants_dir(self.profile.pk))
+        self.assertEqual(sorted(files), sorted(name.rsplit('/', 1)[1] for name in new.values()))
+
+        self.upload({'avatar-clear': 'on'})
+        self.assertIsNone(self.profile.avatar_variants)
+        self.assertEqual(self.storage.listdir(avatars.variants_dir(self.profile.pk))[1], [])
+
+    def test_outdated_job_discards_its_variants(self):
+        current = self.upload({'avatar': make_photo(color='blue')})
+        self.profile.avatar.save('old.jpg', make_photo(color='red'), save=False)
+
+        # Задача для версии, которую уже заменили: профиль не меняется
+        avatars.process(self.profile.pk, self.profile.avatar.name)
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.avatar_variants, current)
+        _, files = self.storage.listdir(avatars.variants_dir(self.profile.pk))
+        self.assertEqual(len(files), len(current))
+
+    def test_oversized_upload_is_rejected(self):
+        with override_settings(AVATAR_MAX_UPLOAD_SIZE=1024):
+            response = self.client.post(reverse('profile_edit'), {
+                'email': 'avatar@fefu.ru', 'avatar': make_photo(),
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(UserProfile.objects.get(pk=self.profile.pk).avatar)
+
+
+class JobQueueTests(TestCase):
+    """Фоновые задачи: запросы только ставят задачи, воркер выполняет их с повторами."""
+
+    def test_feedback_is_saved_by_worker(self):
+        response = self.client.post(reverse('feedback'), {
+            'name': 'Анна', 'email': 'anna@fefu.ru', 'subject': 'Вопрос', 'message': 'Когда начнется курс?',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Feedback.objects.exists())
+        with override_settings(ADMINS=[('FEFU Lab', 'admin@fefu.ru')]):
+            # Сохранение, затем письмо администраторам отдельной задачей
+            self.assertEqual(jobs.run_pending(), 2)
+        self.assertEqual(Feedback.objects.get().subject, 'Вопрос')
+        self.assertEqual(list(Job.objects.values_list('status', flat=True)), ['DONE', 'DONE'])
+        self.assertEqual(mail.outbox[0].to, ['admin@fefu.ru'])
+
+    def test_feedback_survives_mail_failure(self):
+        jobs.enqueue('save_feedback', name='Анна', email='anna@fefu.ru', subject='Вопрос', message='Когда начнется курс?')
+
+        with mock.patch('fefu_lab.tasks.mail_admins', side_effect=smtplib.SMTPException('недоступен')), \
+                self.assertLogs('fefu_lab.jobs', 'WARNING'):
+            jobs.run_pending()
+
+        self.assertEqual(Feedback.objects.get().subject, 'Вопрос')
+        statuses = dict(Job.objects.values_list('task', 'status'))
+        self.assertEqual(statuses, {'save_feedback': 'DONE', 'mail_feedback': 'QUEUED'})
+
+    def test_registration_sends_welcome_email_in_background(self):
+        response = self.client.post(reverse('register'), {
+            'username': 'new_student', 'email': 'new@fefu.ru', 'first_name': 'Иван', 'last_name': 'Петров',
+            'password1': 'Sl0zhnyi-parol', 'password2': 'Sl0zhnyi-parol', 'role': 'STUDENT',
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Student.objects.filter(user__username='new_student').exists())
+        self.assertEqual(mail.outbox, [])
+        jobs.run_pending()
+        self.assertEqual(mail.outbox[0].to, ['new@fefu.ru'])
+
+    def test_enrollment_and_promotion_notify_students(self):
+        course = make_course(max_students=1)
+        first, second = make_students(2)
+        for student in (first, second):
+            student.user.email = f'{student.user.username}@fefu.ru'
+            student.user.save()
+        enrollment, _ = enroll_student(first, course)
+        enroll_student(second, course)
+        enrollment.status = 'DROPPED'
+        enrollment.save()
+
+        self.assertEqual(jobs.run_pending(), 3)
+        self.assertEqual(
+            [(message.to[0], message.subject) for message in mail.outbox],
+            [
+                ('student0@fefu.ru', 'Запись на курс «python-basics»'),
+                ('student1@fefu.ru', 'Лист ожидания курса «python-basics»'),
+                ('student1@fefu.ru', 'Место на курсе «python-basics»'),
+            ],
+        )
+
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        course, (student,) = make_course(), make_students(1)
+        student.user.email = 'student0@fefu.ru'
+        student.user.save()
+        job = jobs.enqueue('notify_enrollment', student_id=student.pk, course_id=course.pk, kind='unknown')
+        Job.objects.filter(pk=job.pk).update(max_attempts=2)
+
+        with self.assertLogs('fefu_lab.jobs', 'WARNING'):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('QUEUED', 1))
+        self.assertIn('KeyError', job.last_error)
+        self.assertGreater(job.run_at, job.locked_at or job.created_at)
+        # Задержка не истекла: воркер задачу не берет
+        self.assertEqual(jobs.run_pending(), 0)
+
+        Job.objects.filter(pk=job.pk).update(run_at=job.created_at)
+        with self.assertLogs('fefu_lab.jobs', 'ERROR'):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('FAILED', 2))
+
+    def test_claimed_job_is_not_handed_out_twice(self):
+        job = jobs.enqueue('send_welcome_email', user_id=0)
+
+        self.assertEqual(jobs.claim('first'), [job])
+        self.assertEqual(jobs.claim('second'), [])
+        # Воркер пропал: после таймаута задача возвращается в очередь
+        self.assertEqual(jobs.requeue_stale(timeout=-1), (1, 0))
+        self.assertEqual([j.locked_by for j in jobs.claim('second')], ['second'])
+
+    def test_retry_delay_grows_exponentially_up_to_limit(self):
+        with override_settings(JOB_RETRY_BASE_DELAY=10, JOB_RETRY_MAX_DELAY=60):
+            self.assertTrue(5 <= jobs.retry_delay(1) <= 10)
+            self.assertTrue(20 <= jobs.retry_delay(3) <= 40)
+            self.assertTrue(30 <= jobs.retry_delay(10) <= 60)
+
+
+class ImportEnrollmentsTests(TestCase):
+    """import_enrollments: построчная проверка CSV, пропуск дубликатов, пересчет счетчиков."""
+
+    rows = [
+        'student_id,course,status,grade,completed_at',
+        'S1,python-basics,ACTIVE,4,',
+        'S2,python-basics,COMPLETED,"4,5",2025-06-01 10:00',
+        'S1,python-basics,ACTIVE,,',
+        'S9,python-basics,,,',
+        'S2,no-such-course,,,',
+        'S3,python-basics,,nan,',
+        'S3,python-basics,,7,',
+        'S3,python-basics,DONE,,',
+        'S3,python-basics,,,not-a-date',
+        'S3,python-basics,DROPPED,,',
+    ]
+
+    def setUp(self):
+        self.course = make_course()
+        for student, code in zip(make_students(3), ('S1', 'S2', 'S3')):
+            student.student_id = code
+            student.save()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def run_import(self, rows):
+        source = os.path.join(self.path, 'enrollments.csv')
+        rejects = os.path.join(self.path, 'rejects.csv')
+        with open(source, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(rows) + '\n')
+        out = io.StringIO()
+        call_command('import_enrollments', source, '--batch-size', '2', '--rejects', rejects, stdout=out)
+        with open(rejects, encoding='utf-8') as f:
+            return out.getvalue(), [row.split(',')[:2] for row in f.read().splitlines()[1:]]
+
+    def test_invalid_rows_are_rejected_and_valid_rows_imported(self):
+        output, rejects = self.run_import(self.rows)
+
+        self.assertEqual(rejects, [
+            ['5', 'неизвестный student_id'],
+            ['6', 'неизвестный курс'],
+            ['7', 'некорректная оценка'],
+            ['8', 'оценка вне диапазона 0-5'],
+            ['9', 'неизвестный статус DONE'],
+            ['10', 'некорректная дата завершения'],
+        ])
+        self.assertIn('Добавлено: 3, уже существовало: 1, отклонено: 6', output)
+        self.assertEqual(
+            sorted(Enrollment.objects.values_list('student__student_id', 'status')),
+            [('S1', 'ACTIVE'), ('S2', 'COMPLETED'), ('S3', 'DROPPED')],
+        )
+
+    def test_completed_at_and_grade_are_parsed(self):
+        self.run_import(self.rows[:3])
+
+        completed = Enrollment.objects.get(student__student_id='S2')
+        self.assertEqual(completed.grade, Decimal('4.5'))
+        self.assertEqual(completed.completed_at, timezone.make_aware(datetime(2025, 6, 1, 10, 0)))
+        self.assertIsNone(Enrollment.objects.get(student__student_id='S1').completed_at)
+
+    def test_repeated_import_skips_duplicates_and_recounts_courses(self):
+        self.run_import(self.rows)
+        output, _ = self.run_import(self.rows)
+
+        self.assertIn('Добавлено: 0, уже существовало: 4, отклонено: 6', output)
+        self.assertEqual(Enrollment.objects.count(), 3)
+        # bulk_create обходит сигналы: счетчик пересчитан командой
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.active_enrollments_count, 1)
+        self.assertEqual(SiteStats.load().active_enrollments, 1)
+
+
+class EnrollmentExportTests(TestCase):
+    """Выгрузки записей: только для персонала, потоковый ответ, фильтры по границам дня."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course, cls.other_course = make_course(), make_course('django-intro')
+        students = make_students(4)
+        enrolled = [
+            (students[0], cls.course, datetime(2025, 3, 1, 0, 0)),
+            (students[1], cls.course, datetime(2025, 3, 10, 23, 59)),
+            (students[2], cls.course, datetime(2025, 3, 11, 0, 0)),
+            (students[3], cls.other_course, datetime(2025, 3, 5, 12, 0)),
+        ]
+        for student, course, enrolled_at in enrolled:
+            enrollment, _ = enroll_student(student, course)
+            Enrollment.objects.filter(pk=enrollment.pk).update(enrolled_at=timezone.make_aware(enrolled_at))
+        cls.staff = User.objects.create_user('staff', 'staff@fefu.ru', 'password-123', is_staff=True)
+
+    def export(self, query='', dataset='enrollments', fmt='csv'):
+        self.client.force_login(self.staff)
+        return self.client.get(reverse('export', args=[dataset, fmt]) + query)
+
+    def rows(self, response):
+        return [line.split(',') for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_export_requires_staff(self):
+        url = reverse('export', args=['enrollments', 'csv'])
+        self.assertRedirects(self.client.get(url), f'/login/?next={url}', fetch_redirect_response=False)
+        self.client.force_login(User.objects.create_user('student', 'student@fefu.ru', 'password-123'))
+        self.assertRedirects(self.client.get(url), f'/login/?next={url}', fetch_redirect_response=False)
+
+    def test_csv_is_streamed_with_header(self):
+        response = self.export()
+
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = self.rows(response)
+        self.assertEqual(rows[0], [name for name, _ in exports.DATASETS['enrollments']])
+        self.assertEqual(len(rows), 5)
+
+    def test_filters_by_course_and_whole_days(self):
+        # Граница периода включает весь день date_to и не захватывает следующий
+        rows = self.rows(self.export('?course=python-basics&date_from=2025-03-01&date_to=2025-03-10'))
+        self.assertEqual([row[5] for row in rows[1:]], ['python-basics'] * 2)
+        self.assertEqual([row[8][:10] for row in rows[1:]], ['2025-03-01', '2025-03-10'])
+
+        self.assertEqual(len(self.rows(self.export('?date_from=2025-03-05&date_to=2025-03-05'))), 2)
+        self.assertEqual(self.export('?date_from=2025-03-10&date_to=2025-03-01').status_code, 400)
+        self.assertEqual(self.export(fmt='xml').status_code, 404)
+
+    def test_date_range_does_not_cast_column(self):
+        queryset = exports.export_queryset('enrollments', date_from=date(2025, 3, 1), date_to=date(2025, 3, 10))
+        self.assertNotIn('django_datetime_cast_date', str(queryset.query))
+
+    def test_command_uses_same_filters(self):
+        out = io.StringIO()
+        call_command(
+            'export_enrollments', '--dataset', 'roster', '--format', 'jsonl',
+            '--course', 'django-intro', '--status', 'ACTIVE', stdout=out,
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn('"course":"django-intro"', lines[0])
+
+        with self.assertRaises(CommandError):
+            call_command('export_enrollments', '--from', '2025-03-10', '--to', '2025-03-01', stdout=io.StringIO())
+
+
+class MigrateAuthDataTests(TestCase):
+    """migrate_auth_data: блоки в отдельных транзакциях, продолжение с контрольной точки."""
+
+    def setUp(self):
+        self.students = [Student.objects.create() for _ in range(5)]
+        self.instructors = [Instructor.objects.create(specialization='Python') for _ in range(2)]
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.checkpoint = os.path.join(path, 'checkpoint.json')
+
+    def migrate(self):
+        out, err = io.StringIO(), io.StringIO()
+        call_command(
+            'migrate_auth_data', '--batch-size', '2', '--checkpoint', self.checkpoint, stdout=out, stderr=err,
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        class Interrupted(Exception):
+            pass
+
+        original = MigrateAuthData.link_chunk
+        calls, interrupt_at = [], [2]
+
+        def link_chunk(command, *args, **kwargs):
+            calls.append(args[1])
+            if len(calls) in interrupt_at:
+                raise Interrupted
+            return original(command, *args, **kwargs)
+
+        with mock.patch.object(MigrateAuthData, 'link_chunk', link_chunk), self.assertRaises(Interrupted):
+            self.migrate()
+        # Первый блок зафиксирован, второй откатился вместе со своей транзакцией
+        with open(self.checkpoint, encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {'student': self.students[1].pk})
+        self.assertEqual(Student.objects.filter(user__isnull=False).count(), 2)
+
+        calls.clear()
+        interrupt_at.clear()
+        with mock.patch.object(MigrateAuthData, 'link_chunk', link_chunk):
+            self.migrate()
+        # Продолжение начинается после контрольной точки: первый блок не перечитывается
+        self.assertEqual([obj.pk for obj in calls[0]], [self.students[2].pk, self.students[3].pk])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+        self.assertFalse(Student.objects.filter(user__isnull=True).exists())
+        self.assertFalse(Instructor.objects.filter(user__isnull=True).exists())
+        self.assertEqual(User.objects.count(), 7)
+        self.assertEqual(UserProfile.objects.count(), 7)
+        self.assertEqual(
+            sorted(Student.objects.values_list('user__username', flat=True)),
+            sorted(f'student_{student.pk}' for student in self.students),
+        )
+
+    def test_existing_usernames_are_reused_or_skipped(self):
+        first, second = self.students[:2]
+        # Пользователь от прошлого запуска без профиля — переиспользуется
+        leftover = User.objects.create(username=f'student_{first.pk}')
+        # Имя занято пользователем преподавателя — студент пропускается
+        taken = User.objects.create(username=f'student_{second.pk}')
+        Instructor.objects.create(user=taken, specialization='Java')
+
+        _, err = self.migrate()
+
+        self.assertIn(f'пропущен student_{second.pk}', err)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.user, leftover)
+        self.assertIsNone(second.user)
+        self.assertEqual(User.objects.filter(username__startswith='student_').count(), 5)
+        self.assertEqual(Instructor.objects.get(user=taken).specialization, 'Java')
+
+
+class SeedDataTests(TestCase):
+    """seed_data: сгенерированные записи не превышают вместимость курсов."""
+
+    def test_popular_courses_are_capped_and_waitlisted(self):
+        call_command(
+            'seed_data', students=400, courses=8, processes=1, batch_size=100, stdout=io.StringIO(),
+        )
+
+        self.assertFalse(Course.objects.filter(active_enrollments_count__gt=F('max_students')).exists())
+        for course in Course.objects.all():
+            self.assertEqual(course.active_enrollments_count, course.enrollments.filter(status='ACTIVE').count())
+        # Лишние записи горячих курсов — в листе ожидания, без записи на тот же курс
+        self.assertTrue(Waitlist.objects.exists())
+        self.assertFalse(Waitlist.objects.filter(
+            student__enrollments__course=F('course'), student__enrollments__status='ACTIVE',
+        ).exists())
+        self.assertEqual(SiteStats.load().active_enrollments, Enrollment.objects.filter(status='ACTIVE').count())
+
+
+class PoolSizingTests(SimpleTestCase):
+    """Пул соединений каждого воркера gunicorn вместе не превышает max_connections PostgreSQL."""
+
+    defaults = {
+        'GUNICORN_PROFILE': 'sync', 'GUNICORN_THREADS': '', 'DB_RESERVED_CONNECTIONS': '',
+        'DB_POOL_MIN_SIZE': '', 'DB_POOL_MAX_SIZE': '',
+    }
+
+    def options(self, **env):
+        env = {**self.defaults, **{key: str(value) for key, value in env.items()}}
+        with mock.patch.dict(os.environ, env):
+            return pool_sizing.pool_options(background_threads=2)
+
+    def test_sync_worker_gets_connection_per_thread(self):
+        options = self.options(WEB_CONCURRENCY=5, GUNICORN_THREADS=4, DB_MAX_CONNECTIONS=100)
+        self.assertEqual((options['min_size'], options['max_size']), (1, 6))
+
+    def test_pool_is_capped_by_connection_budget(self):
+        options = self.options(
+            GUNICORN_PROFILE='asgi', WEB_CONCURRENCY=8, DB_MAX_CONNECTIONS=100, DB_RESERVED_CONNECTIONS=20,
+        )
+        self.assertEqual(options['max_size'], 10)
+        self.assertLessEqual(8 * options['max_size'] + 20, 100)
+
+    def test_too_many_workers_are_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.options(WEB_CONCURRENCY=50, DB_MAX_CONNECTIONS=40)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], SESSION_WRITE_BEHIND_INTERVAL=0)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Две БД SQLite: реплика — копия основной на момент sync_replica."""
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        make_course('stale-course')
+        call_command('sync_replica', 'replica', stdout=io.StringIO())
+        # Есть только в основной БД: реплика «отстает»
+        make_course('fresh-course')
+
+    def test_client_reads_replica_until_it_writes(self):
+        response = self.client.get(reverse('api_course_list'))
+        self.assertContains(response, 'stale-course')
+        self.assertNotContains(response, 'fresh-course')
+        self.assertNotIn(routers.pin_cookie(), response.cookies)
+
+        response = self.client.post(reverse('feedback'), {
+            'name': 'Иван Петров', 'email': 'ivan@example.com',
+            'subject': 'Вопрос', 'message': 'Сообщение длиной больше десяти символов',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(routers.pin_cookie(), response.cookies)
+
+        # После записи клиент читает из основной БД и видит актуальные данные
+        response = self.client.get(reverse('api_course_list'))
+        self.assertContains(response, 'fresh-course')
+
+        with mock.patch('fefu_lab.routers.time.time', return_value=routers.time.time() + 60):
+            response = self.client.get(reverse('api_course_list'))
+        self.assertNotContains(response, 'fresh-course')
+
+    def test_primary_views_and_code_outside_requests_use_primary(self):
+        self.assertEqual(Course.objects.all().db, 'default')
+
+        middleware = ReplicaRoutingMiddleware(lambda request: None)
+        request = RequestFactory().get(reverse('enrollment'))
+        state, token = routers.start_request(request)
+        try:
+            self.assertEqual(Course.objects.all().db, 'replica')
+            self.assertEqual(Course.objects.select_for_update().db, 'default')
+            middleware.process_view(request, views.enrollment_view, (), {})
+            self.assertEqual(Course.objects.all().db, 'default')
+        finally:
+            routers.finish_request(token)
+
+
+@override_settings(SESSION_WRITE_BEHIND_INTERVAL=60)
+class SessionWriteBehindTests(TestCase):
+    """Сессии в кэше с отложенной записью: сброс очереди, пропуск неизмененных, метки удаления."""
+
+    def setUp(self):
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+        self.queue = sessions.WriteBehindQueue()
+        # Сброс вызывается явно, без фонового потока
+        patches = [
+            mock.patch.object(sessions, 'write_behind', self.queue),
+            mock.patch.object(sessions.WriteBehindQueue, '_ensure_thread'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def create_session(self, **data):
+        store = sessions.SessionStore()
+        store.update(data)
+        store.save()
+        return store.session_key
+
+    def test_writes_reach_db_on_flush(self):
+        key = self.create_session(cart=1)
+        self.assertFalse(Session.objects.filter(pk=key).exists())
+        self.assertEqual(sessions.SessionStore(key)['cart'], 1)
+
+        store = sessions.SessionStore(key)
+        store['cart'] = 2
+        store.save()
+        # Два сохранения между сбросами — одна запись
+        self.assertEqual(self.queue.pending(), 1)
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(Session.objects.get(pk=key).get_decoded(), {'cart': 2})
+
+        # Промах кэша (рестарт) читает сессию из БД
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+        self.assertEqual(sessions.SessionStore(key)['cart'], 2)
+
+    def test_flush_thread_returns_connection_after_each_flush(self):
+        class Stop(Exception):
+            pass
+
+        with mock.patch.object(sessions.time, 'sleep', side_effect=[None, None, Stop]), \
+                mock.patch.object(self.queue, 'flush') as flush, \
+                mock.patch.object(sessions, 'close_old_connections') as release, \
+                mock.patch.object(sessions, 'connections'):
+            with self.assertRaises(Stop):
+                self.queue._run()
+        self.assertEqual((flush.call_count, release.call_count), (2, 2))
+
+    def test_unchanged_session_is_not_written(self):
+        key = self.create_session(cart=1)
+        self.queue.flush()
+
+        store = sessions.SessionStore(key)
+        store['cart'] = 1
+        store.save()
+        self.assertEqual(self.queue.pending(), 0)
+
+    def test_deleted_session_is_not_resurrected(self):
+        key = self.create_session(cart=1)
+        self.queue.flush()
+        # Другой процесс успел поставить сессию в свою очередь до выхода пользователя
+        stale = sessions.SessionStore(key)
+        stale['cart'] = 2
+        stale_instance = stale.create_model_instance(stale._get_session())
+
+        sessions.SessionStore(key).delete()
+        self.assertFalse(Session.objects.filter(pk=key).exists())
+
+        self.queue.put(stale_instance)
+        self.queue.flush()
+        self.assertFalse(Session.objects.filter(pk=key).exists())
+
+        # Строка, записанная в обход очереди, тоже не читается при промахе кэша
+        stale_instance.save()
+        self.assertEqual(dict(sessions.SessionStore(key).items()), {})
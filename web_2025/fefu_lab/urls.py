@@ -1,15 +1,20 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, async_views, views
+
+# Под ASGI публичные страницы отдают асинхронные версии (см. async_views.py)
+public = async_views if getattr(settings, 'ASYNC_PUBLIC_VIEWS', False) else views
 
 urlpatterns = [
     # Существующие маршруты
-    path('', views.home_page, name='home'),
+    path('', public.home_page, name='home'),
     path('about/', views.AboutPage.as_view(), name='about'),
     path('students/', views.StudentListView.as_view(), name='student_list'),
-    path('student/<int:pk>/', views.student_detail, name='student_detail'),
-    path('courses/', views.CourseListView.as_view(), name='course_list'),
-    path('course/<slug:slug>/', views.CourseDetailView.as_view(), name='course_detail'),
+    path('student/<int:pk>/', public.student_detail, name='student_detail'),
+    path('courses/', public.CourseListView.as_view(), name='course_list'),
+    path('courses/search/', views.course_search, name='course_search'),
+    path('course/<slug:slug>/', public.CourseDetailView.as_view(), name='course_detail'),
     path('feedback/', views.feedback_view, name='feedback'),
     path('enrollment/', views.enrollment_view, name='enrollment'),
     
@@ -24,6 +29,19 @@ urlpatterns = [
     path('dashboard/student/', views.student_dashboard, name='student_dashboard'),
     path('dashboard/teacher/', views.teacher_dashboard, name='teacher_dashboard'),
     path('dashboard/admin/', views.admin_dashboard, name='admin_dashboard'),
+    
+    # JSON API (только чтение)
+    path('api/courses/', api.resource_list, {'resource': 'courses'}, name='api_course_list'),
+    path('api/courses/<slug:key>/', api.resource_detail, {'resource': 'courses'}, name='api_course_detail'),
+    path('api/instructors/', api.resource_list, {'resource': 'instructors'}, name='api_instructor_list'),
+    path('api/instructors/<int:key>/', api.resource_detail, {'resource': 'instructors'}, name='api_instructor_detail'),
+    path('api/students/', api.resource_list, {'resource': 'students'}, name='api_student_list'),
+    path('api/students/<int:key>/', api.resource_detail, {'resource': 'students'}, name='api_student_detail'),
+    path('api/enrollments/', api.resource_list, {'resource': 'enrollments'}, name='api_enrollment_list'),
+    path('api/enrollments/<int:key>/', api.resource_detail, {'resource': 'enrollments'}, name='api_enrollment_detail'),
+    
+    # Выгрузки
+    path('export/<str:dataset>.<str:fmt>', views.export_view, name='export'),
 ]
 
 handler404 = 'fefu_lab.views.page_not_found'
@@ -1,49 +1,72 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.views import View
 from django.views.generic import ListView, DetailView
-from django.db.models import Count
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import never_cache
+from django.db.models import Count, Max, Prefetch
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.backends import ModelBackend
-from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib import messages
-from .models import Student, Course, Instructor, Enrollment, UserProfile
-from .forms import FeedbackForm, CustomUserCreationForm, LoginForm, ProfileUpdateForm, UserProfileUpdateForm, StudentProfileUpdateForm, EnrollmentForm
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from functools import wraps
+from .models import Student, Course, Instructor, Enrollment, UserProfile, SiteStats
+from .pagination import KeysetPaginationMixin
+from .search import search_courses
+from .dashboards import get_teacher_course_stats
+from .enrollments import enroll_student
+from .exports import DATASETS, FORMATS, stream_export
+from .conditional import conditional_page, latest
+from .middleware import get_user_role
+from .routers import use_primary
+from . import jobs, metrics
+from .forms import FeedbackForm, CustomUserCreationForm, LoginForm, ProfileUpdateForm, UserProfileUpdateForm, StudentProfileUpdateForm, EnrollmentForm, EnrollmentExportForm
+
+# Декораторы для проверки ролей: роль берется из сессии (см. middleware.get_user_role)
+def role_required(*roles, allow_staff=False, login_url='/login/'):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (allow_staff and request.user.is_staff) or get_user_role(request) in roles:
+                return view(request, *args, **kwargs)
+            return redirect_to_login(request.get_full_path(), login_url)
+        return wrapper
+    return decorator
 
-# Декораторы для проверки ролей
 def student_required(function=None):
-    actual_decorator = user_passes_test(
-        lambda u: hasattr(u, 'profile') and u.profile.role == 'STUDENT',
-        login_url='/login/'
-    )
+    actual_decorator = role_required('STUDENT')
     if function:
         return actual_decorator(function)
     return actual_decorator
 
 def teacher_required(function=None):
-    actual_decorator = user_passes_test(
-        lambda u: hasattr(u, 'profile') and u.profile.role == 'TEACHER',
-        login_url='/login/'
-    )
+    actual_decorator = role_required('TEACHER')
     if function:
         return actual_decorator(function)
     return actual_decorator
 
 def admin_required(function=None):
-    actual_decorator = user_passes_test(
-        lambda u: hasattr(u, 'profile') and u.profile.role == 'ADMIN',
-        login_url='/login/'
-    )
+    actual_decorator = role_required('ADMIN')
+    if function:
+        return actual_decorator(function)
+    return actual_decorator
+
+def staff_required(function=None):
+    actual_decorator = role_required('ADMIN', allow_staff=True)
     if function:
         return actual_decorator(function)
     return actual_decorator
 
 # ---------- Главная страница ----------
 def home_page(request):
-    total_students = Student.objects.filter(is_active=True).count()
-    total_courses = Course.objects.filter(is_active=True).count()
-    total_instructors = Instructor.objects.filter(is_active=True).count()
-    recent_courses = Course.objects.filter(is_active=True).order_by('-created_at')[:3]
+    stats = SiteStats.load()
+    total_students = stats.active_students
+    total_courses = stats.active_courses
+    total_instructors = stats.active_instructors
+    recent_courses = Course.objects.filter(is_active=True).select_related('instructor__user').order_by('-created_at')[:3]
     
     context = {
         'total_students': total_students,
@@ -64,15 +87,36 @@ class AboutPage(View):
         return render(request, 'fefu_lab/about.html')
 
 # ---------- Список студентов ----------
-class StudentListView(ListView):
+class StudentListView(KeysetPaginationMixin, ListView):
     model = Student
     template_name = 'fefu_lab/student_list.html'
     context_object_name = 'students'
+    paginate_by = 50
+    cursor_ordering = ('user__last_name', 'user__first_name')
+    # Тай-брейк из auth_user: страницу обслуживает индекс (last_name, first_name, id)
+    cursor_tiebreak = 'user__id'
     
     def get_queryset(self):
-        return Student.objects.filter(is_active=True).select_related('user')
+        # Студенты без пользователя не отображаются и не участвуют в сортировке по ключу
+        return Student.objects.filter(is_active=True, user__isnull=False).select_related('user')
 
 # ---------- Детальная страница студента ----------
+def student_detail_validator(request, pk):
+    row = (
+        Student.objects.filter(pk=pk)
+        .annotate(
+            enrollments_updated=Max('enrollments__updated_at'),
+            courses_updated=Max('enrollments__course__updated_at'),
+            enrollments_total=Count('enrollments'),
+        )
+        .values_list('updated_at', 'enrollments_updated', 'courses_updated', 'enrollments_total')
+        .first()
+    )
+    if row is None:
+        return None
+    return latest(*row[:3]), row[3]
+
+@conditional_page(student_detail_validator)
 def student_detail(request, pk):
     student = get_object_or_404(Student, pk=pk)
     enrollments = Enrollment.objects.filter(student=student).select_related('course')
@@ -84,15 +128,47 @@ def student_detail(request, pk):
     return render(request, 'fefu_lab/student_detail.html', context)
 
 # ---------- Список курсов ----------
-class CourseListView(ListView):
+class CourseListView(KeysetPaginationMixin, ListView):
     model = Course
     template_name = 'fefu_lab/course_list.html'
     context_object_name = 'courses'
+    paginate_by = 24
+    cursor_ordering = ('title',)
     
     def get_queryset(self):
-        return Course.objects.filter(is_active=True).select_related('instructor')
+        # Счетчик записей хранится в Course, поэтому карточке не нужны доп. запросы
+        return Course.objects.filter(is_active=True).select_related('instructor__user')
+
+# ---------- Поиск курсов ----------
+def course_search(request):
+    query = request.GET.get('q', '').strip()
+    courses = []
+    if query:
+        queryset = Course.objects.filter(is_active=True).select_related('instructor__user')
+        courses = search_courses(queryset, query)
+    
+    return render(request, 'fefu_lab/course_search.html', {
+        'query': query,
+        'courses': courses,
+    })
 
 # ---------- Детальная страница курса ----------
+def course_detail_validator(request, slug):
+    row = (
+        Course.objects.filter(slug=slug)
+        .annotate(
+            enrollments_updated=Max('enrollments__updated_at'),
+            students_updated=Max('enrollments__student__updated_at'),
+            enrollments_total=Count('enrollments'),
+        )
+        .values_list('updated_at', 'instructor__updated_at', 'enrollments_updated', 'students_updated', 'enrollments_total')
+        .first()
+    )
+    if row is None:
+        return None
+    return latest(*row[:4]), row[4]
+
+@method_decorator(conditional_page(course_detail_validator), name='dispatch')
 class CourseDetailView(DetailView):
     model = Course
     template_name = 'fefu_lab/course_detail.html'
@@ -100,10 +176,18 @@ class CourseDetailView(DetailView):
     slug_field = 'slug'
     slug_url_kwarg = 'slug'
     
+    def get_queryset(self):
+        # Курс с преподавателем одним запросом, список студентов вместе с User вторым:
+        # число запросов не зависит от числа записей
+        return Course.objects.select_related('instructor__user').prefetch_related(
+            Prefetch('enrollments', queryset=Enrollment.objects.select_related('student__user'))
+        )
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        course = self.get_object()
-        context['enrollments'] = course.enrollments.select_related('student')
+        course = self.object
+        context['enrollments'] = course.enrollments.all()
+        # Счетчик активных записей хранится в курсе (active_enrollments_count), без COUNT
         context['available_slots'] = course.max_students - course.enrolled_students_count
         return context
 
@@ -112,6 +196,8 @@ def feedback_view(request):
     if request.method == 'POST':
         form = FeedbackForm(request.POST)
         if form.is_valid():
+            # Сохранение и письмо администраторам — в фоновой задаче
+            jobs.enqueue('save_feedback', **form.cleaned_data)
             return render(request, 'fefu_lab/success.html', {
                 'message': 'Спасибо за ваше сообщение! Мы свяжемся с вами в ближайшее время.',
                 'title': 'Обратная связь'
@@ -125,6 +211,7 @@ def feedback_view(request):
     })
 
 # ---------- Регистрация ----------
+@use_primary
 def register_view(request):
     if request.user.is_authenticated:
         return redirect('profile')
@@ -134,8 +221,8 @@ def register_view(request):
         if form.is_valid():
             user = form.save()
             
-            # Явно указываем бэкенд для логина
-            user.backend = 'django.contrib.auth.backends.ModelBackend'
+            # Явно указываем бэкенд для логина: его get_user загружает профиль тем же запросом
+            user.backend = 'fefu_lab.backends.EmailBackend'
             login(request, user)
             
             messages.success(request, f'Аккаунт создан для {user.get_full_name()}!')
@@ -161,8 +248,7 @@ def login_view(request):
             user = authenticate(request, username=username, password=password)
             
             if user is not None:
-                # Явно указываем бэкенд
-                user.backend = 'django.contrib.auth.backends.ModelBackend'
+                # authenticate() уже записал в user.backend путь EmailBackend
                 login(request, user)
                 messages.success(request, f'Добро пожаловать, {user.get_full_name()}!')
                 next_url = request.GET.get('next', 'profile')
@@ -188,17 +274,20 @@ def profile_view(request):
     }
     
     # Добавляем данные в зависимости от роли
-    if hasattr(user, 'profile'):
-        if user.profile.role == 'STUDENT' and hasattr(user, 'student_profile'):
+    # profile, student_profile и instructor_profile уже загружены вместе с пользователем
+    role = get_user_role(request)
+    if role is not None:
+        if role == 'STUDENT' and hasattr(user, 'student_profile'):
             context['student'] = user.student_profile
-            context['enrollments'] = Enrollment.objects.filter(student=user.student_profile)
-        elif user.profile.role == 'TEACHER' and hasattr(user, 'instructor_profile'):
+            context['enrollments'] = Enrollment.objects.filter(student=user.student_profile).select_related('course')
+        elif role == 'TEACHER' and hasattr(user, 'instructor_profile'):
             context['instructor'] = user.instructor_profile
             context['courses'] = Course.objects.filter(instructor=user.instructor_profile)
     
     return render(request, 'fefu_lab/registration/profile.html', context)
 
 # ---------- Редактирование профиля ----------
+@use_primary
 @login_required
 def profile_edit_view(request):
     user = request.user
@@ -238,20 +327,27 @@ def profile_edit_view(request):
     return render(request, 'fefu_lab/registration/profile_edit.html', context)
 
 # ---------- Запись на курс ----------
+@use_primary
 @login_required
 @student_required
 def enrollment_view(request):
     if request.method == 'POST':
         form = EnrollmentForm(request.POST)
         if form.is_valid():
-            enrollment = form.save(commit=False)
-            # Устанавливаем текущего студента
-            enrollment.student = request.user.student_profile
-            enrollment.save()
-            return render(request, 'fefu_lab/success.html', {
-                'message': f'Вы успешно записаны на курс "{enrollment.course.title}"!',
-                'title': 'Запись на курс'
-            })
+            course = form.cleaned_data['course']
+            try:
+                _, waitlisted = enroll_student(request.user.student_profile, course)
+            except ValidationError as e:
+                form.add_error('course', e)
+            else:
+                if waitlisted:
+                    message = f'Мест на курсе "{course.title}" нет. Вы добавлены в лист ожидания.'
+                else:
+                    message = f'Вы успешно записаны на курс "{course.title}"!'
+                return render(request, 'fefu_lab/success.html', {
+                    'message': message,
+                    'title': 'Запись на курс'
+                })
     else:
         form = EnrollmentForm()
     
@@ -264,30 +360,30 @@ def enrollment_view(request):
 @login_required
 @student_required
 def student_dashboard(request):
-    student = get_object_or_404(Student, user=request.user)
-    enrollments = Enrollment.objects.filter(student=student).select_related('course')
+    student = getattr(request.user, 'student_profile', None)
+    if student is None:
+        raise Http404('Профиль студента не найден')
+    enrollments = list(
+        Enrollment.objects.filter(student=student).select_related('course__instructor__user')
+    )
+    grades = [e.grade for e in enrollments if e.grade is not None]
     
     context = {
         'student': student,
         'enrollments': enrollments,
+        'average_grade': sum(grades) / len(grades) if grades else None,
     }
     return render(request, 'fefu_lab/dashboard/student_dashboard.html', context)
 
 @login_required
 @teacher_required
 def teacher_dashboard(request):
-    instructor = get_object_or_404(Instructor, user=request.user)
-    courses = Course.objects.filter(instructor=instructor)
+    instructor = getattr(request.user, 'instructor_profile', None)
+    if instructor is None:
+        raise Http404('Профиль преподавателя не найден')
     
-    # Статистика по курсам
-    course_stats = []
-    for course in courses:
-        enrollments_count = Enrollment.objects.filter(course=course, status='ACTIVE').count()
-        course_stats.append({
-            'course': course,
-            'enrollments_count': enrollments_count,
-            'available_slots': course.max_students - enrollments_count,
-        })
+    # Статистика по курсам: один агрегирующий запрос (или кэш)
+    course_stats = get_teacher_course_stats(instructor.pk)
     
     context = {
         'instructor': instructor,
@@ -299,10 +395,11 @@ def teacher_dashboard(request):
 @admin_required
 def admin_dashboard(request):
     # Статистика для администратора
-    total_students = Student.objects.filter(is_active=True).count()
-    total_teachers = Instructor.objects.filter(is_active=True).count()
-    total_courses = Course.objects.filter(is_active=True).count()
-    total_enrollments = Enrollment.objects.filter(status='ACTIVE').count()
+    stats = SiteStats.load()
+    total_students = stats.active_students
+    total_teachers = stats.active_instructors
+    total_courses = stats.active_courses
+    total_enrollments = stats.active_enrollments
     
     context = {
         'total_students': total_students,
@@ -312,6 +409,34 @@ def admin_dashboard(request):
     }
     return render(request, 'fefu_lab/dashboard/admin_dashboard.html', context)
 
+# ---------- Выгрузка данных ----------
+@login_required
+@staff_required
+def export_view(request, dataset, fmt):
+    if dataset not in DATASETS or fmt not in FORMATS:
+        raise Http404('Неизвестная выгрузка')
+    
+    form = EnrollmentExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    
+    response = StreamingHttpResponse(
+        stream_export(dataset, fmt, **form.cleaned_data),
+        content_type=FORMATS[fmt],
+    )
+    filename = f'{dataset}-{timezone.localdate():%Y%m%d}.{fmt}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # nginx не должен буферизовать выгрузку целиком
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# ---------- Метрики Prometheus ----------
+@never_cache
+def metrics_view(request):
+    # Суммы по всем воркерам: ответ не зависит от того, какой процесс принял запрос
+    values, workers = metrics.collect()
+    return HttpResponse(metrics.exposition(values, workers), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # ---------- Обработчик 404 ----------
 def page_not_found(request, exception):
     return render(request, 'fefu_lab/404.html', status=404)
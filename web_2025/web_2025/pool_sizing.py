@@ -0,0 +1,74 @@
+"""
+Число процессов gunicorn и размер пула соединений с PostgreSQL.
+
+Используется и конфигурациями gunicorn (deploy/gunicorn/config*.py), и
+settings_production, поэтому число воркеров задается в одном месте. У
+каждого процесса gunicorn свой пул (psycopg_pool), так что всего к
+PostgreSQL может быть открыто workers * max_size соединений плюс
+DB_RESERVED_CONNECTIONS на воркеры задач (run_workers), миграции, psql и
+superuser_reserved_connections. max_size выбирается так, чтобы эта сумма
+не превышала DB_MAX_CONNECTIONS (max_connections в postgresql.conf).
+"""
+import multiprocessing
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+# Под ASGI запросы одного процесса выполняют ORM в отдельных потоках
+# одновременно; больше соединений в пуле процесса обычно не нужно
+ASGI_POOL_MAX_SIZE = 20
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def gunicorn_profile():
+    """sync — deploy/gunicorn/config.py, asgi — config_asgi.py (задается в raw_env)."""
+    return os.getenv('GUNICORN_PROFILE', 'sync')
+
+
+def gunicorn_workers(profile=None):
+    """WEB_CONCURRENCY — та же переменная, которую gunicorn читает по умолчанию."""
+    profile = profile or gunicorn_profile()
+    cpus = multiprocessing.cpu_count()
+    return _env_int('WEB_CONCURRENCY', cpus if profile == 'asgi' else cpus * 2 + 1)
+
+
+def gunicorn_threads():
+    return _env_int('GUNICORN_THREADS', 1)
+
+
+def pool_options(profile=None, background_threads=0):
+    """
+    OPTIONS['pool'] для django.db.backends.postgresql.
+    background_threads — потоки процесса, работающие с БД вне запросов
+    (миниатюры аватаров, запись сессий).
+    """
+    profile = profile or gunicorn_profile()
+    workers = gunicorn_workers(profile)
+    max_connections = _env_int('DB_MAX_CONNECTIONS', 100)
+    reserved = _env_int('DB_RESERVED_CONNECTIONS', 10)
+    budget = (max_connections - reserved) // workers
+    if budget < 1:
+        raise ImproperlyConfigured(
+            f'{workers} воркеров gunicorn не помещаются в DB_MAX_CONNECTIONS={max_connections} '
+            f'при DB_RESERVED_CONNECTIONS={reserved}'
+        )
+
+    if profile == 'asgi':
+        needed = ASGI_POOL_MAX_SIZE
+    else:
+        # Синхронный воркер держит соединение на поток обработки запросов
+        needed = gunicorn_threads() + background_threads
+    max_size = min(_env_int('DB_POOL_MAX_SIZE', needed), budget)
+    return {
+        'min_size': min(_env_int('DB_POOL_MIN_SIZE', 1), max_size),
+        'max_size': max_size,
+        # Сколько запрос ждет свободное соединение, прежде чем получить ошибку
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        'max_idle': 300,
+        'max_lifetime': 1800,
+        'name': f'fefu_lab_{profile}',
+    }
@@ -40,11 +40,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'fefu_lab.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'fefu_lab.middleware.SQLInstrumentationMiddleware',
+    'fefu_lab.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'fefu_lab.middleware.UserContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -76,9 +80,35 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': {
+            # Параллельные записи ждут блокировку до 20 с, а не падают с "database is locked"
+            'timeout': 20,
+        },
+        # Файловая тестовая БД, чтобы потоки в тестах конкурентности работали с отдельными соединениями
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    },
+    # Реплика для чтения (fefu_lab/routers.py). Локально это копия db.sqlite3,
+    # которую обновляет python manage.py sync_replica; чтобы читать с нее,
+    # добавьте 'replica' в DATABASE_REPLICAS
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'OPTIONS': {
+            'timeout': 20,
+        },
+    },
 }
 
+# Запись — в 'default', чтения читающих запросов — с DATABASE_REPLICAS.
+# После записи клиент REPLICA_PIN_SECONDS секунд читает из основной БД
+# (cookie REPLICA_PIN_COOKIE), чтобы видеть свои изменения несмотря на отставание реплики
+DATABASE_ROUTERS = ['fefu_lab.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_COOKIE = 'fefu_primary'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -132,7 +162,31 @@ SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 SESSION_COOKIE_SECURE = False  # True для HTTPS в продакшене
 CSRF_COOKIE_SECURE = False     # True для HTTPS в продакшене
 
+# Сессии в кэше с записью в БД (fefu_lab/sessions.py). В разработке и тестах
+# пишем синхронно: фоновый поток мешал бы транзакциям тестов на SQLite
+SESSION_ENGINE = 'fefu_lab.sessions'
+SESSION_WRITE_BEHIND_INTERVAL = 0
+
+# Метрики Prometheus (/metrics, fefu_lab/metrics.py). Без METRICS_DIR файлы метрик
+# пишутся во временный каталог процесса — этого достаточно для runserver
+METRICS_ENABLED = True
+METRICS_DIR = None
+
+# Асинхронные версии публичных страниц (fefu_lab/async_views.py) для запуска
+# под ASGI: gunicorn -c deploy/gunicorn/config_asgi.py web_2025.asgi:application
+ASYNC_PUBLIC_VIEWS = False
+
+# Учет SQL и заголовок Server-Timing (fefu_lab/middleware.py).
+# SQL_INSTRUMENTATION = True включает его для всех запросов, иначе — только для
+# запросов с заголовком X-SQL-Debug: <токен из manage.py sql_debug_token>
+SQL_INSTRUMENTATION = False
+SQL_INSTRUMENTATION_HEADER = 'X-SQL-Debug'
+SQL_INSTRUMENTATION_SLOW_MS = 500
+SQL_INSTRUMENTATION_REPEAT_THRESHOLD = 5
+
 # Бэкенды аутентификации
+# EmailBackend сам обрабатывает вход по имени пользователя и останавливает цепочку
+# при неудаче; ModelBackend остается для get_user() сессий, созданных до этого
 AUTHENTICATION_BACKENDS = [
     'fefu_lab.backends.EmailBackend',
     'django.contrib.auth.backends.ModelBackend',
@@ -141,3 +195,19 @@ AUTHENTICATION_BACKENDS = [
 # Для загрузки файлов
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Фоновые задачи (fefu_lab/jobs.py, manage.py run_workers): повтор через
+# JOB_RETRY_BASE_DELAY * 2^(попытка-1) секунд, не больше JOB_RETRY_MAX_DELAY
+JOB_RETRY_BASE_DELAY = 10
+JOB_RETRY_MAX_DELAY = 3600
+JOB_LEASE_TIMEOUT = 600
+JOB_RETENTION_DAYS = 7
+
+# Письма воркера в разработке выводятся в консоль run_workers
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'FEFU Lab <noreply@fefu.ru>'
+
+# Миниатюры аватаров (fefu_lab/avatars.py). AVATAR_WORKERS = 0 — обработка сразу
+# после коммита в потоке запроса; в продакшене — в пуле фоновых потоков
+AVATAR_WORKERS = 0
+AVATAR_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
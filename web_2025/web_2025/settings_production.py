@@ -7,6 +7,8 @@ from pathlib import Path
 from django.core.management.utils import get_random_secret_key
 import dj_database_url
 
+from .pool_sizing import pool_options
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -33,10 +35,14 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'fefu_lab.middleware.MetricsMiddleware',
+    'fefu_lab.middleware.SQLInstrumentationMiddleware',
+    'fefu_lab.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'fefu_lab.middleware.UserContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -66,7 +72,7 @@ WSGI_APPLICATION = 'web_2025.wsgi.application'
 DATABASE_URL = os.getenv('DATABASE_URL')
 if DATABASE_URL:
     DATABASES = {
-        'default': dj_database_url.parse(DATABASE_URL, conn_max_age=600)
+        'default': dj_database_url.parse(DATABASE_URL)
     }
 else:
     DATABASES = {
@@ -80,6 +86,40 @@ else:
         }
     }
 
+# Реплики для чтения (потоковая репликация PostgreSQL): DATABASE_REPLICA_URLS —
+# URL через запятую. Читающие запросы идут на реплики (fefu_lab/routers.py),
+# запись и чтения после записи — в основную БД
+DATABASE_REPLICAS = []
+for index, url in enumerate(filter(None, os.getenv('DATABASE_REPLICA_URLS', '').split(',')), start=1):
+    alias = f'replica{index}'
+    DATABASES[alias] = dj_database_url.parse(url.strip())
+    # Тестовая БД реплики — та же, что у основной
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['fefu_lab.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5'))
+REPLICA_PIN_COOKIE = 'fefu_primary'
+
+# Миниатюры аватаров строятся в фоновых потоках воркера, не задерживая ответ;
+# эти потоки тоже берут соединения из пула
+AVATAR_WORKERS = int(os.getenv('AVATAR_WORKERS', '2'))
+
+# Пул соединений psycopg (Django 5.1+, пакет psycopg[pool]) в каждом процессе
+# gunicorn; размер считается по числу воркеров (web_2025/pool_sizing.py), чтобы
+# все процессы вместе не превысили max_connections PostgreSQL; у каждой реплики
+# свой пул того же размера. Соединение проверяется перед выдачей из пула.
+# DB_POOL=0 — без пула, с постоянными соединениями (например, за PgBouncer
+# в режиме transaction)
+DB_POOL = os.getenv('DB_POOL', '1') == '1'
+for database in DATABASES.values():
+    database['CONN_HEALTH_CHECKS'] = True
+    if DB_POOL:
+        database['CONN_MAX_AGE'] = 0
+        # Плюс поток отложенной записи сессий (fefu_lab/sessions.py)
+        database.setdefault('OPTIONS', {})['pool'] = pool_options(background_threads=AVATAR_WORKERS + 1)
+    else:
+        database['CONN_MAX_AGE'] = 600
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',},
@@ -88,6 +128,12 @@ AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',},
 ]
 
+# Бэкенды аутентификации (как в settings.py)
+AUTHENTICATION_BACKENDS = [
+    'fefu_lab.backends.EmailBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 # Internationalization
 LANGUAGE_CODE = 'ru-ru'
 TIME_ZONE = 'Europe/Moscow'  # можно сменить на 'Europe/Berlin' при необходимости
@@ -106,6 +152,25 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Фоновые задачи: отдельный сервис `python manage.py run_workers`
+JOB_RETRY_BASE_DELAY = int(os.getenv('JOB_RETRY_BASE_DELAY', '10'))
+JOB_RETRY_MAX_DELAY = int(os.getenv('JOB_RETRY_MAX_DELAY', '3600'))
+JOB_LEASE_TIMEOUT = int(os.getenv('JOB_LEASE_TIMEOUT', '600'))
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', '7'))
+
+# Почту отправляют только воркеры задач
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', '0') == '1'
+EMAIL_TIMEOUT = 30
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'FEFU Lab <noreply@fefu.ru>')
+SERVER_EMAIL = DEFAULT_FROM_EMAIL
+ADMINS = [('FEFU Lab', email) for email in os.getenv('ADMIN_EMAILS', '').split(',') if email]
+
+AVATAR_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+
 # WhiteNoise configuration (оставляем — не мешает, но nginx отдаёт статику)
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
@@ -116,6 +181,43 @@ X_FRAME_OPTIONS = 'DENY'
 # В локальной dev-среде, если вы используете plain HTTP, можно временно поставить False:
 CSRF_COOKIE_SECURE = True
 SESSION_COOKIE_SECURE = True
+
+# Кэши общие для всех воркеров gunicorn, run_workers и хостов (Redis).
+# default — статистика кабинета преподавателя (fefu_lab/dashboards.py): сброс
+# из любого процесса (сигналы, import_enrollments) должен быть виден всем.
+# sessions — сессии + отложенная пакетная запись в Postgres (fefu_lab/sessions.py).
+# Файловый кэш не подходит: каждая запись в FileBasedCache просматривает весь
+# каталог (_cull), а каталог не общий между хостами
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', 'redis://redis:6379/0'),
+        'KEY_PREFIX': 'fefu_lab',
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('SESSION_CACHE_URL', 'redis://redis:6379/1'),
+        'KEY_PREFIX': 'fefu_lab',
+    },
+}
+SESSION_ENGINE = 'fefu_lab.sessions'
+SESSION_CACHE_ALIAS = 'sessions'
+SESSION_WRITE_BEHIND_INTERVAL = float(os.getenv('SESSION_WRITE_BEHIND_INTERVAL', '2'))
+
+# Метрики Prometheus: общий для мастера и воркеров gunicorn каталог файлов метрик.
+# Мастер очищает его при старте и переносит туда счетчики завершившихся воркеров
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_DIR = os.getenv('METRICS_DIR', '/tmp/fefu_lab_metrics')
+
+# Асинхронные версии публичных страниц (fefu_lab/async_views.py) для запуска
+# под ASGI: gunicorn -c deploy/gunicorn/config_asgi.py web_2025.asgi:application
+ASYNC_PUBLIC_VIEWS = os.getenv('ASYNC_PUBLIC_VIEWS', '0') == '1'
+
+# Учет SQL и Server-Timing: по умолчанию только для запросов с подписанным заголовком
+SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', '0') == '1'
+SQL_INSTRUMENTATION_HEADER = 'X-SQL-Debug'
+SQL_INSTRUMENTATION_SLOW_MS = int(os.getenv('SQL_INSTRUMENTATION_SLOW_MS', '500'))
+SQL_INSTRUMENTATION_REPEAT_THRESHOLD = 5
 SECURE_SSL_REDIRECT = False  # Set to True if using HTTPS
 
 # Logging — пишем в stdout (Docker-friendly)
@@ -135,5 +237,17 @@ LOGGING = {
             "level": "ERROR",
             "propagate": True,
         },
+        # Повторы и ошибки фоновых задач
+        "fefu_lab.jobs": {
+            "handlers": ["console"],
+            "level": "WARNING",
+            "propagate": False,
+        },
+        # Одна JSON-строка на медленный запрос (SQLInstrumentationMiddleware)
+        "fefu_lab.sql": {
+            "handlers": ["console"],
+            "level": "WARNING",
+            "propagate": False,
+        },
     },
 }
@@ -5,6 +5,7 @@ URL configuration for web_2025 project.
 from django.contrib import admin
 from django.urls import path, include
 from django.http import HttpResponse
+from fefu_lab.views import metrics_view
 
 
 def healthz(request):
@@ -13,6 +14,7 @@ def healthz(request):
 
 urlpatterns = [
     path('healthz', healthz),           # ← ВАЖНО: healthcheck
+    path('metrics', metrics_view),      # Prometheus; снаружи закрыт в nginx
     path('admin/', admin.site.urls),
     path('', include('fefu_lab.urls')),
 ]